@@ -0,0 +1,335 @@
+"""
+Offline benchmark for indexing, retrieval and the agent loop.
+
+Usage: python agent_benchmark.py --files 200 --functions 10 --iterations 50
+Embeddings, the LLM and web search are replaced by deterministic stubs; the
+LLM replays a transcript of replies (--transcript, or a synthetic one that
+can be saved with --save-transcript). Results are printed as JSON.
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+import zlib
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+from langchain.agents import Tool
+from langchain.chat_models.base import BaseChatModel
+from langchain.docstore import InMemoryDocstore
+from langchain.embeddings.base import Embeddings
+from langchain.schema import AIMessage, ChatGeneration, ChatResult
+from langchain.vectorstores import FAISS
+
+import globals
+from agent_tools import (
+    FindSymbolTool,
+    ListFilesAndDirectoriesTool,
+    SearchCodeTool,
+    ViewCodeFilesTool,
+)
+from agent_utils import CustomAutoGPT
+from ann_benchmark import percentile_ms
+from ann_utils import create_index
+from embedding_utils import estimate_tokens
+from index_utils import (
+    EMBEDDING_SIZE,
+    load_or_build_vectorstore,
+    load_symbol_index,
+    load_trigram_index,
+)
+from memory_utils import MEMORY_INDEX_CONFIG, SUMMARY_PROMPT
+from retrieval_utils import HybridRetriever, tokenize
+from trace_utils import tracer
+
+SUMMARY_MARKER = SUMMARY_PROMPT.split("{")[0][:40]
+
+
+class HashEmbeddings(Embeddings):
+    """Deterministic bag-of-terms embeddings hashed into a fixed dimension."""
+
+    def __init__(self, dimension: int = EMBEDDING_SIZE):
+        self.dimension = dimension
+
+    def embed_query(self, text: str) -> List[float]:
+        vector = np.zeros(self.dimension, dtype=np.float32)
+        for term in tokenize(text):
+            vector[zlib.crc32(term.encode("utf-8")) % self.dimension] += 1.0
+        norm = np.linalg.norm(vector)
+        return (vector / norm if norm else vector).tolist()
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return [self.embed_query(text) for text in texts]
+
+
+class ReplayChatModel(BaseChatModel):
+    """Chat model stub that answers with recorded replies in order."""
+
+    replies: List[str]
+    position: int = 0
+    summary: str = "Surveyed the synthetic repository."
+
+    @property
+    def _llm_type(self) -> str:
+        return "replay"
+
+    def get_num_tokens(self, text: str) -> int:
+        return estimate_tokens(text)
+
+    def _generate(self, messages, stop=None, run_manager=None) -> ChatResult:
+        if messages[-1].content.startswith(SUMMARY_MARKER):
+            # Memory rollups do not consume transcript replies
+            reply = self.summary
+        elif self.position < len(self.replies):
+            reply = self.replies[self.position]
+            self.position += 1
+        else:
+            reply = command_reply("finish", {"response": "Transcript exhausted."})
+        return ChatResult(
+            generations=[ChatGeneration(message=AIMessage(content=reply))]
+        )
+
+    async def _agenerate(self, messages, stop=None, run_manager=None) -> ChatResult:
+        return self._generate(messages, stop)
+
+
+def command_reply(name: str, args: Dict) -> str:
+    return json.dumps(
+        {
+            "thoughts": {
+                "text": f"Running {name}.",
+                "reasoning": "Benchmark transcript.",
+                "plan": "- survey the repository",
+                "criticism": "",
+                "speak": "",
+            },
+            "command": {"name": name, "args": args},
+        }
+    )
+
+
+def write_synthetic_repository(root: str, files: int, functions: int, seed: int):
+    """Write a package of Python modules and return the function names."""
+    rng = random.Random(seed)
+    names = []
+    for file_number in range(files):
+        package = os.path.join(root, f"package_{file_number % 10}")
+        os.makedirs(package, exist_ok=True)
+        lines = [f'"""Synthetic module {file_number}."""', "import os", ""]
+        for function_number in range(functions):
+            name = f"compute_{file_number}_{function_number}"
+            names.append(name)
+            body = [
+                f"    value = {rng.randint(0, 1000)}",
+                "    for item in range(count):",
+                f"        value = (value * {rng.randint(2, 9)} + item) % 1009",
+                "    return value",
+            ]
+            lines += [f"def {name}(count):", *body, "", ""]
+        lines += [
+            f"class Service{file_number}:",
+            "    def run(self):",
+            f"        return compute_{file_number}_0(3)",
+            "",
+        ]
+        with open(os.path.join(package, f"module_{file_number}.py"), "w") as file:
+            file.write("\n".join(lines))
+    return names
+
+
+def synthetic_transcript(
+    root: str, names: List[str], iterations: int, seed: int
+) -> Dict:
+    rng = random.Random(seed)
+    replies = []
+    queries = {}
+    for iteration in range(iterations):
+        step = iteration % 4
+        if step == 0:
+            package = os.path.join(root, f"package_{rng.randrange(10)}")
+            replies.append(command_reply("ListFilesAndDirectories", {"path": package}))
+        elif step == 1:
+            name = rng.choice(names)
+            replies.append(command_reply("FindSymbol", {"query": name}))
+        elif step == 2:
+            file_number = int(rng.choice(names).split("_")[1])
+            path = os.path.join(
+                root, f"package_{file_number % 10}", f"module_{file_number}.py"
+            )
+            replies.append(command_reply("ViewCodeFiles", {"file_path": path}))
+        else:
+            query = f"best practices for {rng.choice(names)}"
+            queries[query] = f"Recorded search results for '{query}'."
+            replies.append(command_reply("Search", {"tool_input": query}))
+    replies.append(command_reply("finish", {"response": "Done."}))
+    return {"replies": replies, "search": queries}
+
+
+def replay_search(recorded: Dict[str, str]):
+    def search(query: str) -> str:
+        return recorded.get(query, "No recorded results.")
+
+    return search
+
+
+def benchmark_indexing(
+    root: str, index_dir: str, embeddings: Embeddings
+) -> Tuple[Dict, FAISS]:
+    file_count = sum(len(files) for _, _, files in os.walk(root))
+    start = time.perf_counter()
+    vectorstore = load_or_build_vectorstore(
+        root, index_dir=index_dir, embeddings=embeddings
+    )
+    cold_seconds = time.perf_counter() - start
+    chunks = len(vectorstore.docstore._dict)
+
+    start = time.perf_counter()
+    load_or_build_vectorstore(root, index_dir=index_dir, embeddings=embeddings)
+    warm_seconds = time.perf_counter() - start
+    return {
+        "files": file_count,
+        "chunks": chunks,
+        "cold_seconds": round(cold_seconds, 3),
+        "files_per_second": round(file_count / cold_seconds, 1),
+        "chunks_per_second": round(chunks / cold_seconds, 1),
+        "warm_seconds": round(warm_seconds, 3),
+    }, vectorstore
+
+
+def benchmark_retrieval(
+    vectorstore: FAISS, names: List[str], queries: int, seed: int
+) -> Dict:
+    rng = random.Random(seed)
+    retriever = HybridRetriever(vectorstore)
+    symbol_tool = FindSymbolTool()
+    search_tool = SearchCodeTool()
+    hybrid_latencies = []
+    symbol_latencies = []
+    search_latencies = []
+    for _ in range(queries):
+        name = rng.choice(names)
+        start = time.perf_counter()
+        retriever.get_relevant_documents(f"where is {name} computed")
+        hybrid_latencies.append(time.perf_counter() - start)
+        start = time.perf_counter()
+        symbol_tool.run(name)
+        symbol_latencies.append(time.perf_counter() - start)
+        start = time.perf_counter()
+        search_tool.run(f"regex:def {name}\\(")
+        search_latencies.append(time.perf_counter() - start)
+    return {
+        "queries": queries,
+        "hybrid_p50_ms": percentile_ms(hybrid_latencies, 50),
+        "hybrid_p95_ms": percentile_ms(hybrid_latencies, 95),
+        "hybrid_p99_ms": percentile_ms(hybrid_latencies, 99),
+        "symbol_p50_ms": percentile_ms(symbol_latencies, 50),
+        "symbol_p99_ms": percentile_ms(symbol_latencies, 99),
+        "search_p50_ms": percentile_ms(search_latencies, 50),
+        "search_p99_ms": percentile_ms(search_latencies, 99),
+    }
+
+
+def benchmark_agent(root: str, transcript: Dict, embeddings: Embeddings) -> Dict:
+    index = create_index(embeddings.dimension, MEMORY_INDEX_CONFIG)
+    memory = FAISS(embeddings.embed_query, index, InMemoryDocstore({}), {})
+    tools = [
+        ListFilesAndDirectoriesTool(),
+        ViewCodeFilesTool(),
+        FindSymbolTool(),
+        Tool(
+            name="Search",
+            func=replay_search(transcript.get("search", {})),
+            description="Useful for answering questions about current events.",
+        ),
+    ]
+    llm = ReplayChatModel(replies=transcript["replies"])
+    agent = CustomAutoGPT.from_llm_and_tools_custom(
+        prefix="",
+        suffix=f"\nCurrent Project Directory: {root}",
+        ai_name="BenchmarkAgent",
+        ai_role="A software development assistant",
+        memory=memory.as_retriever(),
+        tools=tools,
+        llm=llm,
+    )
+    start = time.perf_counter()
+    agent.run(["Survey the repository."])
+    total_seconds = time.perf_counter() - start
+
+    timings = agent.turn_timings
+    prompt_tokens = [timing.prompt_tokens for timing in timings]
+    overhead = [timing.prompt_seconds + timing.llm_seconds for timing in timings]
+    return {
+        "iterations": len(timings),
+        "total_seconds": round(total_seconds, 3),
+        "overhead_p50_ms": percentile_ms(overhead, 50),
+        "overhead_p95_ms": percentile_ms(overhead, 95),
+        "prompt_build_p50_ms": percentile_ms([t.prompt_seconds for t in timings], 50),
+        "tool_p50_ms": percentile_ms([t.tool_seconds for t in timings], 50),
+        "tool_p95_ms": percentile_ms([t.tool_seconds for t in timings], 95),
+        "prompt_tokens_first": prompt_tokens[0],
+        "prompt_tokens_max": max(prompt_tokens),
+        "prompt_tokens_last": prompt_tokens[-1],
+        "memories": len(memory.docstore._dict),
+    }
+
+
+def run_benchmark(args, transcript: Optional[Dict] = None) -> Dict:
+    embeddings = HashEmbeddings()
+    with tempfile.TemporaryDirectory() as root, tempfile.TemporaryDirectory() as index_dir:
+        names = write_synthetic_repository(root, args.files, args.functions, args.seed)
+        if transcript is None:
+            transcript = synthetic_transcript(root, names, args.iterations, args.seed)
+        if args.save_transcript:
+            with open(args.save_transcript, "w") as transcript_file:
+                json.dump(transcript, transcript_file, indent=2)
+
+        globals.initialize()
+        globals.project_repository = root
+        # Progress output would interleave with the JSON results
+        with contextlib.redirect_stdout(io.StringIO()):
+            indexing, vectorstore = benchmark_indexing(root, index_dir, embeddings)
+            globals.symbol_index = load_symbol_index(index_dir)
+            globals.trigram_index = load_trigram_index(index_dir)
+            retrieval = benchmark_retrieval(vectorstore, names, args.queries, args.seed)
+            agent = benchmark_agent(root, transcript, embeddings)
+    return {
+        "indexing": indexing,
+        "retrieval": retrieval,
+        "agent": agent,
+        "trace": tracer.summary(),
+    }
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().split("\n")[0])
+    parser.add_argument("--files", type=int, default=200)
+    parser.add_argument("--functions", type=int, default=10)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--iterations", type=int, default=50)
+    parser.add_argument(
+        "--transcript", help="JSON file with replies and search results"
+    )
+    parser.add_argument("--save-transcript", help="Write the transcript used here")
+    parser.add_argument("--seed", type=int, default=0)
+    return parser.parse_args(argv)
+
+
+def main():
+    args = parse_args()
+    transcript = None
+    if args.transcript:
+        with open(args.transcript, "r") as transcript_file:
+            transcript = json.load(transcript_file)
+    json.dump(run_benchmark(args, transcript), sys.stdout, indent=2)
+    print()
+
+
+if __name__ == "__main__":
+    main()
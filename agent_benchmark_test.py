@@ -0,0 +1,41 @@
+import json
+import os
+import tempfile
+import unittest
+
+from agent_benchmark import parse_args, run_benchmark
+
+
+class TestAgentBenchmark(unittest.TestCase):
+    def test_small_run(self):
+        with tempfile.TemporaryDirectory() as directory:
+            transcript_path = os.path.join(directory, "transcript.json")
+            args = parse_args(
+                [
+                    "--files",
+                    "5",
+                    "--functions",
+                    "3",
+                    "--queries",
+                    "5",
+                    "--iterations",
+                    "8",
+                    "--save-transcript",
+                    transcript_path,
+                ]
+            )
+            results = run_benchmark(args)
+            with open(transcript_path, "r") as transcript_file:
+                transcript = json.load(transcript_file)
+
+        self.assertEqual(results["indexing"]["files"], 5)
+        self.assertGreater(results["indexing"]["chunks_per_second"], 0)
+        self.assertIn("hybrid_p99_ms", results["retrieval"])
+        # Eight commands plus the final finish
+        self.assertEqual(results["agent"]["iterations"], 9)
+        self.assertEqual(len(transcript["replies"]), 9)
+        json.dumps(results)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,22 +1,38 @@
+import asyncio
 import os
 import tempfile
 import unittest
 from unittest.mock import patch
 
-from agent_tools import ListFilesAndDirectoriesTool, ViewCodeFilesTool
+import globals
+from agent_tools import FindSymbolTool, ListFilesAndDirectoriesTool, ViewCodeFilesTool
+from symbol_utils import SymbolIndex
 
 
 class TestListFilesAndDirectoriesTool(unittest.TestCase):
     def setUp(self):
+        globals.initialize()
         self.tool = ListFilesAndDirectoriesTool()
+        self.repo = tempfile.TemporaryDirectory()
+        for directory in [".git", "src"]:
+            os.mkdir(os.path.join(self.repo.name, directory))
+        for file_name in ["main.py", "agent_tools.py", ".gitignore"]:
+            open(os.path.join(self.repo.name, file_name), "w").close()
+
+    def tearDown(self):
+        self.repo.cleanup()
 
     def test_valid_directory(self):
-        path = "/Users/russellocean/Dev/RecurGPT"
-        expected_directories = "Directories: .chroma, __pycache__, .git"
-        expected_files = "Files: view_directory.py, config.py, agent_utils.py, prompt.txt, custom_parser.py, agent_test.py, .gitignore, utils.py, agent.py, main.py, agent_components.py, project_loader.py, file_viewer.py, agent_tools.py"
-        actual_output = self.tool._run(path)
-        self.assertIn(expected_directories, actual_output)
-        self.assertIn(expected_files, actual_output)
+        directories, files = self.tool._run(self.repo.name).split("\n")
+        self.assertTrue(directories.startswith("Directories: "))
+        self.assertEqual(
+            set(directories[len("Directories: ") :].split(", ")), {".git", "src"}
+        )
+        self.assertTrue(files.startswith("Files: "))
+        self.assertEqual(
+            set(files[len("Files: ") :].split(", ")),
+            {"main.py", "agent_tools.py", ".gitignore"},
+        )
 
     def test_invalid_directory(self):
         path = "/path/to/invalid/directory"
@@ -25,13 +41,13 @@ class TestListFilesAndDirectoriesTool(unittest.TestCase):
         self.assertEqual(actual_output, expected_output)
 
     def test_non_directory_path(self):
-        path = "/Users/russellocean/Dev/RecurGPT/main.py"
-        expected_output = "Error: The specified path '/Users/russellocean/Dev/RecurGPT/main.py' is not a directory. Please provide a valid directory."
+        path = os.path.join(self.repo.name, "main.py")
+        expected_output = f"Error: The specified path '{path}' is not a directory. Please provide a valid directory."
         actual_output = self.tool._run(path)
         self.assertEqual(actual_output, expected_output)
 
     def test_unexpected_error(self):
-        path = "/Users/russellocean/Dev/RecurGPT"
+        path = self.repo.name
 
         # Define a function to raise TypeError when called
         def raise_error(*args):
@@ -45,9 +61,13 @@ class TestListFilesAndDirectoriesTool(unittest.TestCase):
             actual_output = self.tool._run(path)
             self.assertEqual(actual_output, expected_output)
 
-    # def test_async_not_implemented(self):
-    #     with self.assertRaises(NotImplementedError):
-    #         self.tool._arun()
+    def test_async_run(self):
+        globals.initialize()
+        with tempfile.TemporaryDirectory() as path:
+            os.mkdir(os.path.join(path, "src"))
+            open(os.path.join(path, "main.py"), "w").close()
+            actual_output = asyncio.run(self.tool.arun(path))
+        self.assertEqual(actual_output, "Directories: src\nFiles: main.py")
 
 
 class TestViewCodeFilesTool(unittest.TestCase):
@@ -65,6 +85,17 @@ class TestViewCodeFilesTool(unittest.TestCase):
 
         os.remove(temp_file_path)
 
+    def test_async_valid_file(self):
+        with tempfile.NamedTemporaryFile(delete=False) as temp_file:
+            temp_file.write(b"print('hello world')")
+            temp_file_path = temp_file.name
+
+        expected_output = f"Content of '{temp_file_path}':\nprint('hello world')"
+        actual_output = asyncio.run(self.tool.arun({"file_path": temp_file_path}))
+        self.assertEqual(actual_output, expected_output)
+
+        os.remove(temp_file_path)
+
     def test_file_not_found(self):
         path = "/path/to/nonexistent/file.py"
         expected_output = f"Error: The specified path '{path}' does not exist. Please provide a valid file path."
@@ -99,6 +130,37 @@ class TestViewCodeFilesTool(unittest.TestCase):
         os.remove(temp_file_path)
 
 
+class TestFindSymbolTool(unittest.TestCase):
+    def setUp(self):
+        globals.initialize()
+        globals.symbol_index = SymbolIndex()
+        globals.symbol_index.add_file(
+            "/repo/agent_utils.py",
+            "import faiss\n\n\nclass CustomAutoGPT:\n    def run(self):\n        pass\n",
+        )
+        globals.symbol_index.add_file("/repo/main.js", "function main() {\n}\n")
+        self.tool = FindSymbolTool()
+
+    def test_exact_lookup(self):
+        self.assertEqual(
+            self.tool._run("CustomAutoGPT.run"),
+            "CustomAutoGPT.run (method) /repo/agent_utils.py:5",
+        )
+        self.assertEqual(self.tool._run("main"), "main (definition) /repo/main.js:1")
+        self.assertEqual(self.tool._run("faiss"), "import faiss /repo/agent_utils.py:1")
+
+    def test_prefix_lookup(self):
+        output = self.tool._run("Custom*")
+        self.assertIn("CustomAutoGPT (class) /repo/agent_utils.py:4", output)
+        self.assertIn("CustomAutoGPT.run (method) /repo/agent_utils.py:5", output)
+        self.assertEqual(self.tool._run("main.j"), "main.js (file) /repo/main.js")
+
+    def test_no_match(self):
+        self.assertEqual(
+            self.tool._run("missing"), "No symbols or files found matching 'missing'."
+        )
+
+
 if __name__ == "__main__":
     suite = unittest.TestLoader().loadTestsFromTestCase(TestListFilesAndDirectoriesTool)
     unittest.TextTestRunner(verbosity=2).run(suite)
@@ -1,10 +1,23 @@
+import asyncio
 import os
+import re
 
 # Import necessary libraries and modules
 from langchain.tools import BaseTool
+from pydantic import Field
 
 import globals
 from file_utils import is_ignored
+from patch_utils import (
+    FileVersions,
+    PatchConflictError,
+    content_hash,
+    is_patch,
+    patch_file,
+    replace_file,
+)
+from trace_utils import log, span
+from view_utils import is_binary_file, parse_view_request, view_file
 
 
 class ListDirectoriesTool(BaseTool):
@@ -20,7 +33,7 @@ class ListDirectoriesTool(BaseTool):
 
         # Check if the path is a directory
         if not os.path.isdir(path):
-            print(
+            log(
                 "Error: The specified path is not a directory. Please provide a valid directory."
             )
             return f"Error: The specified path '{path}' is not a directory. Please provide a valid directory."
@@ -36,8 +49,9 @@ class ListDirectoriesTool(BaseTool):
 
         return output
 
-    async def _arun(self) -> str:
-        raise NotImplementedError("ListDirectoriesTool does not support async")
+    async def _arun(self, path: str) -> str:
+        # File system calls block, so run them off the event loop
+        return await asyncio.to_thread(self._run, path)
 
 
 class ListFilesAndDirectoriesTool(BaseTool):
@@ -61,9 +75,12 @@ class ListFilesAndDirectoriesTool(BaseTool):
             directories = [d for d in items if os.path.isdir(os.path.join(path, d))]
             files = [f for f in items if os.path.isfile(os.path.join(path, f))]
 
-            # Filter out files in the gitignore
+            # Filter out files in the gitignore, anchored at the project root
+            root = globals.project_repository or path
             files = [
-                f for f in files if not is_ignored(f, path, globals.ignore_patterns)
+                f
+                for f in files
+                if not is_ignored(os.path.join(path, f), root, globals.ignore_patterns)
             ]
 
             output_directories = "Directories: " + ", ".join(directories)
@@ -82,16 +99,20 @@ class ListFilesAndDirectoriesTool(BaseTool):
 
         return output
 
-    async def _arun(self) -> str:
-        raise NotImplementedError("ListFilesAndDirectoriesTool does not support async")
+    async def _arun(self, path: str) -> str:
+        return await asyncio.to_thread(self._run, path)
 
 
 class ViewCodeFilesTool(BaseTool):
     name = "ViewCodeFiles"
-    description = "Views code files in a specified location. The input should be a string containing the full file path as expected by os.path, not a relative path. For example, 'path/to/file.txt'."
+    description = "Views code files in a specified location. The input should be a string containing the full file path as expected by os.path, not a relative path. For example, 'path/to/file.txt'. Large files are shown as an outline; append ':START-END' to view a range of lines, for example 'path/to/file.txt:120-180', or ':bytes=START-END' for a range of bytes."
+    # Shared with ModifyFile to detect files changed after they were viewed
+    file_versions: FileVersions = Field(default_factory=FileVersions)
 
     def _run(self, file_path: str) -> str:
         """Helper function to view code files."""
+        request = parse_view_request(file_path)
+        file_path = request.file_path
 
         # Check if the path is valid
         if not os.path.exists(file_path):
@@ -103,9 +124,13 @@ class ViewCodeFilesTool(BaseTool):
 
         # Call APIs or perform main functionality
         try:
-            with open(file_path, "r") as file:
-                content = file.read()
-            output = f"Content of '{file_path}':\n{content}"
+            if is_binary_file(file_path):
+                return f"Error: The file '{file_path}' contains non-text content or is not a supported coding file format."
+            with open(file_path, "rb") as file:
+                self.file_versions.record(file_path, content_hash(file.read()))
+            output = view_file(
+                file_path, request.start, request.end, request.byte_range
+            )
         except FileNotFoundError:
             return f"Error: The specified file '{file_path}' does not exist."
         except PermissionError:
@@ -121,8 +146,8 @@ class ViewCodeFilesTool(BaseTool):
 
         return output
 
-    async def _arun(self) -> str:
-        raise NotImplementedError("ViewCodeFilesTool does not support async")
+    async def _arun(self, file_path: str) -> str:
+        return await asyncio.to_thread(self._run, file_path)
 
 
 class CreateFileTool(BaseTool):
@@ -154,13 +179,14 @@ class CreateFileTool(BaseTool):
 
         return output
 
-    async def _arun(self) -> str:
-        raise NotImplementedError("CreateFileTool does not support async")
+    async def _arun(self, file_path: str) -> str:
+        return await asyncio.to_thread(self._run, file_path)
 
 
 class ModifyFileTool(BaseTool):
     name = "ModifyFile"
-    description = "Modifies the content of a file at the specified location. The input should be a string with the file path and new content separated by a comma. For example, 'path/to/file.txt, new content'."
+    description = "Modifies the content of a file at the specified location. The input should be a string with the file path and a patch separated by a comma. The patch is either a unified diff starting with '@@ -LINE,COUNT +LINE,COUNT @@', or one or more blocks of the form '<<<<<<< SEARCH\\nexact old lines\\n=======\\nnew lines\\n>>>>>>> REPLACE'. For example, 'path/to/file.txt, <<<<<<< SEARCH\\nx = 1\\n=======\\nx = 2\\n>>>>>>> REPLACE'. Only send the lines that change. Any other text after the comma replaces the whole file. The edit is rejected if the file changed since you last viewed it; view it again and redo the edit."
+    file_versions: FileVersions = Field(default_factory=FileVersions)
 
     def _run(self, inputs: str) -> str:
         """Helper function to modify a file."""
@@ -176,15 +202,28 @@ class ModifyFileTool(BaseTool):
 
         # Call APIs or perform main functionality
         try:
-            with open(file_path, "w") as file:
-                file.write(content)
-            output = f"File '{file_path}' has been modified successfully."
+            viewed_hash = self.file_versions.get(file_path)
+            if is_patch(content):
+                result = patch_file(file_path, content, viewed_hash)
+                data = result.content.encode("utf-8")
+                output = (
+                    f"File '{file_path}' has been modified successfully "
+                    f"({result.hunks} hunks, +{result.added} -{result.removed} lines)."
+                )
+            else:
+                data = content.encode("utf-8")
+                replace_file(file_path, data, viewed_hash)
+                output = f"File '{file_path}' has been modified successfully."
+            # The agent knows what it wrote, so its next edit builds on it
+            self.file_versions.record(file_path, content_hash(data))
         except FileNotFoundError:
             return f"Error: The specified file '{file_path}' does not exist."
         except PermissionError:
             return (
                 f"Error: You do not have permission to modify the file '{file_path}'."
             )
+        except PatchConflictError as e:
+            return f"Error: The patch was not applied. {str(e)}"
         except Exception as e:
             return f"Error: An unexpected error occurred while modifying the file: {str(e)}"
 
@@ -192,7 +231,87 @@ class ModifyFileTool(BaseTool):
 
     def parse_inputs(self, inputs: str) -> tuple:
         file_path, content = inputs.split(",", 1)
+        # Leading whitespace is significant in the first line of a patch
+        if is_patch(content):
+            return file_path.strip(), content.lstrip(" ").strip("\n")
         return file_path.strip(), content.strip()
 
-    async def _arun(self) -> str:
-        raise NotImplementedError("ModifyFileToolWithParser does not support async")
+    async def _arun(self, inputs: str) -> str:
+        return await asyncio.to_thread(self._run, inputs)
+
+
+class FindSymbolTool(BaseTool):
+    name = "FindSymbol"
+    description = "Finds where a function, class, method, imported module or file is defined in the project, without reading files. The input should be a symbol or file name such as 'CustomAutoGPT.run' or 'main.py'. End the input with '*' to search by prefix, for example 'CustomAuto*'."
+
+    def _run(self, query: str) -> str:
+        """Helper function to look up symbols and file paths."""
+
+        if globals.symbol_index is None:
+            return "Error: The symbol index has not been built for this project."
+
+        query = query.strip().strip("'\"")
+        prefix = query.endswith("*")
+        query = query.rstrip("*")
+        if not query:
+            return "Error: Please provide a symbol or file name to look up."
+
+        results = globals.symbol_index.lookup(query, prefix=prefix)
+        if not results and not prefix:
+            # Fall back to a prefix search before giving up
+            results = globals.symbol_index.lookup(query, prefix=True)
+        if not results:
+            return f"No symbols or files found matching '{query}'."
+        return "\n".join(results)
+
+    async def _arun(self, query: str) -> str:
+        return self._run(query)
+
+
+class SearchCodeTool(BaseTool):
+    name = "SearchCode"
+    description = "Searches the contents of all project files for a string, like grep, and returns matching lines as 'path:line: text'. The input should be the exact text to find, for example 'def setup_agent'. Start the input with 'regex:' to search with a regular expression instead, for example 'regex:class \\w+Tool'. Add '(?i)' at the start of a regular expression to ignore case."
+    max_results: int = 50
+
+    def _run(self, query: str) -> str:
+        """Helper function to search file contents."""
+
+        if globals.trigram_index is None:
+            return "Error: The code search index has not been built for this project."
+
+        query = query.strip()
+        regex = query.startswith("regex:")
+        pattern = query[len("regex:") :] if regex else query
+        if not pattern:
+            return "Error: Please provide the text or regular expression to search for."
+
+        try:
+            results = globals.trigram_index.search(
+                pattern, regex=regex, max_results=self.max_results + 1
+            )
+        except re.error as e:
+            return f"Error: Invalid regular expression '{pattern}': {str(e)}"
+        if not results:
+            return f"No matches found for '{pattern}'."
+        if len(results) > self.max_results:
+            results = results[: self.max_results] + [
+                f"Only the first {self.max_results} matches are shown; use a more specific pattern."
+            ]
+        return "\n".join(results)
+
+    async def _arun(self, query: str) -> str:
+        return await asyncio.to_thread(self._run, query)
+
+
+def run_tool(tool: BaseTool, tool_input) -> str:
+    with span(f"tool.{tool.name}"):
+        return tool.run(tool_input)
+
+
+async def arun_tool(tool: BaseTool, tool_input) -> str:
+    """Run a tool asynchronously, in a thread if it only supports sync calls."""
+    with span(f"tool.{tool.name}", concurrent=True):
+        try:
+            return await tool.arun(tool_input)
+        except NotImplementedError:
+            return await asyncio.to_thread(tool.run, tool_input)
@@ -1,86 +1,178 @@
+import asyncio
 import os
+import threading
+import time
+from collections import OrderedDict
 from datetime import datetime
-from typing import List, Optional
+from typing import Any, Callable, Dict, List, NamedTuple, Optional, Tuple
 
-import faiss
-import openai
 from langchain.agents import Tool
 from langchain.chains import LLMChain
 from langchain.chat_models import ChatOpenAI
 from langchain.chat_models.base import BaseChatModel
 from langchain.docstore import InMemoryDocstore
-from langchain.embeddings import OpenAIEmbeddings
 from langchain.experimental import AutoGPT
 from langchain.experimental.autonomous_agents.autogpt.output_parser import (
+    AutoGPTAction,
     AutoGPTOutputParser,
 )
 from langchain.experimental.autonomous_agents.autogpt.prompt import AutoGPTPrompt
 from langchain.experimental.autonomous_agents.autogpt.prompt_generator import (
     FINISH_NAME,
 )
-from langchain.schema import AIMessage, Document, HumanMessage, SystemMessage
+from langchain.schema import AIMessage, BaseMessage, HumanMessage, SystemMessage
 from langchain.tools.base import BaseTool
 from langchain.tools.human.tool import HumanInputRun
-from langchain.utilities import GoogleSerperAPIWrapper
-from langchain.utilities.wolfram_alpha import WolframAlphaAPIWrapper
 from langchain.vectorstores import FAISS
 from langchain.vectorstores.base import VectorStoreRetriever
-from pydantic import BaseModel, Field, ValidationError
+from pydantic import BaseModel, Field, PrivateAttr, ValidationError
 
 # Import custom components
 from agent_tools import (
     CreateFileTool,
+    FindSymbolTool,
     ListFilesAndDirectoriesTool,
     ModifyFileTool,
+    SearchCodeTool,
     ViewCodeFilesTool,
+    arun_tool,
+    run_tool,
 )
+from ann_utils import create_index
+from embedding_utils import estimate_tokens, get_embeddings, run_sync
+from llm_cache_utils import (
+    CACHE_MODES,
+    DEFAULT_LLM_CACHE_PATH,
+    LIVE_TOOL_TTL_SECONDS,
+    CachedChatModel,
+    LLMResponseCache,
+    cached_function,
+)
+from memory_utils import MEMORY_INDEX_CONFIG, AgentMemoryManager, llm_summarizer
+from patch_utils import FileVersions
+from retrieval_utils import HybridRetriever
+from trace_utils import count, log, tracer
 
 # Retrieve API keys and app ID from environment variables
 OPENAI_API_KEY = os.environ.get("OPENAI_API_KEY")
 SERPER_API_KEY = os.environ.get("SERPER_API_KEY")
 WOLFRAM_ALPHA_APPID = os.environ.get("WOLFRAM_ALPHA_APPID")
+# One of llm_cache_utils.CACHE_MODES: cache, replay or off
+LLM_CACHE_MODE = os.environ.get("RECURGPT_LLM_CACHE", "cache")
+
+EMBEDDING_SIZE = 1536
+
+
+def memory_vectorstore() -> FAISS:
+    """Empty vectorstore for the agent's memories, sharing the embeddings cache."""
+    embeddings_model = get_embeddings()
+    index = create_index(EMBEDDING_SIZE, MEMORY_INDEX_CONFIG)
+    return FAISS(embeddings_model.embed_query, index, InMemoryDocstore({}), {})
+
+
+def lazy_run(create_client: Callable[[], Any]) -> Callable[[str], str]:
+    """Run a text tool whose API client is only created on its first call."""
+    client = None
+    lock = threading.Lock()
 
-# Set OpenAI API key
-openai.api_key = OPENAI_API_KEY
+    def run(query: str) -> str:
+        nonlocal client
+        with lock:
+            if client is None:
+                client = create_client()
+        return client.run(query)
 
-# Define your embedding model
-embeddings_model = OpenAIEmbeddings()
+    return run
 
-embedding_size = 1536
-index = faiss.IndexFlatL2(embedding_size)
-vectorstore = FAISS(embeddings_model.embed_query, index, InMemoryDocstore({}), {})
 
+def search_client():
+    from langchain.utilities import GoogleSerperAPIWrapper
 
-def setup_agent(context, project_directory):
+    return GoogleSerperAPIWrapper()
+
+
+def wolfram_client():
+    from langchain.utilities.wolfram_alpha import WolframAlphaAPIWrapper
+
+    return WolframAlphaAPIWrapper()
+
+
+def setup_agent(
+    context,
+    project_directory,
+    context_k: int = 4,
+    context_token_budget: int = 2000,
+    llm_cache_mode: str = LLM_CACHE_MODE,
+    llm_cache_path: str = DEFAULT_LLM_CACHE_PATH,
+    context_retriever: Optional[HybridRetriever] = None,
+    response_cache: Optional[LLMResponseCache] = None,
+    verbose: bool = True,
+):
     """
     Set up and return an instance of the agent.
+
+    LLM, search and Wolfram responses are cached in llm_cache_path. With
+    llm_cache_mode="replay" the agent only serves recorded responses, so a
+    session recorded with the cache enabled can be rerun offline. Agents
+    running side by side can share a context_retriever and response_cache
+    instead of building their own. context_retriever can also be a
+    shard_utils.ShardedIndex searching several repositories, context is only
+    used when it is not given.
     """
+    if llm_cache_mode not in CACHE_MODES:
+        raise ValueError(
+            f"Unknown LLM cache mode '{llm_cache_mode}', use one of {CACHE_MODES}"
+        )
+    if response_cache is None:
+        response_cache = LLMResponseCache(llm_cache_path)
+
+    # Hybrid BM25 + vector retrieval over the project chunks
+    if context_retriever is None:
+        context_retriever = HybridRetriever(
+            context, k=context_k, token_budget=context_token_budget
+        )
 
-    # Initialize API wrappers
-    search = GoogleSerperAPIWrapper()
-    wolfram = WolframAlphaAPIWrapper()
+    # API clients are created on first use, most sessions never need them
+    search = lazy_run(search_client)
+    wolfram = lazy_run(wolfram_client)
 
     # Initialize custom tools
     list_files_and_directories_tool = ListFilesAndDirectoriesTool()
-    view_code_files_tool = ViewCodeFilesTool()
+    # Edits are checked against the version of each file the agent viewed
+    file_versions = FileVersions()
+    view_code_files_tool = ViewCodeFilesTool(file_versions=file_versions)
     create_file_tool = CreateFileTool()
-    modify_file_tool = ModifyFileTool()
+    modify_file_tool = ModifyFileTool(file_versions=file_versions)
+    find_symbol_tool = FindSymbolTool()
+    search_code_tool = SearchCodeTool()
 
     # Define available tools
     tools = [
         Tool(
             name="Search",
-            func=search.run,
+            func=cached_function(
+                search,
+                response_cache,
+                "Search",
+                llm_cache_mode,
+                ttl_seconds=LIVE_TOOL_TTL_SECONDS,
+            ),
             description="Useful for answering questions about current events. Ask targeted questions.",
         ),
         Tool(
             name="Wolfram",
-            func=wolfram.run,
+            func=cached_function(
+                wolfram,
+                response_cache,
+                "Wolfram",
+                llm_cache_mode,
+                ttl_seconds=LIVE_TOOL_TTL_SECONDS,
+            ),
             description="Useful for answering questions about math, science, and geography.",
         ),
         Tool(
             name="Context",
-            func=context.as_retriever,
+            func=context_retriever.run,
             description="Useful for answering questions about the current project, within the context of the files. Ask targeted questions.",
         ),
     ]
@@ -90,6 +182,8 @@ def setup_agent(context, project_directory):
         view_code_files_tool,
         create_file_tool,
         modify_file_tool,
+        find_symbol_tool,
+        search_code_tool,
     ] + tools
 
     current_datetime = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
@@ -112,20 +206,23 @@ def setup_agent(context, project_directory):
     suffix = f"""\nCurrent Project Directory: {project_directory}"""
 
     # llm = ChatOpenAI(temperature=0, model="gpt-4")
-    llm = ChatOpenAI(model_name="gpt-4", temperature=0)
+    llm = CachedChatModel(
+        llm=ChatOpenAI(model_name="gpt-4", temperature=0),
+        cache=response_cache,
+        mode=llm_cache_mode,
+    )
 
     agent = CustomAutoGPT.from_llm_and_tools_custom(
         prefix=prefix,
         suffix=suffix,
         ai_name="DeveloperAgent",
         ai_role="A software development assistant",
-        memory=vectorstore.as_retriever(),
+        memory=memory_vectorstore().as_retriever(),
         tools=tools,
         llm=llm,
     )
 
-    # Set verbose to be true
-    agent.chain.verbose = True
+    agent.chain.verbose = verbose
 
     return agent
 
@@ -157,7 +254,42 @@ def ask_agent(agent, message):
     return response
 
 
+BATCH_NAME = "batch"
+BATCH_INSTRUCTIONS = (
+    '\n\nTo run several independent commands at once, use the command "batch" '
+    'with args {"commands": [{"name": "<command name>", "args": {...}}, ...]}. '
+    "The commands run concurrently, so only batch commands that do not depend "
+    "on each other's results, such as listing or viewing several files."
+)
+
+
+class TurnTiming(NamedTuple):
+    prompt_seconds: float
+    llm_seconds: float
+    tool_seconds: float
+    prompt_tokens: int
+
+
 class CustomAutoGPT(AutoGPT):
+    def __init__(
+        self, *args, max_parallel_tools: int = 4, max_batch_size: int = 8, **kwargs
+    ):
+        super().__init__(*args, **kwargs)
+        self.turn_timings: List[TurnTiming] = []
+        self.max_parallel_tools = max_parallel_tools
+        self.max_batch_size = max_batch_size
+
+    def timing_summary(self) -> Dict[str, float]:
+        """Average per-turn seconds for prompt build, LLM call and tool run."""
+        turns = len(self.turn_timings) or 1
+        return {
+            "turns": len(self.turn_timings),
+            "prompt_seconds": sum(t.prompt_seconds for t in self.turn_timings) / turns,
+            "llm_seconds": sum(t.llm_seconds for t in self.turn_timings) / turns,
+            "tool_seconds": sum(t.tool_seconds for t in self.turn_timings) / turns,
+            "prompt_tokens": sum(t.prompt_tokens for t in self.turn_timings) / turns,
+        }
+
     def run(self, goals: List[str]) -> str:
         user_input = (
             "Determine which next command to use, "
@@ -167,39 +299,52 @@ class CustomAutoGPT(AutoGPT):
         while True:
             loop_count += 1
 
+            chain_started = time.perf_counter()
             assistant_reply = self.chain.run(
                 goals=goals,
                 messages=self.full_message_history,
                 memory=self.memory,
                 user_input=user_input,
             )
-
-            print(assistant_reply)
-            self.full_message_history.append(HumanMessage(content=user_input))
-            self.full_message_history.append(AIMessage(content=assistant_reply))
+            chain_seconds = time.perf_counter() - chain_started
+            # The reply joins the history, so counting it here warms the memo
+            count_tokens = getattr(self.chain.prompt, "count_tokens", estimate_tokens)
+            count("tokens_out", count_tokens(assistant_reply))
+            prompt_seconds = getattr(self.chain.prompt, "last_build_seconds", 0.0)
+            prompt_tokens = getattr(self.chain.prompt, "last_prompt_tokens", 0)
+
+            log(assistant_reply)
+            self.memory_manager.add_messages(
+                self.full_message_history,
+                [HumanMessage(content=user_input), AIMessage(content=assistant_reply)],
+            )
 
             action = self.output_parser.parse(assistant_reply)
             tools = {t.name: t for t in self.tools}
+            tool_started = time.perf_counter()
             if action.name == FINISH_NAME:
+                self.record_turn(
+                    chain_started, chain_seconds, prompt_seconds, 0.0, prompt_tokens
+                )
                 return action.args["response"]
-            if action.name in tools:
+            if action.name == BATCH_NAME:
+                result = run_sync(self.arun_batch(action.args, tools))
+            elif action.name in tools:
                 tool = tools[action.name]
                 try:
-                    observation = tool.run(action.args)
+                    observation = run_tool(tool, action.args)
                 except ValidationError as e:
                     observation = f"Error in args: {str(e)}"
-                result = f"Command {tool.name} returned: {observation}"
-                criticism = action.args.get("criticism")
-                if criticism:
-                    result += f"\nCriticism: {criticism}"
-            elif action.name == "ERROR":
-                result = f"Error: {action.args}. "
+                result = self.command_result(tool.name, observation, action.args)
             else:
-                result = (
-                    f"Unknown command '{action.name}'. "
-                    f"Please refer to the 'COMMANDS' list for available "
-                    f"commands and only respond in the specified JSON format."
-                )
+                result = self.command_error(action)
+            self.record_turn(
+                chain_started,
+                chain_seconds,
+                prompt_seconds,
+                time.perf_counter() - tool_started,
+                prompt_tokens,
+            )
 
             memory_to_add = (
                 f"Assistant Reply: {assistant_reply} " f"\nResult: {result} "
@@ -207,12 +352,88 @@ class CustomAutoGPT(AutoGPT):
             if self.feedback_tool is not None:
                 feedback = f"\n{self.feedback_tool.run('Input: ')}"
                 if feedback in {"q", "stop"}:
-                    print("EXITING")
+                    log("EXITING")
                     return "EXITING"
                 memory_to_add += feedback
 
-            self.memory.add_documents([Document(page_content=memory_to_add)])
-            self.full_message_history.append(SystemMessage(content=result))
+            self.memory_manager.remember(memory_to_add)
+            self.memory_manager.add_messages(
+                self.full_message_history, [SystemMessage(content=result)]
+            )
+
+    @staticmethod
+    def command_result(name: str, observation: str, args: Dict) -> str:
+        result = f"Command {name} returned: {observation}"
+        criticism = args.get("criticism")
+        if criticism:
+            result += f"\nCriticism: {criticism}"
+        return result
+
+    @staticmethod
+    def command_error(action: AutoGPTAction) -> str:
+        if action.name == "ERROR":
+            return f"Error: {action.args}. "
+        return (
+            f"Unknown command '{action.name}'. "
+            f"Please refer to the 'COMMANDS' list for available "
+            f"commands and only respond in the specified JSON format."
+        )
+
+    async def arun_batch(self, args: Dict, tools: Dict[str, BaseTool]) -> str:
+        """Run the independent commands of a batch concurrently, in order of results."""
+        commands = args.get("commands")
+        if not isinstance(commands, list) or not commands:
+            return f"Error: The {BATCH_NAME} command needs a non-empty 'commands' list."
+        semaphore = asyncio.Semaphore(self.max_parallel_tools)
+
+        async def run_command(command) -> str:
+            if not isinstance(command, dict):
+                return f"Error: Invalid command in batch: {command}"
+            action = AutoGPTAction(
+                name=command.get("name", ""), args=command.get("args") or {}
+            )
+            if action.name in (FINISH_NAME, BATCH_NAME) or action.name not in tools:
+                return self.command_error(action)
+            async with semaphore:
+                try:
+                    observation = await arun_tool(tools[action.name], action.args)
+                except ValidationError as e:
+                    observation = f"Error in args: {str(e)}"
+            return self.command_result(action.name, observation, action.args)
+
+        results = await asyncio.gather(
+            *(run_command(command) for command in commands[: self.max_batch_size])
+        )
+        if len(commands) > self.max_batch_size:
+            results.append(
+                f"Skipped {len(commands) - self.max_batch_size} commands, "
+                f"a batch runs at most {self.max_batch_size}."
+            )
+        return "\n\n".join(results)
+
+    def record_turn(
+        self,
+        started: float,
+        chain_seconds: float,
+        prompt_seconds: float,
+        tool_seconds: float,
+        prompt_tokens: int,
+    ):
+        timing = TurnTiming(
+            prompt_seconds=prompt_seconds,
+            llm_seconds=max(0.0, chain_seconds - prompt_seconds),
+            tool_seconds=tool_seconds,
+            prompt_tokens=prompt_tokens,
+        )
+        self.turn_timings.append(timing)
+        tracer.record("agent.llm", started + prompt_seconds, timing.llm_seconds, {})
+        tracer.record(
+            "agent.iteration",
+            started,
+            chain_seconds + tool_seconds,
+            {"iteration": len(self.turn_timings), **timing._asdict()},
+        )
+        count("tokens_in", prompt_tokens)
 
     @classmethod
     def from_llm_and_tools_custom(
@@ -226,6 +447,7 @@ class CustomAutoGPT(AutoGPT):
         llm: BaseChatModel,
         human_in_the_loop: bool = False,
         output_parser: Optional[AutoGPTOutputParser] = None,
+        max_parallel_tools: int = 4,
     ) -> "CustomAutoGPT":
         custom_prompt = CustomAutoGPTPrompt(
             ai_name=ai_name,
@@ -235,28 +457,121 @@ class CustomAutoGPT(AutoGPT):
             token_counter=llm.get_num_tokens,
             prefix=prefix,
             suffix=suffix,
+            batch_commands=max_parallel_tools > 1,
         )
         human_feedback_tool = HumanInputRun() if human_in_the_loop else None
         chain = LLMChain(llm=llm, prompt=custom_prompt)
-        return cls(
+        # Bound the history and memory index so long sessions stay flat
+        memory_manager = AgentMemoryManager(
+            memory.vectorstore, summarize=llm_summarizer(llm)
+        )
+        agent = cls(
             ai_name,
-            memory,
+            memory_manager.retriever(k=memory.search_kwargs.get("k", 4)),
             chain,
             output_parser or AutoGPTOutputParser(),
             tools,
             feedback_tool=human_feedback_tool,
+            max_parallel_tools=max_parallel_tools,
         )
+        agent.memory_manager = memory_manager
+        return agent
 
 
 class CustomAutoGPTPrompt(AutoGPTPrompt):
     prefix: str
     suffix: str
+    # Token counts are memoized per message content, up to this many entries
+    token_cache_size: int = 4096
+    # Tell the model it may send independent commands as one batch
+    batch_commands: bool = False
 
-    def construct_full_prompt(self, goals: List[str]) -> str:
-        # Call the parent class's construct_full_prompt method to get the original prompt
-        original_prompt = super().construct_full_prompt(goals)
+    _full_prompts: Dict[Tuple[str, ...], Tuple[str, int]] = PrivateAttr(
+        default_factory=dict
+    )
+    _token_counts: "OrderedDict[str, int]" = PrivateAttr(default_factory=OrderedDict)
+    _last_build_seconds: float = PrivateAttr(default=0.0)
+    _last_prompt_tokens: int = PrivateAttr(default=0)
+
+    @property
+    def last_build_seconds(self) -> float:
+        return self._last_build_seconds
 
-        # Add the prefix and suffix
-        full_prompt = self.prefix + original_prompt + self.suffix
+    @property
+    def last_prompt_tokens(self) -> int:
+        return self._last_prompt_tokens
 
-        return full_prompt
+    def construct_full_prompt(self, goals: List[str]) -> str:
+        return self.full_prompt(goals)[0]
+
+    def full_prompt(self, goals: List[str]) -> Tuple[str, int]:
+        """Render the static prompt once per goal list and cache it with its tokens."""
+        key = tuple(goals)
+        if key not in self._full_prompts:
+            # Call the parent class's construct_full_prompt method to get the original prompt
+            original_prompt = super().construct_full_prompt(goals)
+
+            # Add the prefix and suffix
+            full_prompt = self.prefix + original_prompt
+            if self.batch_commands:
+                full_prompt += BATCH_INSTRUCTIONS
+            full_prompt += self.suffix
+            self._full_prompts[key] = (full_prompt, self.token_counter(full_prompt))
+        return self._full_prompts[key]
+
+    def count_tokens(self, text: str) -> int:
+        count = self._token_counts.get(text)
+        if count is None:
+            count = self.token_counter(text)
+            self._token_counts[text] = count
+            if len(self._token_counts) > self.token_cache_size:
+                self._token_counts.popitem(last=False)
+        else:
+            self._token_counts.move_to_end(text)
+        return count
+
+    def format_messages(self, **kwargs: Any) -> List[BaseMessage]:
+        """Same layout as AutoGPTPrompt, with cached prompt text and token counts."""
+        started = time.perf_counter()
+        full_prompt, used_tokens = self.full_prompt(kwargs["goals"])
+        base_prompt = SystemMessage(content=full_prompt)
+        time_prompt = SystemMessage(
+            content=f"The current time and date is {time.strftime('%c')}"
+        )
+        used_tokens += self.count_tokens(time_prompt.content)
+
+        memory = kwargs["memory"]
+        previous_messages = kwargs["messages"]
+        relevant_docs = memory.get_relevant_documents(str(previous_messages[-10:]))
+        relevant_memory = []
+        relevant_memory_tokens = 0
+        for doc in relevant_docs:
+            doc_tokens = self.count_tokens(doc.page_content)
+            if used_tokens + relevant_memory_tokens + doc_tokens > 2500:
+                break
+            relevant_memory.append(doc.page_content)
+            relevant_memory_tokens += doc_tokens
+        content_format = (
+            f"This reminds you of these events "
+            f"from your past:\n{relevant_memory}\n\n"
+        )
+        memory_message = SystemMessage(content=content_format)
+        used_tokens += self.count_tokens(memory_message.content)
+
+        historical_messages: List[BaseMessage] = []
+        for message in previous_messages[-10:][::-1]:
+            message_tokens = self.count_tokens(message.content)
+            if used_tokens + message_tokens > self.send_token_limit - 1000:
+                break
+            historical_messages = [message] + historical_messages
+            used_tokens += message_tokens
+        input_message = HumanMessage(content=kwargs["user_input"])
+        used_tokens += self.count_tokens(input_message.content)
+
+        messages: List[BaseMessage] = [base_prompt, time_prompt, memory_message]
+        messages += historical_messages
+        messages.append(input_message)
+        self._last_build_seconds = time.perf_counter() - started
+        tracer.record("agent.prompt", started, self._last_build_seconds)
+        self._last_prompt_tokens = used_tokens
+        return messages
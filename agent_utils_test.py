@@ -0,0 +1,175 @@
+import asyncio
+import json
+import os
+import time
+import unittest
+
+# agent_utils creates the shared OpenAI embeddings at import time
+os.environ.setdefault("OPENAI_API_KEY", "test")
+
+from langchain.chains import LLMChain
+from langchain.experimental.autonomous_agents.autogpt.output_parser import (
+    AutoGPTOutputParser,
+)
+from langchain.llms.fake import FakeListLLM
+from langchain.schema import AIMessage, HumanMessage
+from langchain.tools.base import BaseTool
+
+from agent_utils import CustomAutoGPT, CustomAutoGPTPrompt
+from embedding_utils import run_sync
+from memory_utils import AgentMemoryManager
+from memory_utils_test import memory_vectorstore
+
+
+class CountingTokenCounter:
+    def __init__(self):
+        self.texts = []
+
+    def __call__(self, text: str) -> int:
+        self.texts.append(text)
+        return len(text.split())
+
+
+def make_prompt(counter) -> CustomAutoGPTPrompt:
+    return CustomAutoGPTPrompt(
+        ai_name="Tester",
+        ai_role="a test agent",
+        tools=[],
+        input_variables=["memory", "messages", "goals", "user_input"],
+        token_counter=counter,
+        prefix="PREFIX ",
+        suffix=" SUFFIX",
+    )
+
+
+class TestCustomAutoGPTPrompt(unittest.TestCase):
+    def setUp(self):
+        self.counter = CountingTokenCounter()
+        self.prompt = make_prompt(self.counter)
+        self.manager = AgentMemoryManager(memory_vectorstore())
+
+    def format(self, messages):
+        return self.prompt.format_messages(
+            goals=["goal"],
+            messages=messages,
+            memory=self.manager.retriever(),
+            user_input="next",
+        )
+
+    def test_static_prompt_is_rendered_once(self):
+        first = self.format([])
+        second = self.format([])
+        self.assertEqual(first[0].content, second[0].content)
+        self.assertTrue(first[0].content.startswith("PREFIX "))
+        self.assertTrue(first[0].content.endswith(" SUFFIX"))
+        self.assertEqual(self.counter.texts.count(first[0].content), 1)
+
+    def test_message_tokens_are_memoized(self):
+        history = [HumanMessage(content="hello there"), AIMessage(content="hi")]
+        self.format(history)
+        history.append(HumanMessage(content="and again"))
+        messages = self.format(history)
+        self.assertEqual(self.counter.texts.count("hello there"), 1)
+        self.assertEqual(self.counter.texts.count("and again"), 1)
+        self.assertEqual(
+            [m.content for m in messages[3:-1]], ["hello there", "hi", "and again"]
+        )
+        self.assertGreater(self.prompt.last_prompt_tokens, 0)
+        self.assertGreaterEqual(self.prompt.last_build_seconds, 0.0)
+
+
+class TestCustomAutoGPTRun(unittest.TestCase):
+    def test_run_records_turn_timings(self):
+        reply = json.dumps(
+            {
+                "thoughts": {
+                    "text": "",
+                    "reasoning": "",
+                    "plan": "",
+                    "criticism": "",
+                    "speak": "",
+                },
+                "command": {"name": "finish", "args": {"response": "done"}},
+            }
+        )
+        manager = AgentMemoryManager(memory_vectorstore())
+        chain = LLMChain(
+            llm=FakeListLLM(responses=[reply]),
+            prompt=make_prompt(CountingTokenCounter()),
+        )
+        agent = CustomAutoGPT(
+            "Tester", manager.retriever(), chain, AutoGPTOutputParser(), []
+        )
+        agent.memory_manager = manager
+
+        self.assertEqual(agent.run(["goal"]), "done")
+        self.assertEqual(len(agent.turn_timings), 1)
+        self.assertGreater(agent.turn_timings[0].prompt_tokens, 0)
+        self.assertEqual(agent.timing_summary()["turns"], 1)
+
+
+class SleepTool(BaseTool):
+    name = "Sleep"
+    description = "Sleeps and echoes its input."
+
+    def _run(self, text: str) -> str:
+        time.sleep(0.2)
+        return text.upper()
+
+    async def _arun(self, text: str) -> str:
+        await asyncio.sleep(0.2)
+        return text.upper()
+
+
+class TestBatchCommands(unittest.TestCase):
+    def setUp(self):
+        manager = AgentMemoryManager(memory_vectorstore())
+        chain = LLMChain(
+            llm=FakeListLLM(responses=["{}"]),
+            prompt=make_prompt(CountingTokenCounter()),
+        )
+        self.agent = CustomAutoGPT(
+            "Tester",
+            manager.retriever(),
+            chain,
+            AutoGPTOutputParser(),
+            [SleepTool()],
+            max_parallel_tools=4,
+        )
+        self.tools = {"Sleep": SleepTool()}
+
+    def test_commands_run_concurrently_in_order(self):
+        commands = [
+            {"name": "Sleep", "args": {"text": word}} for word in ["a", "b", "c", "d"]
+        ]
+        started = time.perf_counter()
+        result = run_sync(self.agent.arun_batch({"commands": commands}, self.tools))
+        self.assertLess(time.perf_counter() - started, 0.6)
+        self.assertEqual(
+            result.split("\n\n"),
+            [f"Command Sleep returned: {word}" for word in "ABCD"],
+        )
+
+    def test_invalid_commands_are_reported(self):
+        commands = [
+            {"name": "finish", "args": {"response": "done"}},
+            {"name": "Missing", "args": {}},
+            {"name": "Sleep", "args": {"text": "ok"}},
+        ]
+        result = run_sync(self.agent.arun_batch({"commands": commands}, self.tools))
+        parts = result.split("\n\n")
+        self.assertTrue(parts[0].startswith("Unknown command 'finish'"))
+        self.assertTrue(parts[1].startswith("Unknown command 'Missing'"))
+        self.assertEqual(parts[2], "Command Sleep returned: OK")
+        self.assertTrue(
+            run_sync(self.agent.arun_batch({}, self.tools)).startswith("Error:")
+        )
+
+    def test_batch_instructions_in_prompt(self):
+        prompt = make_prompt(CountingTokenCounter())
+        prompt.batch_commands = True
+        self.assertIn('"batch"', prompt.construct_full_prompt(["goal"]))
+
+
+if __name__ == "__main__":
+    unittest.main()
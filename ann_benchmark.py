@@ -0,0 +1,111 @@
+"""
+Recall/latency benchmark for the FAISS index kinds in ann_utils.
+
+Usage: python ann_benchmark.py --vectors 100000 --dimension 1536
+Results are printed as JSON, one entry per index kind.
+"""
+
+import argparse
+import json
+import os
+import tempfile
+import time
+
+import faiss
+import numpy as np
+
+from ann_utils import INDEX_KINDS, IndexConfig, create_index
+
+
+def synthetic_embeddings(count: int, dimension: int, clusters: int, seed: int):
+    # Clustered unit vectors behave more like real embeddings than pure noise
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(clusters, dimension)).astype(np.float32)
+    assignments = rng.integers(0, clusters, size=count)
+    vectors = centers[assignments] + 0.5 * rng.normal(size=(count, dimension)).astype(
+        np.float32
+    )
+    faiss.normalize_L2(vectors)
+    return vectors
+
+
+def percentile_ms(latencies, percentile: float) -> float:
+    return round(float(np.percentile(latencies, percentile)) * 1000, 3)
+
+
+def benchmark_kind(kind, vectors, queries, ground_truth, k, args):
+    config = IndexConfig(
+        kind=kind,
+        train_threshold=0,
+        nprobe=args.nprobe,
+        pq_m=args.pq_m,
+        ef_search=args.ef_search,
+    )
+    start = time.perf_counter()
+    index = create_index(vectors.shape[1], config, vectors)
+    index.add(vectors)
+    build_seconds = time.perf_counter() - start
+
+    with tempfile.TemporaryDirectory() as directory:
+        index_path = os.path.join(directory, "index.faiss")
+        faiss.write_index(index, index_path)
+        size_bytes = os.path.getsize(index_path)
+        if args.mmap:
+            index = faiss.read_index(
+                index_path, faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY
+            )
+
+        latencies = []
+        hits = 0
+        for query, expected in zip(queries, ground_truth):
+            start = time.perf_counter()
+            _, labels = index.search(query.reshape(1, -1), k)
+            latencies.append(time.perf_counter() - start)
+            hits += len(set(labels[0]) & set(expected))
+
+    return {
+        "kind": kind,
+        "vectors": len(vectors),
+        "build_seconds": round(build_seconds, 3),
+        "index_bytes": size_bytes,
+        f"recall_at_{k}": round(hits / (k * len(queries)), 4),
+        "p50_ms": percentile_ms(latencies, 50),
+        "p95_ms": percentile_ms(latencies, 95),
+        "p99_ms": percentile_ms(latencies, 99),
+        "mmap": args.mmap,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().split("\n")[0])
+    parser.add_argument("--vectors", type=int, default=100_000)
+    parser.add_argument("--dimension", type=int, default=1536)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--clusters", type=int, default=1000)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--kinds", nargs="+", default=list(INDEX_KINDS))
+    parser.add_argument("--nprobe", type=int, default=16)
+    parser.add_argument("--pq-m", type=int, default=64)
+    parser.add_argument("--ef-search", type=int, default=64)
+    parser.add_argument("--mmap", action="store_true")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    vectors = synthetic_embeddings(
+        args.vectors + args.queries, args.dimension, args.clusters, args.seed
+    )
+    vectors, queries = vectors[: args.vectors], vectors[args.vectors :]
+
+    exact = faiss.IndexFlatL2(args.dimension)
+    exact.add(vectors)
+    _, ground_truth = exact.search(queries, args.k)
+
+    results = [
+        benchmark_kind(kind, vectors, queries, ground_truth, args.k, args)
+        for kind in args.kinds
+    ]
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
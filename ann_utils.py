@@ -0,0 +1,171 @@
+import math
+import os
+import pickle
+import threading
+from typing import List, NamedTuple
+
+import faiss
+import numpy as np
+from langchain.embeddings.base import Embeddings
+from langchain.vectorstores import FAISS
+
+from trace_utils import log
+
+INDEX_KINDS = ("flat", "ivf", "hnsw", "ivfpq")
+
+_lock_guard = threading.Lock()
+
+
+class IndexConfig(NamedTuple):
+    # One of INDEX_KINDS; trained kinds stay flat until train_threshold vectors
+    kind: str = "ivf"
+    train_threshold: int = 50_000
+    # Inverted lists for IVF kinds, 0 picks about 4 * sqrt(n)
+    nlist: int = 0
+    nprobe: int = 16
+    # Sub-quantizers for IVFPQ, must divide the embedding dimension
+    pq_m: int = 64
+    hnsw_m: int = 32
+    ef_search: int = 64
+    # Memory-map the index file read-only on warm starts without changes
+    mmap: bool = False
+
+
+def create_index(dimension: int, config: IndexConfig, vectors=None):
+    """
+    Create an empty FAISS index for config, trained on vectors if it needs it.
+
+    Kinds that need training fall back to a flat index until enough vectors
+    are available.
+    """
+    if config.kind not in INDEX_KINDS:
+        raise ValueError(
+            f"Unknown index kind '{config.kind}', use one of {INDEX_KINDS}"
+        )
+    count = 0 if vectors is None else len(vectors)
+
+    if config.kind == "hnsw":
+        index = faiss.IndexHNSWFlat(dimension, config.hnsw_m)
+    elif config.kind in ("ivf", "ivfpq") and count >= config.train_threshold:
+        nlist = config.nlist or max(1, min(count // 39, int(4 * math.sqrt(count))))
+        quantizer = faiss.IndexFlatL2(dimension)
+        if config.kind == "ivf":
+            index = faiss.IndexIVFFlat(quantizer, dimension, nlist)
+        else:
+            index = faiss.IndexIVFPQ(quantizer, dimension, nlist, config.pq_m, 8)
+        index.train(np.ascontiguousarray(vectors, dtype=np.float32))
+        # Keep a direct map so vectors can be reconstructed on eviction
+        index.make_direct_map()
+    else:
+        index = faiss.IndexFlatL2(dimension)
+    apply_search_params(index, config)
+    return index
+
+
+def index_kind(index) -> str:
+    if isinstance(index, faiss.IndexHNSW):
+        return "hnsw"
+    ivf = faiss.try_extract_index_ivf(index)
+    if ivf is None:
+        return "flat"
+    return "ivfpq" if isinstance(faiss.downcast_index(ivf), faiss.IndexIVFPQ) else "ivf"
+
+
+def apply_search_params(index, config: IndexConfig):
+    ivf = faiss.try_extract_index_ivf(index)
+    if ivf is not None:
+        ivf.nprobe = config.nprobe
+    if isinstance(index, faiss.IndexHNSW):
+        index.hnsw.efSearch = config.ef_search
+
+
+def reconstruct_vectors(index, positions: List[int]) -> np.ndarray:
+    """Return stored vectors by position; approximate for PQ-compressed indexes."""
+    if not positions:
+        return np.zeros((0, index.d), dtype=np.float32)
+    ivf = faiss.try_extract_index_ivf(index)
+    if ivf is not None:
+        ivf.make_direct_map()
+    return index.reconstruct_batch(np.array(positions, dtype=np.int64)).reshape(
+        len(positions), index.d
+    )
+
+
+def rebuild_index(index, positions: List[int], config: IndexConfig):
+    """
+    Rebuild index keeping only the given positions, in the given order.
+
+    Trained indexes are cloned so their coarse quantizer is reused instead of
+    retrained; flat indexes are upgraded once positions reach train_threshold.
+    """
+    vectors = reconstruct_vectors(index, positions)
+    if index_kind(index) == config.kind and config.kind != "flat":
+        new_index = faiss.clone_index(index)
+        new_index.reset()
+        ivf = faiss.try_extract_index_ivf(new_index)
+        if ivf is not None:
+            ivf.make_direct_map()
+    else:
+        new_index = create_index(index.d, config, vectors)
+    apply_search_params(new_index, config)
+    if len(vectors):
+        new_index.add(vectors)
+    return new_index
+
+
+def maybe_upgrade_index(vectorstore: FAISS, config: IndexConfig) -> bool:
+    """Switch the index to the configured kind, training it once large enough."""
+    index = vectorstore.index
+    current_kind = index_kind(index)
+    if current_kind == config.kind:
+        return False
+    if (
+        current_kind == "flat"
+        and config.kind in ("ivf", "ivfpq")
+        and index.ntotal < config.train_threshold
+    ):
+        return False
+    vectorstore.index = rebuild_index(index, list(range(index.ntotal)), config)
+    log(
+        f"Converted the index from {current_kind} to {index_kind(vectorstore.index)} "
+        f"({index.ntotal} vectors)."
+    )
+    return True
+
+
+def vectorstore_lock(vectorstore: FAISS) -> threading.RLock:
+    """Lock held while a vectorstore is searched or updated in place."""
+    with _lock_guard:
+        if not hasattr(vectorstore, "update_lock"):
+            vectorstore.update_lock = threading.RLock()
+        return vectorstore.update_lock
+
+
+def vectorstore_version(vectorstore: FAISS) -> int:
+    """Counter bumped by mark_updated, so readers can refresh derived state."""
+    return getattr(vectorstore, "version", 0)
+
+
+def mark_updated(vectorstore: FAISS):
+    vectorstore.version = vectorstore_version(vectorstore) + 1
+
+
+def load_vectorstore(
+    index_dir: str,
+    embeddings: Embeddings,
+    config: IndexConfig,
+    index_name: str = "index",
+    mmap: bool = False,
+) -> FAISS:
+    """Load a vectorstore saved with save_local, optionally memory-mapping the index."""
+    index_path = os.path.join(index_dir, f"{index_name}.faiss")
+    if mmap:
+        index = faiss.read_index(
+            index_path, faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY
+        )
+    else:
+        index = faiss.read_index(index_path)
+    apply_search_params(index, config)
+    with open(os.path.join(index_dir, f"{index_name}.pkl"), "rb") as pickle_file:
+        docstore, index_to_docstore_id = pickle.load(pickle_file)
+    return FAISS(embeddings.embed_query, index, docstore, index_to_docstore_id)
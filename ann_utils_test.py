@@ -0,0 +1,80 @@
+import tempfile
+import unittest
+
+import numpy as np
+from langchain.docstore import InMemoryDocstore
+from langchain.embeddings import FakeEmbeddings
+from langchain.vectorstores import FAISS
+
+from ann_utils import (
+    IndexConfig,
+    create_index,
+    index_kind,
+    load_vectorstore,
+    maybe_upgrade_index,
+    rebuild_index,
+)
+
+DIMENSION = 16
+
+
+def random_vectors(count):
+    return np.random.default_rng(0).normal(size=(count, DIMENSION)).astype(np.float32)
+
+
+def vectorstore_with(vectors, config):
+    vectorstore = FAISS(
+        FakeEmbeddings(size=DIMENSION).embed_query,
+        create_index(DIMENSION, config),
+        InMemoryDocstore({}),
+        {},
+    )
+    vectorstore.add_embeddings([(str(i), list(v)) for i, v in enumerate(vectors)])
+    return vectorstore
+
+
+class TestIndexFactory(unittest.TestCase):
+    def test_trained_kinds_stay_flat_below_threshold(self):
+        config = IndexConfig(kind="ivf", train_threshold=500)
+        vectorstore = vectorstore_with(random_vectors(100), config)
+        self.assertFalse(maybe_upgrade_index(vectorstore, config))
+        self.assertEqual(index_kind(vectorstore.index), "flat")
+
+    def test_upgrade_keeps_positions(self):
+        config = IndexConfig(kind="ivf", train_threshold=500, nprobe=64)
+        vectors = random_vectors(1000)
+        vectorstore = vectorstore_with(vectors, config)
+
+        self.assertTrue(maybe_upgrade_index(vectorstore, config))
+        self.assertEqual(index_kind(vectorstore.index), "ivf")
+        _, labels = vectorstore.index.search(vectors[42:43], 1)
+        self.assertEqual(labels[0][0], 42)
+
+    def test_rebuild_keeps_kind_and_selected_vectors(self):
+        vectors = random_vectors(200)
+        config = IndexConfig(kind="hnsw")
+        index = create_index(DIMENSION, config)
+        index.add(vectors)
+
+        rebuilt = rebuild_index(index, [5, 7, 9], config)
+        self.assertEqual(index_kind(rebuilt), "hnsw")
+        np.testing.assert_allclose(rebuilt.reconstruct(1), vectors[7])
+
+    def test_mmap_load(self):
+        config = IndexConfig(kind="flat")
+        vectors = random_vectors(50)
+        vectorstore = vectorstore_with(vectors, config)
+        with tempfile.TemporaryDirectory() as index_dir:
+            vectorstore.save_local(index_dir)
+            loaded = load_vectorstore(
+                index_dir, FakeEmbeddings(size=DIMENSION), config, mmap=True
+            )
+            _, labels = loaded.index.search(vectors[3:4], 1)
+            self.assertEqual(
+                loaded.index_to_docstore_id[labels[0][0]],
+                vectorstore.index_to_docstore_id[3],
+            )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,82 @@
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Iterable, List, NamedTuple, TextIO
+
+from trace_utils import count, log, span
+
+
+class Objective(NamedTuple):
+    id: str
+    text: str
+
+
+def read_objectives(lines: Iterable[str]) -> List[Objective]:
+    """
+    Parse JSONL objectives.
+
+    Each line is either a JSON string or an object with an "objective" string
+    and an optional "id", which defaults to the line number.
+    """
+    objectives = []
+    for number, line in enumerate(lines, start=1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            item = json.loads(line)
+        except json.JSONDecodeError as e:
+            raise ValueError(f"Line {number} is not valid JSON: {e}") from e
+        if isinstance(item, str):
+            item = {"objective": item}
+        text = item.get("objective") if isinstance(item, dict) else None
+        if not isinstance(text, str) or not text.strip():
+            raise ValueError(f"Line {number} has no 'objective' string.")
+        objectives.append(Objective(str(item.get("id", number)), text.strip()))
+    return objectives
+
+
+def run_objectives(
+    objectives: List[Objective],
+    answer: Callable[[str], str],
+    output: TextIO,
+    concurrency: int = 1,
+) -> Dict:
+    """
+    Run objectives through answer, up to concurrency at a time.
+
+    Every result is written to output as one JSON line as soon as it is
+    done, so results arrive in completion order; the "id" ties them back to
+    the input. A failing objective is reported with an "error" and does not
+    stop the batch.
+    """
+    output_lock = threading.Lock()
+
+    def run(objective: Objective) -> Dict:
+        started = time.perf_counter()
+        result = {"id": objective.id, "objective": objective.text}
+        with span("batch.objective", id=objective.id):
+            try:
+                result["response"] = answer(objective.text)
+            except Exception as e:
+                result["error"] = f"{type(e).__name__}: {e}"
+                count("batch_failures")
+        result["seconds"] = round(time.perf_counter() - started, 3)
+        with output_lock:
+            output.write(json.dumps(result) + "\n")
+            output.flush()
+        log(
+            f"Objective {objective.id} "
+            f"{'failed' if 'error' in result else 'done'} in {result['seconds']}s"
+        )
+        return result
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=max(1, concurrency)) as executor:
+        results = list(executor.map(run, objectives))
+    return {
+        "objectives": len(results),
+        "failed": sum(1 for result in results if "error" in result),
+        "seconds": round(time.perf_counter() - started, 3),
+    }
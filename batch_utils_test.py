@@ -0,0 +1,98 @@
+import io
+import json
+import threading
+import time
+import unittest
+
+from batch_utils import Objective, read_objectives, run_objectives
+from main import parse_args
+
+
+class TestReadObjectives(unittest.TestCase):
+    def test_strings_and_objects(self):
+        lines = [
+            '"List the files"\n',
+            "\n",
+            '{"id": "fix", "objective": " Fix the bug "}\n',
+            '{"objective": "Add tests"}\n',
+        ]
+        self.assertEqual(
+            read_objectives(lines),
+            [
+                Objective("1", "List the files"),
+                Objective("fix", "Fix the bug"),
+                Objective("4", "Add tests"),
+            ],
+        )
+
+    def test_invalid_lines(self):
+        with self.assertRaisesRegex(ValueError, "Line 1 is not valid JSON"):
+            read_objectives(["List the files"])
+        with self.assertRaisesRegex(ValueError, "Line 2 has no 'objective'"):
+            read_objectives(['"ok"', '{"id": 3}'])
+        with self.assertRaisesRegex(ValueError, "Line 1 has no 'objective'"):
+            read_objectives(['["not", "an", "objective"]'])
+
+
+class TestRunObjectives(unittest.TestCase):
+    def test_results_and_failures(self):
+        def answer(text):
+            if text == "fail":
+                raise RuntimeError("no luck")
+            return text.upper()
+
+        output = io.StringIO()
+        objectives = [Objective("a", "hello"), Objective("b", "fail")]
+        summary = run_objectives(objectives, answer, output)
+
+        results = {
+            result["id"]: result
+            for result in map(json.loads, output.getvalue().splitlines())
+        }
+        self.assertEqual(results["a"]["response"], "HELLO")
+        self.assertEqual(results["b"]["error"], "RuntimeError: no luck")
+        self.assertNotIn("response", results["b"])
+        self.assertEqual(summary["objectives"], 2)
+        self.assertEqual(summary["failed"], 1)
+
+    def test_concurrency(self):
+        running = 0
+        peak = 0
+        lock = threading.Lock()
+
+        def answer(text):
+            nonlocal running, peak
+            with lock:
+                running += 1
+                peak = max(peak, running)
+            time.sleep(0.05)
+            with lock:
+                running -= 1
+            return text
+
+        objectives = [Objective(str(i), f"objective {i}") for i in range(6)]
+        output = io.StringIO()
+        summary = run_objectives(objectives, answer, output, concurrency=3)
+
+        self.assertEqual(peak, 3)
+        self.assertEqual(summary["failed"], 0)
+        self.assertEqual(len(output.getvalue().splitlines()), 6)
+
+
+class TestParseArgs(unittest.TestCase):
+    def test_batch_requires_repo(self):
+        with self.assertRaises(SystemExit):
+            parse_args(["--batch", "objectives.jsonl"])
+
+    def test_batch_options(self):
+        args = parse_args(
+            ["--repo", ".", "--batch", "-", "--concurrency", "4", "--no-watch"]
+        )
+        self.assertEqual(args.batch, "-")
+        self.assertEqual(args.concurrency, 4)
+        self.assertEqual(args.output, "-")
+        self.assertTrue(args.no_watch)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,310 @@
+import ast
+import os
+import re
+from typing import List, NamedTuple, Optional
+
+from langchain.docstore.document import Document
+from langchain.text_splitter import RecursiveCharacterTextSplitter
+
+DEFAULT_CHUNK_SIZE = 1500
+
+BRACE_LANGUAGE_EXTENSIONS = {
+    ".c",
+    ".cpp",
+    ".cs",
+    ".css",
+    ".go",
+    ".java",
+    ".js",
+    ".kt",
+    ".php",
+    ".rs",
+    ".scala",
+    ".swift",
+    ".ts",
+}
+INDENT_LANGUAGE_EXTENSIONS = {
+    ".bat",
+    ".clj",
+    ".eex",
+    ".erl",
+    ".ex",
+    ".exs",
+    ".fs",
+    ".hrl",
+    ".hs",
+    ".leex",
+    ".lua",
+    ".m",
+    ".ml",
+    ".mli",
+    ".pl",
+    ".r",
+    ".rb",
+    ".sh",
+    ".vb",
+}
+
+SYMBOL_PATTERN = re.compile(
+    r"\b(?:class|def|defmodule|defp?|enum|fn|func|function|impl|interface|"
+    r"module|object|struct|sub|trait|type)\s+([A-Za-z_][\w.:]*)"
+)
+CALLABLE_PATTERN = re.compile(r"^[\w<>\[\]:*&,\s]*?\b([A-Za-z_]\w*)\s*\(")
+# Quoted strings end on their line; an unmatched quote, such as a Rust
+# lifetime, is left as code
+QUOTED_STRING_PATTERNS = {
+    '"': re.compile(r'"(?:\\.|[^"\\])*"'),
+    "'": re.compile(r"'(?:\\.|[^'\\])*'"),
+}
+CLOSING_TOKENS = ("}", ")", "]", "end")
+CONTROL_KEYWORDS = {"if", "for", "while", "switch", "return", "catch", "elif"}
+
+
+class CodeUnit(NamedTuple):
+    start_line: int
+    end_line: int
+    symbols: List[str]
+
+
+def find_symbol(lines: List[str]) -> Optional[str]:
+    for line in lines:
+        stripped = line.strip()
+        if not stripped or stripped.startswith(("//", "#", "/*", "*", "--", "%")):
+            continue
+        match = SYMBOL_PATTERN.search(stripped) or CALLABLE_PATTERN.match(stripped)
+        if match and match.group(1) not in CONTROL_KEYWORDS:
+            return match.group(1)
+        return None
+    return None
+
+
+def python_units(lines: List[str], chunk_size: int) -> List[CodeUnit]:
+    tree = ast.parse("\n".join(lines))
+
+    def node_units(nodes, prefix: str, start_after: int, end_line: int):
+        units = []
+        previous_end = start_after
+        for node in nodes:
+            start = min(
+                [node.lineno]
+                + [
+                    decorator.lineno
+                    for decorator in getattr(node, "decorator_list", [])
+                ]
+            )
+            if start <= previous_end:
+                continue
+            # Leading comments and blank lines belong to the next definition
+            start = previous_end + 1
+            end = node.end_lineno
+            name = getattr(node, "name", None)
+            symbol = f"{prefix}{name}" if name else None
+            size = sum(len(line) + 1 for line in lines[start - 1 : end])
+            children = [
+                child
+                for child in getattr(node, "body", [])
+                if isinstance(
+                    child, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)
+                )
+            ]
+            if isinstance(node, ast.ClassDef) and size > chunk_size and children:
+                # Split large classes into a header and one unit per method
+                header_end = children[0].lineno - 1
+                for child in children:
+                    for decorator in child.decorator_list:
+                        header_end = min(header_end, decorator.lineno - 1)
+                units.append(CodeUnit(start, header_end, [symbol]))
+                units.extend(node_units(node.body, f"{symbol}.", header_end, end))
+            else:
+                units.append(CodeUnit(start, end, [symbol] if symbol else []))
+            previous_end = end
+        if units and previous_end < end_line:
+            last = units[-1]
+            units[-1] = CodeUnit(last.start_line, end_line, last.symbols)
+        return units
+
+    return node_units(tree.body, "", 0, len(lines))
+
+
+def brace_units(lines: List[str]) -> List[CodeUnit]:
+    units = []
+    depth = 0
+    start = 1
+    # None in code, otherwise "/*" or "`" while inside a block comment or a
+    # template literal, both of which can span lines
+    state = None
+    # Brace depth at which each open template literal's ${ began
+    interpolations: List[int] = []
+    for number, line in enumerate(lines, start=1):
+        position = 0
+        while position < len(line):
+            char = line[position]
+            if state == "/*":
+                if line.startswith("*/", position):
+                    state = None
+                    position += 1
+            elif state == "`":
+                if char == "\\":
+                    position += 1
+                elif char == "`":
+                    state = None
+                elif line.startswith("${", position):
+                    interpolations.append(depth)
+                    depth += 1
+                    state = None
+                    position += 1
+            elif line.startswith(("//", "#"), position):
+                break
+            elif line.startswith("/*", position):
+                state = "/*"
+                position += 1
+            elif char in QUOTED_STRING_PATTERNS:
+                match = QUOTED_STRING_PATTERNS[char].match(line, position)
+                if match:
+                    position = match.end() - 1
+            elif char == "`":
+                state = "`"
+            elif char == "{":
+                depth += 1
+            elif char == "}":
+                depth = max(0, depth - 1)
+                if interpolations and depth == interpolations[-1]:
+                    # The ${...} is closed, back inside its template literal
+                    interpolations.pop()
+                    state = "`"
+            position += 1
+        if depth == 0 and state is None and line.strip():
+            symbol = find_symbol(lines[start - 1 : number])
+            units.append(CodeUnit(start, number, [symbol] if symbol else []))
+            start = number + 1
+    if start <= len(lines):
+        units.append(CodeUnit(start, len(lines), []))
+    return units
+
+
+def indent_units(lines: List[str]) -> List[CodeUnit]:
+    boundaries = [1]
+    for number, line in enumerate(lines, start=1):
+        if (
+            number > 1
+            and line.strip()
+            and not line[0].isspace()
+            and not line.startswith(CLOSING_TOKENS)
+        ):
+            boundaries.append(number)
+    boundaries.append(len(lines) + 1)
+    units = []
+    for start, next_start in zip(boundaries, boundaries[1:]):
+        if next_start <= start:
+            continue
+        symbol = find_symbol(lines[start - 1 : next_start - 1])
+        units.append(CodeUnit(start, next_start - 1, [symbol] if symbol else []))
+    return units
+
+
+class CodeTextSplitter:
+    """
+    Split code along function and class boundaries instead of fixed sizes.
+
+    Python is split with the ast module, brace languages by brace depth and
+    other code by top-level indentation. Adjacent small definitions are merged
+    up to chunk_size and oversized ones are split by lines. Every chunk carries
+    its symbols and start/end lines in its metadata. Anything else falls back
+    to a RecursiveCharacterTextSplitter.
+    """
+
+    def __init__(self, chunk_size: int = DEFAULT_CHUNK_SIZE, fallback_splitter=None):
+        self.chunk_size = chunk_size
+        self.fallback_splitter = fallback_splitter or RecursiveCharacterTextSplitter(
+            chunk_size=1000, chunk_overlap=0
+        )
+
+    def split_documents(self, documents: List[Document]) -> List[Document]:
+        chunks = []
+        for document in documents:
+            chunks.extend(self.split_document(document))
+        return chunks
+
+    def split_document(self, document: Document) -> List[Document]:
+        source = document.metadata.get("source", "")
+        _, extension = os.path.splitext(source)
+        lines = document.page_content.split("\n")
+        units = self.code_units(lines, extension.lower())
+        if units is None:
+            return self.fallback_split(document, lines)
+
+        chunks = []
+        for unit in self.merge_units(self.limit_units(units, lines), lines):
+            content = "\n".join(lines[unit.start_line - 1 : unit.end_line])
+            if not content.strip():
+                continue
+            metadata = dict(document.metadata)
+            metadata.update(
+                {
+                    "symbols": ", ".join(unit.symbols),
+                    "start_line": unit.start_line,
+                    "end_line": unit.end_line,
+                }
+            )
+            chunks.append(Document(page_content=content, metadata=metadata))
+        return chunks
+
+    def code_units(self, lines: List[str], extension: str) -> Optional[List[CodeUnit]]:
+        if extension == ".py":
+            try:
+                return python_units(lines, self.chunk_size) or indent_units(lines)
+            except SyntaxError:
+                return indent_units(lines)
+        if extension in BRACE_LANGUAGE_EXTENSIONS:
+            return brace_units(lines)
+        if extension in INDENT_LANGUAGE_EXTENSIONS:
+            return indent_units(lines)
+        return None
+
+    def unit_size(self, unit: CodeUnit, lines: List[str]) -> int:
+        return sum(len(line) + 1 for line in lines[unit.start_line - 1 : unit.end_line])
+
+    def limit_units(self, units: List[CodeUnit], lines: List[str]) -> List[CodeUnit]:
+        limited = []
+        for unit in units:
+            start = unit.start_line
+            size = 0
+            for number in range(unit.start_line, unit.end_line + 1):
+                line_size = len(lines[number - 1]) + 1
+                if size and size + line_size > self.chunk_size:
+                    limited.append(CodeUnit(start, number - 1, unit.symbols))
+                    start, size = number, 0
+                size += line_size
+            limited.append(CodeUnit(start, unit.end_line, unit.symbols))
+        return limited
+
+    def merge_units(self, units: List[CodeUnit], lines: List[str]) -> List[CodeUnit]:
+        merged = []
+        size = 0
+        for unit in units:
+            unit_size = self.unit_size(unit, lines)
+            if merged and size + unit_size <= self.chunk_size:
+                last = merged[-1]
+                symbols = last.symbols + [
+                    symbol for symbol in unit.symbols if symbol not in last.symbols
+                ]
+                merged[-1] = CodeUnit(last.start_line, unit.end_line, symbols)
+                size += unit_size
+            else:
+                merged.append(unit)
+                size = unit_size
+        return merged
+
+    def fallback_split(self, document: Document, lines: List[str]) -> List[Document]:
+        chunks = self.fallback_splitter.split_documents([document])
+        # Recover line ranges by locating each chunk after the previous one
+        position = 0
+        for chunk in chunks:
+            found = document.page_content.find(chunk.page_content, position)
+            if found == -1:
+                continue
+            start_line = document.page_content.count("\n", 0, found) + 1
+            chunk.metadata["start_line"] = start_line
+            chunk.metadata["end_line"] = start_line + chunk.page_content.count("\n")
+            position = found + len(chunk.page_content)
+        return chunks
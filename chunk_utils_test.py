@@ -0,0 +1,80 @@
+import unittest
+
+from langchain.docstore.document import Document
+
+from chunk_utils import CodeTextSplitter, brace_units
+
+
+def split(content, source, chunk_size=200):
+    document = Document(page_content=content, metadata={"source": source})
+    return CodeTextSplitter(chunk_size=chunk_size).split_documents([document])
+
+
+class TestCodeTextSplitter(unittest.TestCase):
+    def test_python_functions_are_not_cut(self):
+        body = "\n".join(f"    value_{i} = {i}" for i in range(8))
+        content = f"import os\n\n\ndef first():\n{body}\n\n\n@decorator\ndef second():\n{body}\n"
+        chunks = split(content, "module.py")
+
+        self.assertEqual(len(chunks), 2)
+        self.assertEqual(chunks[0].metadata["symbols"], "first")
+        self.assertTrue(chunks[0].page_content.startswith("import os"))
+        self.assertEqual(chunks[1].metadata["symbols"], "second")
+        self.assertIn("@decorator\ndef second():", chunks[1].page_content)
+        self.assertEqual(chunks[1].metadata["end_line"], content.count("\n") + 1)
+
+    def test_large_python_class_is_split_by_method(self):
+        body = "\n".join(f"        value_{i} = {i}" for i in range(8))
+        content = f"class Agent:\n    name = 'a'\n\n    def run(self):\n{body}\n\n    def stop(self):\n{body}\n"
+        chunks = split(content, "agent.py")
+
+        symbols = [chunk.metadata["symbols"] for chunk in chunks]
+        self.assertEqual(symbols, ["Agent", "Agent.run", "Agent.stop"])
+        self.assertEqual(chunks[2].metadata["start_line"], 13)
+
+    def test_brace_language_units(self):
+        content = 'function foo() {\n  return "}";\n}\n\nclass Bar {\n  m() {}\n}\n'
+        chunks = split(content, "main.js", chunk_size=40)
+
+        self.assertEqual(
+            [(c.metadata["symbols"], c.metadata["start_line"]) for c in chunks],
+            [("foo", 1), ("Bar", 4)],
+        )
+
+    def test_template_literals_in_brace_languages(self):
+        content = (
+            "class View {\n"
+            "  render(user) {\n"
+            "    const css = `.card { color: red;`;\n"
+            "    return `<div class=${css}>\n"
+            "      ${user.items.map((item) => { return `<b>${item.name}}</b>`; })}\n"
+            "      ${ {a: 1}.a } }\n"
+            "    </div>`;\n"
+            "  }\n"
+            "}\n"
+            "\n"
+            "function after(x) {\n"
+            "  return `${x}`;\n"
+            "}\n"
+        )
+        units = brace_units(content.split("\n"))
+
+        # Braces inside the template literals do not end the class early
+        self.assertEqual(
+            [(unit.symbols, unit.start_line, unit.end_line) for unit in units[:2]],
+            [(["View"], 1, 9), (["after"], 10, 13)],
+        )
+
+    def test_other_files_fall_back_with_line_ranges(self):
+        content = "\n".join(f"paragraph {i}" for i in range(300))
+        chunks = split(content, "notes.md")
+
+        self.assertGreater(len(chunks), 1)
+        self.assertEqual(chunks[0].metadata["start_line"], 1)
+        self.assertEqual(
+            chunks[1].metadata["start_line"], chunks[0].metadata["end_line"] + 1
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,33 @@
+import os
+from typing import Optional
+
+# tkinter is imported on use, so this module stays cheap to import and the
+# dialogs can be shown while the agent's dependencies load in the background
+
+
+def select_project_repository():
+    import tkinter as tk
+    from tkinter import filedialog
+
+    root = tk.Tk()
+    root.withdraw()  # Hide the main window to only show the file dialog
+    folder_path = filedialog.askdirectory(title="Select the project repository")
+    # If nothing is selected it returns the project directory
+    return folder_path
+
+
+def select_ignore_file(initial_dir: Optional[str] = None):
+    import tkinter as tk
+    from tkinter import filedialog
+
+    root = tk.Tk()
+    root.withdraw()  # Hide the main window to only show the file dialog
+    file_path = filedialog.askopenfilename(
+        title="Select the ignore file",
+        filetypes=[("All files", "*.*")],  # Show all files, including hidden files
+        initialdir=initial_dir
+        or os.path.expanduser(
+            "~"
+        ),  # Start at the given directory or user's home directory
+    )
+    return file_path if file_path else None
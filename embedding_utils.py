@@ -0,0 +1,366 @@
+import asyncio
+import hashlib
+import os
+import random
+import sqlite3
+import threading
+import time
+from array import array
+from typing import Dict, List, Optional
+
+from langchain.embeddings import OpenAIEmbeddings
+from langchain.embeddings.base import Embeddings
+
+from trace_utils import count
+
+DEFAULT_CACHE_PATH = os.path.join(
+    os.path.expanduser("~"), ".recurgpt", "embeddings.sqlite"
+)
+DEFAULT_MAX_ENTRIES = 500_000
+# SQLite caps the number of bound parameters per statement
+LOOKUP_BATCH_SIZE = 500
+RETRYABLE_STATUS_CODES = {429, 500, 502, 503, 504}
+RETRYABLE_ERROR_NAMES = {
+    "RateLimitError",
+    "Timeout",
+    "APIConnectionError",
+    "ServiceUnavailableError",
+}
+
+_shared_embeddings = None
+
+
+def text_hash(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+class CachedEmbeddings(Embeddings):
+    """
+    Embeddings wrapper backed by a local SQLite store keyed by (model, text hash).
+
+    Lookups are batched, only misses are sent to the underlying embeddings and
+    the least recently used vectors are evicted once max_entries is exceeded.
+    """
+
+    def __init__(
+        self,
+        embeddings: Embeddings,
+        cache_path: str = DEFAULT_CACHE_PATH,
+        max_entries: int = DEFAULT_MAX_ENTRIES,
+        model: Optional[str] = None,
+    ):
+        self.embeddings = embeddings
+        self.model = model or getattr(embeddings, "model", type(embeddings).__name__)
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+        if cache_path != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(cache_path)), exist_ok=True)
+        self._connection = sqlite3.connect(cache_path, check_same_thread=False)
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings ("
+            "model TEXT NOT NULL, hash TEXT NOT NULL, vector BLOB NOT NULL, "
+            "last_used REAL NOT NULL, PRIMARY KEY (model, hash))"
+        )
+        self._connection.execute(
+            "CREATE INDEX IF NOT EXISTS embeddings_last_used "
+            "ON embeddings (last_used)"
+        )
+        self._connection.commit()
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        hashes = [text_hash(text) for text in texts]
+        cached = self._lookup(hashes)
+
+        missing = {}
+        for text, digest in zip(texts, hashes):
+            if digest not in cached and digest not in missing:
+                missing[digest] = text
+        self.hits += len(texts) - len(missing)
+        self.misses += len(missing)
+        count("embedding_cache_hits", len(texts) - len(missing))
+        count("embedding_cache_misses", len(missing))
+
+        if missing:
+            vectors = self.embeddings.embed_documents(list(missing.values()))
+            new_vectors = dict(zip(missing.keys(), vectors))
+            self._store(new_vectors)
+            cached.update(new_vectors)
+
+        return [list(cached[digest]) for digest in hashes]
+
+    def embed_query(self, text: str) -> List[float]:
+        digest = text_hash(text)
+        cached = self._lookup([digest])
+        if digest in cached:
+            self.hits += 1
+            count("embedding_cache_hits")
+            return list(cached[digest])
+        self.misses += 1
+        count("embedding_cache_misses")
+        vector = self.embeddings.embed_query(text)
+        self._store({digest: vector})
+        return vector
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            (entries,) = self._connection.execute(
+                "SELECT COUNT(*) FROM embeddings"
+            ).fetchone()
+        return {"hits": self.hits, "misses": self.misses, "entries": entries}
+
+    def _lookup(self, hashes: List[str]) -> Dict[str, List[float]]:
+        found = {}
+        unique = list(dict.fromkeys(hashes))
+        now = time.time()
+        with self._lock:
+            for start in range(0, len(unique), LOOKUP_BATCH_SIZE):
+                batch = unique[start : start + LOOKUP_BATCH_SIZE]
+                placeholders = ",".join("?" * len(batch))
+                rows = self._connection.execute(
+                    f"SELECT hash, vector FROM embeddings "
+                    f"WHERE model = ? AND hash IN ({placeholders})",
+                    [self.model, *batch],
+                ).fetchall()
+                for digest, blob in rows:
+                    found[digest] = array("f", blob).tolist()
+                self._connection.execute(
+                    f"UPDATE embeddings SET last_used = ? "
+                    f"WHERE model = ? AND hash IN ({placeholders})",
+                    [now, self.model, *batch],
+                )
+            self._connection.commit()
+        return found
+
+    def _store(self, vectors: Dict[str, List[float]]):
+        now = time.time()
+        with self._lock:
+            self._connection.executemany(
+                "INSERT OR REPLACE INTO embeddings VALUES (?, ?, ?, ?)",
+                [
+                    (self.model, digest, array("f", vector).tobytes(), now)
+                    for digest, vector in vectors.items()
+                ],
+            )
+            self._evict()
+            self._connection.commit()
+
+    def _evict(self):
+        (entries,) = self._connection.execute(
+            "SELECT COUNT(*) FROM embeddings"
+        ).fetchone()
+        overflow = entries - self.max_entries
+        if overflow > 0:
+            self._connection.execute(
+                "DELETE FROM embeddings WHERE rowid IN ("
+                "SELECT rowid FROM embeddings ORDER BY last_used LIMIT ?)",
+                (overflow,),
+            )
+
+
+def estimate_tokens(text: str) -> int:
+    # Roughly four characters per token for English text and code
+    return max(1, len(text) // 4)
+
+
+def is_rate_limit_error(error: Exception) -> bool:
+    return (
+        getattr(error, "http_status", None) == 429
+        or type(error).__name__ == "RateLimitError"
+    )
+
+
+def is_retryable_error(error: Exception) -> bool:
+    return (
+        getattr(error, "http_status", None) in RETRYABLE_STATUS_CODES
+        or type(error).__name__ in RETRYABLE_ERROR_NAMES
+    )
+
+
+def retry_after_seconds(error: Exception) -> Optional[float]:
+    headers = getattr(error, "headers", None) or {}
+    try:
+        return float(headers.get("retry-after"))
+    except (TypeError, ValueError):
+        return None
+
+
+def run_sync(coroutine):
+    """Run a coroutine to completion, even when called from inside an event loop."""
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return asyncio.run(coroutine)
+    result = {}
+
+    def target():
+        try:
+            result["value"] = asyncio.run(coroutine)
+        except BaseException as e:
+            result["error"] = e
+
+    thread = threading.Thread(target=target)
+    thread.start()
+    thread.join()
+    if "error" in result:
+        raise result["error"]
+    return result["value"]
+
+
+class TokenBucket:
+    """Token bucket limiter refilled continuously at rate units per second."""
+
+    def __init__(self, rate: float, capacity: Optional[float] = None):
+        self.rate = rate
+        self.capacity = capacity or rate
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _try_acquire(self, amount: float) -> float:
+        """Take amount if available and return 0, otherwise return the wait time."""
+        with self._lock:
+            now = time.monotonic()
+            self.tokens = min(
+                self.capacity, self.tokens + (now - self.updated) * self.rate
+            )
+            self.updated = now
+            if self.tokens >= amount:
+                self.tokens -= amount
+                return 0
+            return (amount - self.tokens) / self.rate
+
+    async def acquire(self, amount: float = 1):
+        amount = min(amount, self.capacity)
+        while True:
+            wait = self._try_acquire(amount)
+            if not wait:
+                return
+            await asyncio.sleep(wait)
+
+
+class EmbeddingScheduler:
+    """
+    Embed texts with several batches in flight at once.
+
+    Batches are packed up to a token budget, requests are paced by token and
+    request buckets, and retryable errors are retried with exponential backoff.
+    A rate limit halves the token budget for the following batches, and each
+    success grows it back towards max_tokens_per_batch.
+    """
+
+    def __init__(
+        self,
+        embeddings: Embeddings,
+        max_in_flight: int = 4,
+        max_tokens_per_batch: int = 8000,
+        min_tokens_per_batch: int = 500,
+        max_batch_size: int = 256,
+        tokens_per_minute: int = 1_000_000,
+        requests_per_minute: int = 3000,
+        max_retries: int = 6,
+        backoff_base: float = 1.0,
+        backoff_max: float = 60.0,
+    ):
+        self.embeddings = embeddings
+        self.max_in_flight = max_in_flight
+        self.max_tokens_per_batch = max_tokens_per_batch
+        self.min_tokens_per_batch = min_tokens_per_batch
+        self.max_batch_size = max_batch_size
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.token_bucket = TokenBucket(tokens_per_minute / 60, tokens_per_minute)
+        self.request_bucket = TokenBucket(requests_per_minute / 60, requests_per_minute)
+        self.token_budget = max_tokens_per_batch
+        self.requests = 0
+        self.retries = 0
+
+    def _take_batch(self, texts: List[str], start: int) -> int:
+        end = start
+        tokens = 0
+        while end < len(texts) and end - start < self.max_batch_size:
+            tokens += estimate_tokens(texts[end])
+            if tokens > self.token_budget and end > start:
+                break
+            end += 1
+        return end
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        results = [None] * len(texts)
+        position = 0
+
+        async def worker():
+            nonlocal position
+            while position < len(texts):
+                start = position
+                position = end = self._take_batch(texts, start)
+                results[start:end] = await self._embed_batch(texts[start:end])
+
+        await asyncio.gather(*(worker() for _ in range(self.max_in_flight)))
+        return results
+
+    async def _embed_batch(self, batch: List[str]) -> List[List[float]]:
+        tokens = sum(estimate_tokens(text) for text in batch)
+        for attempt in range(self.max_retries + 1):
+            await self.request_bucket.acquire(1)
+            await self.token_bucket.acquire(tokens)
+            self.requests += 1
+            count("embedding_requests")
+            try:
+                vectors = await self._call(batch)
+            except Exception as e:
+                if attempt == self.max_retries or not is_retryable_error(e):
+                    raise
+                self.retries += 1
+                count("embedding_retries")
+                if is_rate_limit_error(e):
+                    self.token_budget = max(
+                        self.min_tokens_per_batch, self.token_budget // 2
+                    )
+                delay = retry_after_seconds(e)
+                if delay is None:
+                    delay = min(self.backoff_max, self.backoff_base * 2**attempt)
+                    delay *= 0.5 + random.random() / 2
+                await asyncio.sleep(delay)
+                continue
+            self.token_budget = min(
+                self.max_tokens_per_batch,
+                self.token_budget + self.max_tokens_per_batch // 8,
+            )
+            return vectors
+
+    async def _call(self, batch: List[str]) -> List[List[float]]:
+        aembed_documents = getattr(self.embeddings, "aembed_documents", None)
+        if aembed_documents is not None:
+            return await aembed_documents(batch)
+        return await asyncio.to_thread(self.embeddings.embed_documents, batch)
+
+
+class ScheduledEmbeddings(Embeddings):
+    """Synchronous Embeddings facade that sends documents through a scheduler."""
+
+    def __init__(self, embeddings: Embeddings, **scheduler_kwargs):
+        self.embeddings = embeddings
+        self.model = getattr(embeddings, "model", type(embeddings).__name__)
+        self.scheduler = EmbeddingScheduler(embeddings, **scheduler_kwargs)
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        if not texts:
+            return []
+        return run_sync(self.scheduler.aembed_documents(texts))
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embeddings.embed_query(text)
+
+
+def get_embeddings() -> CachedEmbeddings:
+    """Return the process-wide cached embeddings shared by every vectorstore."""
+    global _shared_embeddings
+    if _shared_embeddings is None:
+        # Retries are handled by the scheduler so rate limits reach its backoff
+        openai_embeddings = OpenAIEmbeddings(max_retries=1)
+        _shared_embeddings = CachedEmbeddings(ScheduledEmbeddings(openai_embeddings))
+    return _shared_embeddings
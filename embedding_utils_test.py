@@ -0,0 +1,126 @@
+import asyncio
+import unittest
+from typing import List
+
+from langchain.embeddings.base import Embeddings
+
+from embedding_utils import CachedEmbeddings, EmbeddingScheduler, ScheduledEmbeddings
+
+
+class FakeBackend(Embeddings):
+    def __init__(self):
+        self.calls = []
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        self.calls.append(list(texts))
+        return [[float(len(text)), 1.0] for text in texts]
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embed_documents([text])[0]
+
+
+class TestCachedEmbeddings(unittest.TestCase):
+    def setUp(self):
+        self.backend = FakeBackend()
+        self.embeddings = CachedEmbeddings(
+            self.backend, cache_path=":memory:", max_entries=3, model="fake"
+        )
+
+    def test_only_misses_are_embedded(self):
+        first = self.embeddings.embed_documents(["a", "bb", "a"])
+        self.assertEqual(first, [[1.0, 1.0], [2.0, 1.0], [1.0, 1.0]])
+        self.assertEqual(self.backend.calls, [["a", "bb"]])
+
+        second = self.embeddings.embed_documents(["bb", "ccc"])
+        self.assertEqual(second, [[2.0, 1.0], [3.0, 1.0]])
+        self.assertEqual(self.backend.calls[-1], ["ccc"])
+        self.assertEqual(self.embeddings.embed_query("a"), [1.0, 1.0])
+
+        stats = self.embeddings.stats()
+        self.assertEqual((stats["hits"], stats["misses"]), (3, 3))
+
+    def test_evicts_least_recently_used(self):
+        for text in ["a", "bb", "ccc"]:
+            self.embeddings.embed_query(text)
+        self.embeddings.embed_query("a")
+        self.embeddings.embed_query("dddd")
+        self.assertEqual(self.embeddings.stats()["entries"], 3)
+
+        self.backend.calls.clear()
+        self.embeddings.embed_documents(["a", "bb"])
+        self.assertEqual(self.backend.calls, [["bb"]])
+
+
+class RateLimitError(Exception):
+    http_status = 429
+
+
+class SlowBackend(Embeddings):
+    """Async stub with injected latency that rate limits its first request."""
+
+    def __init__(self, latency=0.01, rate_limited_requests=1):
+        self.latency = latency
+        self.rate_limited_requests = rate_limited_requests
+        self.in_flight = 0
+        self.peak_in_flight = 0
+        self.batch_sizes = []
+
+    async def aembed_documents(self, texts):
+        self.in_flight += 1
+        self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+        try:
+            await asyncio.sleep(self.latency)
+            if self.rate_limited_requests:
+                self.rate_limited_requests -= 1
+                raise RateLimitError("Rate limit reached")
+            self.batch_sizes.append(len(texts))
+            return [[float(len(text))] for text in texts]
+        finally:
+            self.in_flight -= 1
+
+    def embed_documents(self, texts):
+        raise AssertionError("the scheduler should use aembed_documents")
+
+    def embed_query(self, text):
+        return [float(len(text))]
+
+
+class TestEmbeddingScheduler(unittest.TestCase):
+    def test_concurrent_batches_keep_order_and_retry(self):
+        backend = SlowBackend()
+        scheduler = EmbeddingScheduler(
+            backend,
+            max_in_flight=3,
+            max_tokens_per_batch=40,
+            min_tokens_per_batch=10,
+            backoff_base=0.001,
+        )
+        texts = ["x" * (i % 7 * 4 + 4) for i in range(40)]
+
+        vectors = asyncio.run(scheduler.aembed_documents(texts))
+
+        self.assertEqual(vectors, [[float(len(text))] for text in texts])
+        self.assertEqual(scheduler.retries, 1)
+        self.assertEqual(backend.peak_in_flight, 3)
+        self.assertTrue(all(size <= 40 for size in backend.batch_sizes))
+
+    def test_sync_facade_from_running_loop(self):
+        embeddings = ScheduledEmbeddings(SlowBackend(rate_limited_requests=0))
+
+        async def embed():
+            return embeddings.embed_documents(["ab", "c"])
+
+        self.assertEqual(asyncio.run(embed()), [[2.0], [1.0]])
+
+    def test_non_retryable_errors_are_raised(self):
+        class BrokenBackend(SlowBackend):
+            async def aembed_documents(self, texts):
+                raise ValueError("bad input")
+
+        scheduler = EmbeddingScheduler(BrokenBackend(), backoff_base=0.001)
+        with self.assertRaises(ValueError):
+            asyncio.run(scheduler.aembed_documents(["a"]))
+
+
+if __name__ == "__main__":
+    unittest.main()
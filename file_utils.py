@@ -1,52 +1,315 @@
-import fnmatch
 import os
-import tkinter as tk
-from tkinter import filedialog
-from typing import List, Optional
-
-import nltk
-from langchain.document_loaders import DirectoryLoader, UnstructuredFileLoader
-from langchain.embeddings import OpenAIEmbeddings
+import posixpath
+import stat
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from functools import lru_cache
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+from langchain.document_loaders import UnstructuredFileLoader
 from langchain.text_splitter import RecursiveCharacterTextSplitter
 from langchain.vectorstores import FAISS, Chroma
 
-nltk.download("averaged_perceptron_tagger")
-
-
-def select_project_repository():
-    root = tk.Tk()
-    root.withdraw()  # Hide the main window to only show the file dialog
-    folder_path = filedialog.askdirectory(title="Select the project repository")
-    # If nothing is selected it returns the project directory
-    return folder_path
+from chunk_utils import CodeTextSplitter
+from dialog_utils import select_ignore_file, select_project_repository
+from embedding_utils import estimate_tokens, get_embeddings
+from ignore_utils import IgnoreMatcher, to_relative_path
+from trace_utils import count, log, span, tracer
+
+# Number of chunks embedded and added to the vectorstore per request
+DEFAULT_BATCH_SIZE = 256
+
+# NLTK data used by unstructured's partitioning, by download name and path
+NLTK_RESOURCES = {
+    "punkt": "tokenizers/punkt",
+    "averaged_perceptron_tagger": "taggers/averaged_perceptron_tagger",
+}
+
+# Define code file extensions that you want to support
+CODE_FILE_EXTENSIONS = {
+    ".cpp",
+    ".c",
+    ".cs",
+    ".py",
+    ".js",
+    ".java",
+    ".rb",
+    ".XML",
+    ".manifest",
+    ".html",
+    ".css",
+    ".php",
+    ".sql",
+    ".go",
+    ".swift",
+    ".ts",
+    ".kt",
+    ".rs",
+    ".hs",
+    ".scala",
+    ".clj",
+    ".lua",
+    ".m",
+    ".r",
+    ".sh",
+    ".bat",
+    ".vb",
+    ".pl",
+    ".fs",
+    ".ml",
+    ".mli",
+    ".erl",
+    ".hrl",
+    ".ex",
+    ".exs",
+    ".eex",
+    ".leex",
+    ".yml",
+    ".yaml",
+    ".json",
+    ".toml",
+    ".ini",
+    ".conf",
+    ".cfg",
+    ".prefs",
+    ".properties",
+    ".asciidoc",
+    ".adoc",
+    ".asc",
+    ".md",
+    ".markdown",
+    ".rst",
+    ".txt",
+    ".tex",
+    ".bib",
+    ".bibliography",
+    ".bib",
+}
+
+
+@lru_cache(maxsize=None)
+def ensure_nltk_data():
+    """Download the NLTK data unstructured needs, once and only if missing."""
+    import nltk
+
+    for name, path in NLTK_RESOURCES.items():
+        try:
+            nltk.data.find(path)
+        except LookupError:
+            nltk.download(name, quiet=True)
+
+
+def load_documents_from_repository(
+    folder_path: str,
+    ignore_file: Optional[str] = None,
+    parallel: bool = True,
+    max_workers: Optional[int] = None,
+    symbol_index=None,
+    trigram_index=None,
+):
+    with span("load_documents", folder=folder_path, parallel=parallel) as current:
+        documents = _load_documents(
+            folder_path,
+            ignore_file,
+            parallel,
+            max_workers,
+            symbol_index,
+            trigram_index,
+        )
+        current.set(documents=len(documents))
+    return documents
 
 
-def select_ignore_file(initial_dir: Optional[str] = None):
-    root = tk.Tk()
-    root.withdraw()  # Hide the main window to only show the file dialog
-    file_path = filedialog.askopenfilename(
-        title="Select the ignore file",
-        filetypes=[("All files", "*.*")],  # Show all files, including hidden files
-        initialdir=initial_dir
-        or os.path.expanduser(
-            "~"
-        ),  # Start at the given directory or user's home directory
+def _load_documents(
+    folder_path, ignore_file, parallel, max_workers, symbol_index, trigram_index
+):
+    ignore_patterns = read_gitignore_and_exclude(folder_path, ignore_file)
+    file_paths = walk_repository(folder_path, ignore_patterns)
+    if parallel:
+        loaded, timings = load_files(
+            file_paths, folder_path, ignore_patterns, max_workers
+        )
+    else:
+        loaded, timings = {}, []
+        for file_path in file_paths:
+            loaded[file_path], seconds = _load_file(
+                file_path, folder_path, ignore_patterns
+            )
+            timings.append((file_path, seconds))
+    report_load_timings(timings)
+    if symbol_index is not None:
+        for file_path in file_paths:
+            symbol_index.add_file(
+                file_path, document_text(file_path, loaded[file_path])
+            )
+    if trigram_index is not None:
+        for file_path in file_paths:
+            trigram_index.add_file(file_path)
+    return [document for file_path in file_paths for document in loaded[file_path]]
+
+
+def iter_documents_from_repository(
+    folder_path: str,
+    ignore_file: Optional[str] = None,
+    max_workers: Optional[int] = None,
+) -> Iterator:
+    """Streaming counterpart of load_documents_from_repository."""
+    ignore_patterns = read_gitignore_and_exclude(folder_path, ignore_file)
+    file_paths = walk_repository(folder_path, ignore_patterns)
+    for _, documents, _ in iter_loaded_files(
+        file_paths, folder_path, ignore_patterns, max_workers
+    ):
+        yield from documents
+
+
+def walk_repository(folder_path: str, ignore_patterns: List[str]) -> List[str]:
+    """
+    Walk the repository once and return every non-ignored file in sorted order.
+
+    Ignored directories are pruned instead of visited, and nested .gitignore
+    files apply to their own subtree.
+    """
+    ignore_patterns = tuple(ignore_patterns)
+    file_paths = []
+    for root, directories, file_names in os.walk(folder_path):
+        relative_root = to_relative_path(root, folder_path)
+        relative_root = "" if relative_root == "." else relative_root
+        matcher = directory_matcher(folder_path, relative_root, ignore_patterns)
+
+        prefix = f"{relative_root}/" if relative_root else ""
+        directories[:] = [
+            directory
+            for directory in sorted(directories)
+            if not matcher.match(prefix + directory, is_dir=True)
+        ]
+        for file_name in sorted(file_names):
+            if not matcher.match(prefix + file_name):
+                file_paths.append(os.path.join(root, file_name))
+    return file_paths
+
+
+def is_plain_text_file(file_path: str) -> bool:
+    _, file_extension = os.path.splitext(file_path)
+    return file_extension.lower() in CODE_FILE_EXTENSIONS
+
+
+def document_text(file_path: str, documents: List) -> str:
+    """Return the source text of a plain text file, used for symbol extraction."""
+    if not is_plain_text_file(file_path):
+        return ""
+    return "\n".join(document.page_content for document in documents)
+
+
+def _load_file(
+    file_path: str, folder_path: str, ignore_patterns: List[str]
+) -> Tuple[List, float]:
+    # Module level so it can be pickled into the process pool
+    start = time.perf_counter()
+    try:
+        loader = CustomUnstructuredFileLoader(file_path, folder_path, ignore_patterns)
+        documents = loader.load()
+    except Exception as e:
+        log(f"Error while loading file: {file_path}. Error: {e}")
+        documents = []
+    return documents, time.perf_counter() - start
+
+
+def iter_loaded_files(
+    file_paths: List[str],
+    folder_path: str,
+    ignore_patterns: List[str],
+    max_workers: Optional[int] = None,
+    max_pending: Optional[int] = None,
+    use_processes: bool = True,
+) -> Iterator[Tuple[str, List, float]]:
+    """
+    Load files concurrently and yield (file_path, documents, seconds) in order.
+
+    Plain text files are read on a thread pool, PDFs and other formats that go
+    through unstructured are partitioned on a process pool. At most max_pending
+    files are loaded ahead of the consumer, so a slow consumer (e.g. embedding)
+    applies back-pressure to loading and memory stays bounded.
+
+    Pass use_processes=False when calling from a background thread: forking a
+    multithreaded process can deadlock the child, so everything is loaded on
+    the thread pool instead.
+    """
+    max_workers = max_workers or os.cpu_count() or 1
+    max_pending = max_pending or max_workers * 2
+    file_paths = iter(file_paths)
+
+    # Worker processes are only spawned on the first submit
+    with ThreadPoolExecutor(
+        max_workers=max_workers
+    ) as thread_pool, ProcessPoolExecutor(max_workers=max_workers) as process_pool:
+
+        def in_process(file_path):
+            return use_processes and not is_plain_text_file(file_path)
+
+        def submit(file_path):
+            pool = process_pool if in_process(file_path) else thread_pool
+            future = pool.submit(_load_file, file_path, folder_path, ignore_patterns)
+            pending.append((file_path, future))
+
+        pending = deque()
+        for file_path in file_paths:
+            submit(file_path)
+            if len(pending) >= max_pending:
+                break
+        while pending:
+            file_path, future = pending.popleft()
+            documents, seconds = future.result()
+            record_loaded_file(file_path, seconds, in_process(file_path))
+            next_path = next(file_paths, None)
+            if next_path is not None:
+                submit(next_path)
+            yield file_path, documents, seconds
+
+
+def record_loaded_file(file_path: str, seconds: float, in_process: bool):
+    # Files are loaded on worker threads and processes, so the span is
+    # recorded here from the time the worker measured
+    tracer.record(
+        "load_file",
+        time.perf_counter() - seconds,
+        seconds,
+        {
+            "file": file_path,
+            "pool": "process" if in_process else "thread",
+        },
     )
-    return file_path if file_path else None
+    count("files_loaded")
+    try:
+        count("bytes_read", os.path.getsize(file_path))
+    except OSError:
+        pass
+
+
+def load_files(
+    file_paths: List[str],
+    folder_path: str,
+    ignore_patterns: List[str],
+    max_workers: Optional[int] = None,
+) -> Tuple[Dict[str, List], List[Tuple[str, float]]]:
+    """Load files concurrently and return their documents keyed by file path."""
+    loaded = {}
+    timings = []
+    for file_path, documents, seconds in iter_loaded_files(
+        file_paths, folder_path, ignore_patterns, max_workers, len(file_paths)
+    ):
+        loaded[file_path] = documents
+        timings.append((file_path, seconds))
+    return loaded, timings
 
 
-def load_documents_from_repository(folder_path: str, ignore_file: Optional[str] = None):
-    ignore_patterns = read_gitignore_and_exclude(folder_path, ignore_file)
-    loader = DirectoryLoader(
-        path=folder_path,
-        glob="**/*",
-        load_hidden=True,
-        recursive=True,
-        loader_cls=CustomUnstructuredFileLoader,
-        loader_kwargs={"folder_path": folder_path, "ignore_patterns": ignore_patterns},
-    )
-    documents = loader.load()
-    return documents
+def report_load_timings(timings: List[Tuple[str, float]], slowest: int = 10):
+    total = sum(seconds for _, seconds in timings)
+    log(f"Loaded {len(timings)} files ({total:.2f}s of loader time).")
+    for file_path, seconds in sorted(timings, key=lambda t: t[1], reverse=True)[
+        :slowest
+    ]:
+        log(f"  {seconds * 1000:8.1f} ms  {file_path}")
 
 
 def read_gitignore_and_exclude(
@@ -62,23 +325,75 @@ def read_gitignore_and_exclude(
 
     for file_path in file_paths:
         if os.path.exists(file_path):
-            with open(file_path, "r", errors="replace") as ignore_file:
-                patterns = [
-                    line.strip()
-                    for line in ignore_file
-                    if line.strip() and not line.startswith("#")
-                ]
-                ignore_patterns.extend(patterns)
+            ignore_patterns.extend(read_ignore_file(file_path))
 
     return ignore_patterns
 
 
-def is_ignored(file_path: str, folder_path: str, ignore_patterns: List[str]) -> bool:
-    for pattern in ignore_patterns:
-        if fnmatch.fnmatch(file_path, f"*{pattern}*"):
-            print(f"File {file_path} is ignored.")
+def read_ignore_file(file_path: str) -> List[str]:
+    with open(file_path, "r", errors="replace") as ignore_file:
+        return [
+            line.strip()
+            for line in ignore_file
+            if line.strip() and not line.startswith("#")
+        ]
+
+
+@lru_cache(maxsize=32)
+def compile_ignore_patterns(ignore_patterns: Tuple[str, ...]) -> IgnoreMatcher:
+    return IgnoreMatcher.from_patterns(list(ignore_patterns))
+
+
+def directory_matcher(
+    folder_path: str, relative_dir: str, ignore_patterns: Tuple[str, ...]
+) -> IgnoreMatcher:
+    """
+    Matcher for the entries of a directory ("" for folder_path itself).
+
+    It holds the root patterns plus the .gitignore of every directory below
+    the root down to relative_dir. Matchers are cached until a .gitignore
+    changes.
+    """
+    if not relative_dir:
+        return compile_ignore_patterns(ignore_patterns)
+    parent = directory_matcher(
+        folder_path, posixpath.dirname(relative_dir), ignore_patterns
+    )
+    gitignore_path = os.path.join(folder_path, *relative_dir.split("/"), ".gitignore")
+    try:
+        gitignore_stat = os.stat(gitignore_path)
+    except OSError:
+        return parent
+    if not stat.S_ISREG(gitignore_stat.st_mode):
+        return parent
+    return _nested_matcher(
+        parent, gitignore_path, relative_dir, gitignore_stat.st_mtime_ns
+    )
+
+
+@lru_cache(maxsize=1024)
+def _nested_matcher(
+    parent: IgnoreMatcher, gitignore_path: str, relative_dir: str, mtime_ns: int
+) -> IgnoreMatcher:
+    return parent.with_patterns(read_ignore_file(gitignore_path), relative_dir)
+
+
+def is_ignored(
+    file_path: str, folder_path: str, ignore_patterns: List[str], is_dir: bool = False
+) -> bool:
+    """
+    Whether walk_repository would skip file_path: the path or one of its
+    parent directories is matched by the rules of the directory containing it.
+    """
+    parts = to_relative_path(file_path, folder_path).split("/")
+    ignore_patterns = tuple(ignore_patterns)
+    for depth in range(len(parts)):
+        matcher = directory_matcher(
+            folder_path, "/".join(parts[:depth]), ignore_patterns
+        )
+        is_parent = depth < len(parts) - 1
+        if matcher.match("/".join(parts[: depth + 1]), is_dir=is_parent or is_dir):
             return True
-    print(f"File {file_path} is not ignored.")
     return False
 
 
@@ -98,7 +413,7 @@ def preview_documents(documents, lines_to_preview=5):
 
 
 def chroma_vectorize(documents):
-    embeddings = OpenAIEmbeddings()
+    embeddings = get_embeddings()
     splitter = RecursiveCharacterTextSplitter(chunk_size=1500, chunk_overlap=100)
     content = splitter.split_documents(documents)
     # splitter = CharacterTextSplitter()
@@ -108,15 +423,72 @@ def chroma_vectorize(documents):
     return vector_store
 
 
-def create_FAISS_vectorstore(documents):
-    # Initialize embeddings and text splitter
-    embeddings = OpenAIEmbeddings()
-    text_splitter = RecursiveCharacterTextSplitter(chunk_size=1000, chunk_overlap=0)
-
-    # Split your documents into chunks
-    content = text_splitter.split_documents(documents)
-
-    vectorstore = FAISS.from_documents(content, embeddings)
+def get_text_splitter():
+    # Shared by create_FAISS_vectorstore and the incremental index in index_utils
+    return CodeTextSplitter()
+
+
+def iter_chunk_batches(
+    documents: Iterable, batch_size: int = DEFAULT_BATCH_SIZE, text_splitter=None
+) -> Iterator[List]:
+    """Split documents one at a time and yield chunks in batches of batch_size."""
+    text_splitter = text_splitter or get_text_splitter()
+    batch = []
+    for document in documents:
+        batch.extend(text_splitter.split_documents([document]))
+        while len(batch) >= batch_size:
+            yield batch[:batch_size]
+            batch = batch[batch_size:]
+    if batch:
+        yield batch
+
+
+def embed_chunks(embeddings, chunks: List) -> List[Tuple[str, List[float]]]:
+    # Embed the batch in one request instead of one query per chunk
+    texts = [chunk.page_content for chunk in chunks]
+    tokens = sum(estimate_tokens(text) for text in texts)
+    with span("embed", chunks=len(texts), tokens=tokens):
+        vectors = embeddings.embed_documents(texts)
+    count("chunks_embedded", len(texts))
+    count("tokens_embedded", tokens)
+    return list(zip(texts, vectors))
+
+
+def add_chunk_batch(vectorstore, embeddings, chunks: List, ids=None) -> List[str]:
+    text_embeddings = embed_chunks(embeddings, chunks)
+    with span("faiss.add", chunks=len(chunks)):
+        return vectorstore.add_embeddings(
+            text_embeddings, metadatas=[chunk.metadata for chunk in chunks], ids=ids
+        )
+
+
+def create_FAISS_vectorstore(documents, batch_size: int = DEFAULT_BATCH_SIZE):
+    """
+    Build a FAISS vectorstore from an iterable of documents.
+
+    Documents are split and embedded batch by batch, so passing a generator
+    such as iter_documents_from_repository keeps memory bounded.
+    """
+    embeddings = get_embeddings()
+    vectorstore = None
+    chunk_count = 0
+    start = time.perf_counter()
+    with span("create_faiss_vectorstore") as current:
+        for batch in iter_chunk_batches(documents, batch_size):
+            if vectorstore is None:
+                vectorstore = FAISS.from_embeddings(
+                    embed_chunks(embeddings, batch),
+                    embeddings,
+                    metadatas=[chunk.metadata for chunk in batch],
+                )
+            else:
+                add_chunk_batch(vectorstore, embeddings, batch)
+            chunk_count += len(batch)
+            elapsed = time.perf_counter() - start
+            log(
+                f"Embedded {chunk_count} chunks ({chunk_count / max(elapsed, 1e-9):.1f} chunks/s)"
+            )
+        current.set(chunks=chunk_count)
 
     return vectorstore
 
@@ -137,83 +509,20 @@ class CustomUnstructuredFileLoader(UnstructuredFileLoader):
             elements = self._get_elements()
         except ValueError as e:
             _, file_extension = os.path.splitext(self.file_path)
-            print(f"Error while loading file: {self.file_path}. Error: {e}")
-            print(f"Unsupported file type: {file_extension}. Adding to exclude.txt.")
+            log(f"Error while loading file: {self.file_path}. Error: {e}")
+            log(f"Unsupported file type: {file_extension}. Adding to exclude.txt.")
             with open("exclude.txt", "a") as exclude_file:
-                exclude_file.write(f"{file_extension}\n")
+                exclude_file.write(f"*{file_extension}\n")
             return []
 
         return elements
 
     def _get_elements(self) -> List:
         from langchain.docstore.document import Document
-        from langchain.document_loaders import PyPDFLoader
-        from unstructured.partition.auto import partition
-
-        # Define code file extensions that you want to support
-        code_file_extensions = {
-            ".cpp",
-            ".c",
-            ".cs",
-            ".py",
-            ".js",
-            ".java",
-            ".rb",
-            ".XML",
-            ".manifest",
-            ".html",
-            ".css",
-            ".php",
-            ".sql",
-            ".go",
-            ".swift",
-            ".ts",
-            ".kt",
-            ".rs",
-            ".hs",
-            ".scala",
-            ".clj",
-            ".lua",
-            ".m",
-            ".r",
-            ".sh",
-            ".bat",
-            ".vb",
-            ".pl",
-            ".fs",
-            ".ml",
-            ".mli",
-            ".erl",
-            ".hrl",
-            ".ex",
-            ".exs",
-            ".eex",
-            ".leex",
-            ".yml",
-            ".yaml",
-            ".json",
-            ".toml",
-            ".ini",
-            ".conf",
-            ".cfg",
-            ".prefs",
-            ".properties",
-            ".asciidoc",
-            ".adoc",
-            ".asc",
-            ".md",
-            ".markdown",
-            ".rst",
-            ".txt",
-            ".tex",
-            ".bib",
-            ".bibliography",
-            ".bib",
-        }
 
         _, file_extension = os.path.splitext(self.file_path)
 
-        if file_extension.lower() in code_file_extensions:
+        if file_extension.lower() in CODE_FILE_EXTENSIONS:
             # Load code files as plain text
             with open(self.file_path, "r", encoding="utf-8") as file:
                 content = file.read()
@@ -223,12 +532,21 @@ class CustomUnstructuredFileLoader(UnstructuredFileLoader):
             return [document]
         if file_extension.lower() == ".pdf":
             # Load PDF files using PyPDFLoader
+            from langchain.document_loaders import PyPDFLoader
+
             loader = PyPDFLoader(self.file_path)
             pages = loader.load()
             return pages
         else:
-            # Use partition for other file types
-            return partition(filename=self.file_path, **self.unstructured_kwargs)
+            # Use partition for other file types and join the elements into a
+            # single document so it can be split like any other file
+            ensure_nltk_data()
+            from unstructured.partition.auto import partition
+
+            elements = partition(filename=self.file_path, **self.unstructured_kwargs)
+            text = "\n\n".join(str(element) for element in elements)
+            document = Document(page_content=text, metadata={"source": self.file_path})
+            return [document]
 
 
 class SafeRecursiveCharacterTextSplitter(RecursiveCharacterTextSplitter):
@@ -238,7 +556,7 @@ class SafeRecursiveCharacterTextSplitter(RecursiveCharacterTextSplitter):
             try:
                 texts.append(doc.page_content)
             except AttributeError:
-                print(
+                log(
                     "Warning: 'FigureCaption' object has no attribute 'page_content'. Skipping this document."
                 )
                 continue
@@ -0,0 +1,47 @@
+import os
+import tempfile
+import unittest
+
+from file_utils import load_documents_from_repository
+from symbol_utils import SymbolIndex
+from trigram_utils import TrigramIndex
+
+
+class TestLoadDocumentsFromRepository(unittest.TestCase):
+    def test_sequential_and_parallel_fill_the_indexes(self):
+        with tempfile.TemporaryDirectory() as repo:
+            for name, content in [
+                ("a.py", "def alpha():\n    return 1\n"),
+                ("pkg/b.py", "class Beta:\n    pass\n"),
+            ]:
+                path = os.path.join(repo, name)
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                with open(path, "w") as file:
+                    file.write(content)
+
+            for parallel in (False, True):
+                with self.subTest(parallel=parallel):
+                    symbol_index = SymbolIndex()
+                    trigram_index = TrigramIndex()
+                    documents = load_documents_from_repository(
+                        repo,
+                        parallel=parallel,
+                        symbol_index=symbol_index,
+                        trigram_index=trigram_index,
+                    )
+                    self.assertEqual(
+                        sorted(
+                            os.path.basename(d.metadata["source"]) for d in documents
+                        ),
+                        ["a.py", "b.py"],
+                    )
+                    self.assertTrue(symbol_index.lookup("alpha"))
+                    self.assertTrue(symbol_index.lookup("Beta"))
+                    self.assertEqual(
+                        trigram_index.search("return 1"),
+                        [f"{os.path.join(repo, 'a.py')}:2: return 1"],
+                    )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,215 @@
+import json
+import os
+import sqlite3
+import subprocess
+import threading
+import time
+from typing import Dict, List, NamedTuple, Optional, Set, Tuple
+
+import numpy as np
+
+from trace_utils import count
+
+BLOB_CACHE_NAME = "blobs.sqlite"
+DEFAULT_MAX_BLOBS = 20_000
+GIT_TIMEOUT_SECONDS = 60
+
+
+class GitState(NamedTuple):
+    """HEAD commit, blob SHA of every tracked file and the dirty overlay."""
+
+    commit: str
+    blobs: Dict[str, str]
+    # Files whose work tree differs from HEAD, and untracked files
+    dirty: Set[str]
+
+
+class GitRepository:
+    """
+    Read the git state of a folder with the git command line.
+
+    Paths are returned as absolute paths under folder_path, which may be a
+    subdirectory of the repository; anything outside it is left out.
+    """
+
+    def __init__(self, folder_path: str, root: str):
+        self.folder_path = os.path.abspath(folder_path)
+        self.root = root
+        prefix = os.path.relpath(os.path.realpath(self.folder_path), root)
+        self.prefix = "" if prefix == "." else prefix.replace(os.sep, "/") + "/"
+
+    @classmethod
+    def open(cls, folder_path: str) -> Optional["GitRepository"]:
+        """Return the repository containing folder_path, or None without git."""
+        output = run_git(folder_path, "rev-parse", "--show-toplevel")
+        if not output:
+            return None
+        return cls(folder_path, os.path.realpath(output.decode("utf-8").strip()))
+
+    def run(self, *args: str) -> Optional[bytes]:
+        return run_git(self.root, *args)
+
+    def to_path(self, relative_path: str) -> Optional[str]:
+        if not relative_path.startswith(self.prefix):
+            return None
+        relative_path = relative_path[len(self.prefix) :]
+        return os.path.join(self.folder_path, *relative_path.split("/"))
+
+    def head(self) -> Optional[str]:
+        output = self.run("rev-parse", "--verify", "--quiet", "HEAD")
+        return output.decode("ascii").strip() if output else None
+
+    def state(self) -> Optional[GitState]:
+        """Read HEAD, its tree and the work tree status, None without commits."""
+        commit = self.head()
+        if commit is None:
+            return None
+        tree = self.run("ls-tree", "-r", "-z", "--full-tree", commit)
+        status = self.run(
+            "status", "--porcelain", "-z", "--untracked-files=no", "--no-renames"
+        )
+        # Untracked files are listed with the .gitignore files only, leaving
+        # out .git/info/exclude and core.excludesFile like walk_repository
+        untracked = self.run(
+            "ls-files", "--others", "-z", "--exclude-per-directory=.gitignore"
+        )
+        if tree is None or status is None or untracked is None:
+            return None
+
+        blobs = {}
+        for line in split_z(tree):
+            info, _, relative_path = line.partition("\t")
+            _, kind, sha = info.split(" ")
+            path = self.to_path(relative_path)
+            # Submodules are commits, not blobs
+            if kind == "blob" and path is not None:
+                blobs[path] = sha
+
+        dirty = set()
+        relative_paths = [line[3:] for line in split_z(status)] + split_z(untracked)
+        for relative_path in relative_paths:
+            path = self.to_path(relative_path)
+            if path is not None:
+                dirty.add(path)
+        return GitState(commit, blobs, dirty)
+
+    def changed_paths(self, old_commit: str, new_commit: str) -> Optional[Set[str]]:
+        """
+        Files added, modified or deleted between two commits.
+
+        Returns None when old_commit is no longer available, for example
+        after a history rewrite and gc, so callers can fall back to a scan.
+        """
+        if old_commit == new_commit:
+            return set()
+        output = self.run(
+            "diff", "--name-status", "-z", "--no-renames", old_commit, new_commit
+        )
+        if output is None:
+            return None
+        fields = split_z(output)
+        changed = set()
+        # Entries are "STATUS\0PATH\0"
+        for relative_path in fields[1::2]:
+            path = self.to_path(relative_path)
+            if path is not None:
+                changed.add(path)
+        return changed
+
+
+def run_git(folder_path: str, *args: str) -> Optional[bytes]:
+    """Run a git command and return its output, or None if it failed."""
+    try:
+        completed = subprocess.run(
+            ["git", "-C", folder_path, *args],
+            capture_output=True,
+            timeout=GIT_TIMEOUT_SECONDS,
+            check=True,
+        )
+    except (OSError, subprocess.SubprocessError):
+        return None
+    return completed.stdout
+
+
+def split_z(output: bytes) -> List[str]:
+    """Split NUL-terminated -z output into its fields."""
+    return [os.fsdecode(field) for field in output.split(b"\0") if field]
+
+
+class BlobCache:
+    """
+    Chunks and vectors of indexed git blobs, keyed by blob SHA.
+
+    A file whose blob was indexed before, on another branch or under another
+    path, is restored from here instead of being loaded, split and embedded
+    again. The least recently used blobs are evicted beyond max_entries.
+    """
+
+    def __init__(self, cache_path: str, max_entries: int = DEFAULT_MAX_BLOBS):
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(os.path.abspath(cache_path)), exist_ok=True)
+        self._connection = sqlite3.connect(cache_path, check_same_thread=False)
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS blobs ("
+            "blob TEXT PRIMARY KEY, chunks TEXT NOT NULL, vectors BLOB NOT NULL, "
+            "dimension INTEGER NOT NULL, last_used REAL NOT NULL)"
+        )
+        self._connection.execute(
+            "CREATE INDEX IF NOT EXISTS blobs_last_used ON blobs (last_used)"
+        )
+        self._connection.commit()
+
+    def get(self, blob: str) -> Optional[Tuple[List[Tuple[str, Dict]], np.ndarray]]:
+        """Return the (text, metadata) chunks and vectors of a blob."""
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT chunks, vectors, dimension FROM blobs WHERE blob = ?", (blob,)
+            ).fetchone()
+            if row is None:
+                count("blob_cache_misses")
+                return None
+            self._connection.execute(
+                "UPDATE blobs SET last_used = ? WHERE blob = ?", (time.time(), blob)
+            )
+            self._connection.commit()
+        count("blob_cache_hits")
+        chunks, vectors, dimension = row
+        vectors = np.frombuffer(vectors, dtype=np.float32).reshape(-1, dimension)
+        return [tuple(chunk) for chunk in json.loads(chunks)], vectors
+
+    def __contains__(self, blob: str) -> bool:
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT 1 FROM blobs WHERE blob = ?", (blob,)
+            ).fetchone()
+        return row is not None
+
+    def put(self, entries: Dict[str, Tuple[List[Tuple[str, Dict]], np.ndarray]]):
+        if not entries:
+            return
+        now = time.time()
+        rows = [
+            (
+                blob,
+                json.dumps(chunks),
+                np.ascontiguousarray(vectors, dtype=np.float32).tobytes(),
+                vectors.shape[1],
+                now,
+            )
+            for blob, (chunks, vectors) in entries.items()
+        ]
+        with self._lock:
+            self._connection.executemany(
+                "INSERT OR REPLACE INTO blobs VALUES (?, ?, ?, ?, ?)", rows
+            )
+            self._connection.execute(
+                "DELETE FROM blobs WHERE blob IN (SELECT blob FROM blobs "
+                "ORDER BY last_used DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,),
+            )
+            self._connection.commit()
+
+    def close(self):
+        with self._lock:
+            self._connection.close()
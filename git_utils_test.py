@@ -0,0 +1,222 @@
+import os
+import subprocess
+import tempfile
+import unittest
+from unittest import mock
+
+import numpy as np
+from langchain.embeddings import FakeEmbeddings
+
+from git_utils import BlobCache, GitRepository
+from index_utils import EMBEDDING_SIZE, load_manifest, load_or_build_vectorstore
+
+
+class CountingEmbeddings(FakeEmbeddings):
+    embedded: int = 0
+
+    def embed_documents(self, texts):
+        self.embedded += len(texts)
+        return super().embed_documents(texts)
+
+
+class GitTestCase(unittest.TestCase):
+    def setUp(self):
+        self.repo = tempfile.TemporaryDirectory()
+        self.index = tempfile.TemporaryDirectory()
+        self.git("init", "-q", "-b", "main")
+        self.write("a.py", "def alpha(): pass")
+        self.write("pkg/b.py", "def beta(): pass")
+        self.commit("initial")
+
+    def tearDown(self):
+        self.repo.cleanup()
+        self.index.cleanup()
+
+    def path(self, name):
+        return os.path.join(self.repo.name, *name.split("/"))
+
+    def write(self, name, content):
+        os.makedirs(os.path.dirname(self.path(name)), exist_ok=True)
+        with open(self.path(name), "w") as file:
+            file.write(content)
+
+    def git(self, *args):
+        subprocess.run(
+            ["git", "-c", "user.name=test", "-c", "user.email=test@example.com"]
+            + list(args),
+            cwd=self.repo.name,
+            check=True,
+            capture_output=True,
+        )
+
+    def commit(self, message):
+        self.git("add", "-A")
+        self.git("commit", "-q", "-m", message)
+
+
+class TestGitRepository(GitTestCase):
+    def test_state_and_changed_paths(self):
+        repository = GitRepository.open(self.repo.name)
+        first = repository.state()
+        self.assertEqual(set(first.blobs), {self.path("a.py"), self.path("pkg/b.py")})
+        self.assertEqual(first.dirty, set())
+
+        self.write("a.py", "def alpha(): return 1")
+        self.write("c.py", "def gamma(): pass")
+        self.assertEqual(
+            repository.state().dirty, {self.path("a.py"), self.path("c.py")}
+        )
+
+        self.commit("second")
+        second = repository.state()
+        self.assertNotEqual(
+            first.blobs[self.path("a.py")], second.blobs[self.path("a.py")]
+        )
+        self.assertEqual(
+            repository.changed_paths(first.commit, second.commit),
+            {self.path("a.py"), self.path("c.py")},
+        )
+        self.assertIsNone(repository.changed_paths("0" * 40, second.commit))
+
+    def test_subdirectory(self):
+        repository = GitRepository.open(self.path("pkg"))
+        self.assertEqual(set(repository.state().blobs), {self.path("pkg/b.py")})
+
+    def test_not_a_repository(self):
+        with tempfile.TemporaryDirectory() as directory:
+            self.assertIsNone(GitRepository.open(directory))
+
+    def test_blob_cache_evicts_least_recently_used(self):
+        cache = BlobCache(os.path.join(self.index.name, "blobs.sqlite"), max_entries=2)
+        vectors = np.ones((1, 3), dtype=np.float32)
+        cache.put({"a": ([("text", {"source": "a.py"})], vectors)})
+        cache.put({"b": ([], np.zeros((0, 3), dtype=np.float32))})
+        self.assertEqual(cache.get("a")[0], [("text", {"source": "a.py"})])
+        cache.put({"c": ([], np.zeros((0, 3), dtype=np.float32))})
+        self.assertIn("a", cache)
+        self.assertNotIn("b", cache)
+        cache.close()
+
+
+class TestGitIncrementalIndex(GitTestCase):
+    def build(self):
+        embeddings = CountingEmbeddings(size=EMBEDDING_SIZE)
+        vectorstore = load_or_build_vectorstore(
+            self.repo.name, index_dir=self.index.name, embeddings=embeddings
+        )
+        return vectorstore, embeddings
+
+    def sources(self, vectorstore):
+        return sorted(
+            (os.path.basename(document.metadata["source"]), document.page_content)
+            for document in vectorstore.docstore._dict.values()
+        )
+
+    def test_branch_switch_reuses_blobs(self):
+        _, embeddings = self.build()
+        self.assertEqual(embeddings.embedded, 2)
+
+        self.git("checkout", "-q", "-b", "feature")
+        self.write("a.py", "def alpha(): return 'feature'")
+        self.commit("feature")
+        vectorstore, embeddings = self.build()
+        self.assertEqual(embeddings.embedded, 1)
+        self.assertIn(
+            ("a.py", "def alpha(): return 'feature'"), self.sources(vectorstore)
+        )
+
+        # Both versions of a.py were indexed before, nothing is embedded again
+        self.git("checkout", "-q", "main")
+        with mock.patch("index_utils.scan_repository") as scan:
+            vectorstore, embeddings = self.build()
+        scan.assert_not_called()
+        self.assertEqual(embeddings.embedded, 0)
+        self.assertEqual(
+            self.sources(vectorstore),
+            [("a.py", "def alpha(): pass"), ("b.py", "def beta(): pass")],
+        )
+
+        self.git("checkout", "-q", "feature")
+        vectorstore, embeddings = self.build()
+        self.assertEqual(embeddings.embedded, 0)
+        self.assertIn(
+            ("a.py", "def alpha(): return 'feature'"), self.sources(vectorstore)
+        )
+
+    def test_dirty_and_untracked_overlay(self):
+        self.build()
+        self.write("a.py", "def alpha(): return 'dirty'")
+        self.write("notes.py", "def untracked(): pass")
+        vectorstore, embeddings = self.build()
+        self.assertEqual(embeddings.embedded, 2)
+        manifest = load_manifest(self.index.name)
+        self.assertNotIn("blob", manifest["files"][self.path("a.py")])
+        self.assertIn("blob", manifest["files"][self.path("pkg/b.py")])
+
+        # Reverting the edit goes back to the committed blob
+        self.git("checkout", "--", "a.py")
+        os.remove(self.path("notes.py"))
+        vectorstore, embeddings = self.build()
+        self.assertEqual(embeddings.embedded, 0)
+        self.assertEqual(
+            self.sources(vectorstore),
+            [("a.py", "def alpha(): pass"), ("b.py", "def beta(): pass")],
+        )
+
+    def test_touched_files_are_not_rehashed(self):
+        self.build()
+        os.utime(self.path("a.py"), (1, 1))
+        with mock.patch("index_utils.file_hash") as file_hash:
+            _, embeddings = self.build()
+        file_hash.assert_not_called()
+        self.assertEqual(embeddings.embedded, 0)
+
+    def test_planner_matches_full_scan(self):
+        self.write("pkg/.gitignore", "*_pb2.py\nout/\n")
+        self.commit("ignore generated code")
+        self.build()
+
+        self.write("pkg/api_pb2.py", "API = 1")
+        self.write("pkg/out/d.py", "D = 1")
+        self.write("pkg/e.py", "E = 1")
+        # Ignored by git but not by the index, like any other local file
+        self.write("local.py", "LOCAL = 1")
+        with open(self.path(".git/info/exclude"), "a") as exclude:
+            exclude.write("local.py\n")
+        with mock.patch("index_utils.scan_repository") as scan:
+            self.build()
+        scan.assert_not_called()
+        self.assertEqual(self.indexed_files(), self.scanned_files())
+        self.assertIn(self.path("local.py"), self.indexed_files())
+        self.assertNotIn(self.path("pkg/api_pb2.py"), self.indexed_files())
+
+        # Editing a nested .gitignore reveals files git never reported
+        self.write("pkg/.gitignore", "out/\n")
+        self.build()
+        self.assertIn(self.path("pkg/api_pb2.py"), self.indexed_files())
+        self.assertEqual(self.indexed_files(), self.scanned_files())
+
+    def indexed_files(self):
+        return set(load_manifest(self.index.name)["files"])
+
+    def scanned_files(self):
+        with tempfile.TemporaryDirectory() as index_dir:
+            load_or_build_vectorstore(
+                self.repo.name,
+                index_dir=index_dir,
+                embeddings=CountingEmbeddings(size=EMBEDDING_SIZE),
+                use_git=False,
+            )
+            return set(load_manifest(index_dir)["files"])
+
+    def test_falls_back_to_scan_without_git(self):
+        _, embeddings = self.build()
+        with mock.patch("index_utils.GitRepository.open", return_value=None):
+            self.write("c.py", "def gamma(): pass")
+            vectorstore, embeddings = self.build()
+        self.assertEqual(embeddings.embedded, 1)
+        self.assertNotIn("git", load_manifest(self.index.name))
+
+
+if __name__ == "__main__":
+    unittest.main()
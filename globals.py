@@ -2,3 +2,15 @@ def initialize():
     # Files and directories to exclude from search results
     global ignore_patterns
     ignore_patterns = []
+
+    # Root of the selected project, ignore patterns are anchored to it
+    global project_repository
+    project_repository = None
+
+    # Symbol and path index of the project, used by the FindSymbol tool
+    global symbol_index
+    symbol_index = None
+
+    # Trigram index of file contents, used by the SearchCode tool
+    global trigram_index
+    trigram_index = None
@@ -0,0 +1,146 @@
+import os
+import re
+from typing import List, Optional, Tuple
+
+# (regex source, negated, directory only)
+Rule = Tuple[str, bool, bool]
+
+
+def translate_pattern(pattern: str) -> str:
+    """Translate a gitignore glob (without anchoring) into a regex fragment."""
+    regex = ""
+    i = 0
+    while i < len(pattern):
+        char = pattern[i]
+        if pattern.startswith("**/", i):
+            regex += "(?:.*/)?"
+            i += 3
+            continue
+        if pattern.startswith("/**", i) and i + 3 == len(pattern):
+            regex += "/.*"
+            i += 3
+            continue
+        if pattern.startswith("**", i):
+            regex += ".*"
+            i += 2
+            continue
+        if char == "*":
+            regex += "[^/]*"
+        elif char == "?":
+            regex += "[^/]"
+        elif char == "[":
+            start = i + 1
+            if pattern[start : start + 1] in ("!", "^"):
+                start += 1
+            # A "]" right after the opening bracket is a literal member
+            end = pattern.find("]", start + 1)
+            if end == -1:
+                regex += re.escape(char)
+            else:
+                body = pattern[i + 1 : end].replace("\\", "\\\\")
+                if body[0] in ("!", "^"):
+                    body = "^" + body[1:]
+                regex += f"[{body}]"
+                i = end
+        elif char == "\\" and i + 1 < len(pattern):
+            i += 1
+            regex += re.escape(pattern[i])
+        else:
+            regex += re.escape(char)
+        i += 1
+    return regex
+
+
+def compile_rule(pattern: str, base: str = "") -> Optional[Rule]:
+    """Compile one gitignore line relative to base (a posix path, "" for root)."""
+    pattern = pattern.strip()
+    if not pattern or pattern.startswith("#"):
+        return None
+
+    negated = pattern.startswith("!")
+    if negated:
+        pattern = pattern[1:]
+    directory_only = pattern.endswith("/")
+    pattern = pattern.rstrip("/")
+    if not pattern:
+        return None
+
+    # A slash anywhere but the end anchors the pattern to its .gitignore
+    anchored = "/" in pattern
+    pattern = pattern.lstrip("/")
+    prefix = f"{re.escape(base)}/" if base else ""
+    if not anchored:
+        prefix += "(?:.*/)?"
+    return prefix + translate_pattern(pattern), negated, directory_only
+
+
+class IgnoreMatcher:
+    """
+    Gitignore matcher with all rules compiled into two combined regexes.
+
+    Rules are joined in reverse order so the first alternative that matches is
+    the last matching rule, which gives gitignore's last-match-wins semantics
+    (including negation) with a single regex call per path.
+    """
+
+    def __init__(self, rules: List[Rule]):
+        self.rules = rules
+        self._file_regex, self._file_negated = self._combine(
+            [rule for rule in rules if not rule[2]]
+        )
+        self._directory_regex, self._directory_negated = self._combine(rules)
+
+    @classmethod
+    def from_patterns(cls, patterns: List[str], base: str = "") -> "IgnoreMatcher":
+        return cls([])._extend(patterns, base)
+
+    def with_patterns(self, patterns: List[str], base: str) -> "IgnoreMatcher":
+        """Return a matcher for a subdirectory with its own .gitignore."""
+        return self._extend(patterns, base)
+
+    def _extend(self, patterns: List[str], base: str) -> "IgnoreMatcher":
+        rules = list(self.rules)
+        for pattern in patterns:
+            rule = compile_rule(pattern, base)
+            if rule:
+                rules.append(rule)
+        return IgnoreMatcher(rules)
+
+    @staticmethod
+    def _combine(rules: List[Rule]):
+        if not rules:
+            return None, []
+        ordered = list(reversed(rules))
+        regex = "|".join(f"({source})" for source, _, _ in ordered)
+        return re.compile(f"(?:{regex})\\Z", re.DOTALL), [
+            negated for _, negated, _ in ordered
+        ]
+
+    def match(self, relative_path: str, is_dir: bool = False) -> bool:
+        """Match a single path, without looking at its parent directories."""
+        if is_dir:
+            regex, negated = self._directory_regex, self._directory_negated
+        else:
+            regex, negated = self._file_regex, self._file_negated
+        if regex is None:
+            return False
+        match = regex.match(relative_path)
+        return bool(match) and not negated[match.lastindex - 1]
+
+    def is_ignored(self, relative_path: str, is_dir: bool = False) -> bool:
+        """Match a path and every parent directory, as git does."""
+        parts = relative_path.split("/")
+        for depth in range(1, len(parts)):
+            if self.match("/".join(parts[:depth]), is_dir=True):
+                return True
+        return self.match(relative_path, is_dir=is_dir)
+
+
+def to_relative_path(file_path: str, folder_path: str) -> str:
+    if os.path.isabs(file_path) or file_path.startswith(folder_path):
+        relative_path = os.path.relpath(file_path, folder_path)
+        if relative_path.startswith(".."):
+            relative_path = os.path.basename(file_path)
+    else:
+        relative_path = file_path
+    return relative_path.replace(os.sep, "/")
@@ -0,0 +1,89 @@
+import os
+import tempfile
+import unittest
+
+from ignore_utils import IgnoreMatcher
+
+
+class TestIgnoreMatcher(unittest.TestCase):
+    def test_unanchored_and_anchored_patterns(self):
+        matcher = IgnoreMatcher.from_patterns(["*.pyc", "/build", "docs/*.md"])
+        self.assertTrue(matcher.is_ignored("a/b/c.pyc"))
+        self.assertTrue(matcher.is_ignored("build/out.txt"))
+        self.assertFalse(matcher.is_ignored("src/build/out.txt"))
+        self.assertTrue(matcher.is_ignored("docs/index.md"))
+        self.assertFalse(matcher.is_ignored("docs/api/index.md"))
+
+    def test_negation_last_match_wins(self):
+        matcher = IgnoreMatcher.from_patterns(["*.log", "!keep.log"])
+        self.assertTrue(matcher.is_ignored("debug.log"))
+        self.assertFalse(matcher.is_ignored("logs/keep.log"))
+
+    def test_directory_only_patterns(self):
+        matcher = IgnoreMatcher.from_patterns(["venv/", "**/cache/**"])
+        self.assertTrue(matcher.is_ignored("venv", is_dir=True))
+        self.assertFalse(matcher.is_ignored("venv"))
+        self.assertTrue(matcher.is_ignored("venv/lib/site.py"))
+        self.assertTrue(matcher.is_ignored("a/cache/b/c.txt"))
+
+    def test_nested_gitignore(self):
+        matcher = IgnoreMatcher.from_patterns(["*.tmp"]).with_patterns(
+            ["!*.tmp", "/local"], "sub"
+        )
+        self.assertTrue(matcher.is_ignored("a.tmp"))
+        self.assertFalse(matcher.is_ignored("sub/a.tmp"))
+        self.assertTrue(matcher.is_ignored("sub/local", is_dir=True))
+        self.assertFalse(matcher.is_ignored("local", is_dir=True))
+
+
+class TestWalkRepository(unittest.TestCase):
+    def test_prunes_ignored_directories(self):
+        from file_utils import walk_repository
+
+        with tempfile.TemporaryDirectory() as repo:
+            for path in ["a.py", "node_modules/x.js", "sub/b.py", "sub/c.gen"]:
+                full_path = os.path.join(repo, path)
+                os.makedirs(os.path.dirname(full_path), exist_ok=True)
+                open(full_path, "w").close()
+            with open(os.path.join(repo, "sub", ".gitignore"), "w") as gitignore:
+                gitignore.write("*.gen\n")
+
+            files = walk_repository(repo, ["node_modules/"])
+            relative = [os.path.relpath(path, repo) for path in files]
+            self.assertEqual(relative, ["a.py", "sub/.gitignore", "sub/b.py"])
+
+    def test_is_ignored_honors_nested_gitignore(self):
+        from file_utils import is_ignored, walk_repository
+
+        with tempfile.TemporaryDirectory() as repo:
+            paths = ["a.gen", "sub/b.py", "sub/c.gen", "sub/out/d.py", "sub/x/e.gen"]
+            for path in paths:
+                full_path = os.path.join(repo, path)
+                os.makedirs(os.path.dirname(full_path), exist_ok=True)
+                open(full_path, "w").close()
+            with open(os.path.join(repo, "sub", ".gitignore"), "w") as gitignore:
+                gitignore.write("*.gen\nout/\n")
+
+            ignored = [
+                path for path in paths if is_ignored(os.path.join(repo, path), repo, [])
+            ]
+            self.assertEqual(ignored, ["sub/c.gen", "sub/out/d.py", "sub/x/e.gen"])
+            self.assertTrue(
+                is_ignored(os.path.join(repo, "sub", "out"), repo, [], True)
+            )
+            walked = walk_repository(repo, [])
+            self.assertEqual(
+                sorted(os.path.relpath(path, repo) for path in walked),
+                ["a.gen", "sub/.gitignore", "sub/b.py"],
+            )
+
+            # Edits to a nested .gitignore are picked up
+            with open(os.path.join(repo, "sub", ".gitignore"), "w") as gitignore:
+                gitignore.write("b.py\n")
+            os.utime(os.path.join(repo, "sub", ".gitignore"), ns=(1, 1))
+            self.assertTrue(is_ignored(os.path.join(repo, "sub", "b.py"), repo, []))
+            self.assertFalse(is_ignored(os.path.join(repo, "sub", "c.gen"), repo, []))
+
+
+if __name__ == "__main__":
+    unittest.main()
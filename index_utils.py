@@ -0,0 +1,591 @@
+import hashlib
+import json
+import os
+import time
+from contextlib import nullcontext
+from stat import S_ISREG
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from langchain.docstore import InMemoryDocstore
+from langchain.embeddings.base import Embeddings
+from langchain.vectorstores import FAISS
+
+from ann_utils import (
+    IndexConfig,
+    create_index,
+    load_vectorstore,
+    maybe_upgrade_index,
+    rebuild_index,
+    reconstruct_vectors,
+)
+from embedding_utils import get_embeddings
+from file_utils import (
+    DEFAULT_BATCH_SIZE,
+    document_text,
+    embed_chunks,
+    get_text_splitter,
+    is_ignored,
+    is_plain_text_file,
+    iter_loaded_files,
+    read_gitignore_and_exclude,
+    report_load_timings,
+    walk_repository,
+)
+from git_utils import BLOB_CACHE_NAME, BlobCache, GitRepository, GitState
+from symbol_utils import SymbolIndex
+from trigram_utils import TrigramIndex
+from trace_utils import log, span
+
+INDEX_NAME = "index"
+MANIFEST_NAME = "manifest.json"
+# Bump whenever chunking or metadata changes so stale indexes get rebuilt
+MANIFEST_VERSION = 3
+EMBEDDING_SIZE = 1536
+
+
+def default_index_dir(folder_path: str) -> str:
+    # Keep indexes out of the repository so they are never indexed themselves
+    folder_path = os.path.abspath(folder_path)
+    digest = hashlib.sha1(folder_path.encode("utf-8")).hexdigest()[:12]
+    name = os.path.basename(folder_path.rstrip(os.sep)) or "root"
+    return os.path.join(
+        os.path.expanduser("~"), ".recurgpt", "indexes", f"{name}-{digest}"
+    )
+
+
+def file_hash(file_path: str) -> str:
+    sha = hashlib.sha256()
+    with open(file_path, "rb") as file:
+        for block in iter(lambda: file.read(1 << 20), b""):
+            sha.update(block)
+    return sha.hexdigest()
+
+
+def load_manifest(index_dir: str) -> Dict:
+    manifest_path = os.path.join(index_dir, MANIFEST_NAME)
+    if not os.path.exists(manifest_path):
+        return {"version": MANIFEST_VERSION, "files": {}}
+    with open(manifest_path, "r") as manifest_file:
+        manifest = json.load(manifest_file)
+    if manifest.get("version") != MANIFEST_VERSION:
+        return {"version": MANIFEST_VERSION, "files": {}}
+    return manifest
+
+
+def save_manifest(index_dir: str, manifest: Dict):
+    os.makedirs(index_dir, exist_ok=True)
+    manifest_path = os.path.join(index_dir, MANIFEST_NAME)
+    tmp_path = manifest_path + ".tmp"
+    with open(tmp_path, "w") as manifest_file:
+        json.dump(manifest, manifest_file)
+    os.replace(tmp_path, manifest_path)
+
+
+def scan_repository(
+    folder_path: str, ignore_patterns: List[str]
+) -> Dict[str, os.stat_result]:
+    """Return the stat result of every indexable file, keyed by file path."""
+    files = {}
+    for file_path in walk_repository(folder_path, ignore_patterns):
+        try:
+            files[file_path] = os.stat(file_path)
+        except OSError:
+            continue
+    return files
+
+
+def empty_vectorstore(
+    embeddings: Embeddings, config: Optional[IndexConfig] = None
+) -> FAISS:
+    index = create_index(EMBEDDING_SIZE, config or IndexConfig())
+    return FAISS(embeddings.embed_query, index, InMemoryDocstore({}), {})
+
+
+def evict_chunks(
+    vectorstore: FAISS, ids: List[str], config: Optional[IndexConfig] = None
+):
+    """Remove chunks from the vectorstore without re-embedding the rest."""
+    if not ids:
+        return
+    evicted = set(ids)
+    kept_positions = [
+        position
+        for position, _id in sorted(vectorstore.index_to_docstore_id.items())
+        if _id not in evicted
+    ]
+    vectorstore.index = rebuild_index(
+        vectorstore.index, kept_positions, config or IndexConfig()
+    )
+    vectorstore.index_to_docstore_id = {
+        new_position: vectorstore.index_to_docstore_id[old_position]
+        for new_position, old_position in enumerate(kept_positions)
+    }
+    for _id in evicted:
+        vectorstore.docstore._dict.pop(_id, None)
+
+
+def plan_changes(
+    indexed: Dict[str, Dict],
+    current: Dict[str, os.stat_result],
+    paths: Optional[Iterable[str]] = None,
+    blobs: Optional[Dict[str, str]] = None,
+) -> Tuple[List[str], Dict[str, Tuple[os.stat_result, str]], Set[str]]:
+    """
+    Compare manifest entries with current file stats.
+
+    Returns the chunk ids to evict, the files to (re)index with their stat and
+    hash, and the removed files, which are dropped from indexed. Touched but
+    unchanged files only get their fingerprint refreshed. When paths is given
+    only those files are considered, otherwise every indexed file is. blobs
+    maps clean tracked files to their git blob SHA, files still at the blob
+    they were indexed from are not hashed.
+    """
+    candidates = set(indexed) if paths is None else set(paths) & set(indexed)
+    removed_paths = candidates - set(current)
+    stale_ids = []
+    for file_path in removed_paths:
+        stale_ids.extend(indexed.pop(file_path)["ids"])
+
+    to_index = {}
+    for file_path, stat in current.items():
+        entry = indexed.get(file_path)
+        if entry and entry["mtime"] == stat.st_mtime and entry["size"] == stat.st_size:
+            continue
+        if entry and blobs and entry.get("blob") == blobs.get(file_path, ""):
+            # Checked out again at the same content
+            entry["mtime"] = stat.st_mtime
+            entry["size"] = stat.st_size
+            continue
+        try:
+            digest = file_hash(file_path)
+        except OSError:
+            continue
+        if entry and entry["hash"] == digest:
+            # Touched but unchanged, just refresh the cheap fingerprint
+            entry["mtime"] = stat.st_mtime
+            entry["size"] = stat.st_size
+            continue
+        if entry:
+            stale_ids.extend(entry["ids"])
+        to_index[file_path] = (stat, digest)
+    return stale_ids, to_index, removed_paths
+
+
+def index_files(
+    vectorstore: FAISS,
+    embeddings: Embeddings,
+    symbol_index: SymbolIndex,
+    indexed: Dict[str, Dict],
+    to_index: Dict[str, Tuple[os.stat_result, str]],
+    folder_path: str,
+    ignore_patterns: List[str],
+    batch_size: int = DEFAULT_BATCH_SIZE,
+    lock=None,
+    trigram_index: Optional[TrigramIndex] = None,
+    use_processes: bool = True,
+) -> int:
+    """
+    Chunk, embed and add the given files, recording them in indexed.
+
+    Files are streamed through load -> split -> batched embed so only a
+    bounded number of files and one batch of chunks are held in memory at a
+    time. Only the FAISS add runs under lock, so searches are never blocked
+    by embedding requests. Returns the number of chunks added.
+    """
+    lock = lock or nullcontext()
+    changed_paths = sorted(to_index)
+    text_splitter = get_text_splitter()
+    timings = []
+    batch = []
+    chunk_count = 0
+    start = time.perf_counter()
+
+    def flush(pending):
+        nonlocal chunk_count
+        chunks = [chunk for _, chunk in pending]
+        text_embeddings = embed_chunks(embeddings, chunks)
+        with lock, span("faiss.add", chunks=len(chunks)):
+            vectorstore.add_embeddings(
+                text_embeddings,
+                metadatas=[chunk.metadata for chunk in chunks],
+                ids=[_id for _id, _ in pending],
+            )
+        chunk_count += len(pending)
+        elapsed = time.perf_counter() - start
+        log(
+            f"Indexed {len(timings)}/{len(changed_paths)} files, {chunk_count} chunks "
+            f"({chunk_count / max(elapsed, 1e-9):.1f} chunks/s)"
+        )
+
+    for file_path, documents, seconds in iter_loaded_files(
+        changed_paths, folder_path, ignore_patterns, use_processes=use_processes
+    ):
+        timings.append((file_path, seconds))
+        symbol_index.add_file(file_path, document_text(file_path, documents))
+        if trigram_index is not None:
+            trigram_index.add_file(file_path)
+        stat, digest = to_index[file_path]
+        chunks = text_splitter.split_documents(documents)
+        ids = [f"{file_path}#{i}" for i in range(len(chunks))]
+        indexed[file_path] = {
+            "mtime": stat.st_mtime,
+            "size": stat.st_size,
+            "hash": digest,
+            "ids": ids,
+        }
+        batch.extend(zip(ids, chunks))
+        while len(batch) >= batch_size:
+            flush(batch[:batch_size])
+            batch = batch[batch_size:]
+    if batch:
+        flush(batch)
+    if timings:
+        report_load_timings(timings)
+    return chunk_count
+
+
+def ignore_digest(ignore_patterns: List[str], git_state: GitState) -> str:
+    """
+    Digest of the root patterns and of every nested .gitignore, which can
+    hide or reveal files that git does not report as changed.
+    """
+    digest = hashlib.sha1("\n".join(ignore_patterns).encode("utf-8"))
+    gitignores = {
+        path
+        for path in set(git_state.blobs) | git_state.dirty
+        if os.path.basename(path) == ".gitignore"
+    }
+    for path in sorted(gitignores):
+        # Tracked files are identified by their blob, the others by content
+        if path not in git_state.dirty:
+            version = git_state.blobs[path]
+        elif os.path.isfile(path):
+            with open(path, "rb") as gitignore:
+                version = hashlib.sha1(gitignore.read()).hexdigest()
+        else:
+            version = "deleted"
+        digest.update(f"\0{path}\0{version}".encode("utf-8"))
+    return digest.hexdigest()
+
+
+def clean_blobs(git_state: Optional[GitState]) -> Dict[str, str]:
+    """Blob SHA of every tracked file whose work tree matches HEAD."""
+    if git_state is None:
+        return {}
+    return {
+        path: blob
+        for path, blob in git_state.blobs.items()
+        if path not in git_state.dirty
+    }
+
+
+def git_candidates(
+    repository: GitRepository,
+    git_state: GitState,
+    manifest: Dict,
+    ignore_patterns: List[str],
+) -> Optional[Set[str]]:
+    """
+    Files that may differ from the index, or None when everything must be scanned.
+
+    These are the files changed between the last indexed commit and HEAD,
+    the dirty and untracked files, and the files whose entry was not indexed
+    from their HEAD blob (dirty or untracked when indexed, or not tracked).
+    """
+    last = manifest.get("git")
+    if not last or last.get("ignore") != ignore_digest(ignore_patterns, git_state):
+        return None
+    changed = repository.changed_paths(last["commit"], git_state.commit)
+    if changed is None:
+        return None
+    overlay = {
+        path
+        for path, entry in manifest["files"].items()
+        if entry.get("blob") is None or entry["blob"] != git_state.blobs.get(path)
+    }
+    return changed | git_state.dirty | overlay
+
+
+def stat_files(
+    file_paths: Iterable[str], folder_path: str, ignore_patterns: List[str]
+) -> Dict[str, os.stat_result]:
+    """Like scan_repository, for the given files only."""
+    files = {}
+    for file_path in file_paths:
+        if is_ignored(file_path, folder_path, ignore_patterns):
+            continue
+        try:
+            stat = os.stat(file_path)
+        except OSError:
+            continue
+        if S_ISREG(stat.st_mode):
+            files[file_path] = stat
+    return files
+
+
+def record_git_state(
+    manifest: Dict,
+    git_state: GitState,
+    blobs: Dict[str, str],
+    ignore_patterns: List[str],
+):
+    """Tag entries with the blob they were indexed from, dirty files get none."""
+    for file_path, entry in manifest["files"].items():
+        blob = blobs.get(file_path)
+        if blob:
+            entry["blob"] = blob
+        else:
+            entry.pop("blob", None)
+    manifest["git"] = {
+        "commit": git_state.commit,
+        "ignore": ignore_digest(ignore_patterns, git_state),
+    }
+
+
+def stash_blobs(
+    blob_cache: BlobCache,
+    vectorstore: FAISS,
+    entries: Dict[str, Dict],
+    file_paths: Iterable[str],
+):
+    """Save the chunks and vectors of the blobs indexed for file_paths."""
+    stash = {}
+    positions = None
+    for file_path in file_paths:
+        entry = entries.get(file_path)
+        blob = entry.get("blob") if entry else None
+        if not blob or blob in stash or blob in blob_cache:
+            continue
+        if positions is None:
+            positions = {
+                _id: position
+                for position, _id in vectorstore.index_to_docstore_id.items()
+            }
+        if not all(_id in positions for _id in entry["ids"]):
+            continue
+        documents = [vectorstore.docstore._dict[_id] for _id in entry["ids"]]
+        vectors = reconstruct_vectors(
+            vectorstore.index, [positions[_id] for _id in entry["ids"]]
+        )
+        stash[blob] = (
+            [(document.page_content, document.metadata) for document in documents],
+            vectors,
+        )
+    blob_cache.put(stash)
+
+
+def restore_blobs(
+    blob_cache: BlobCache,
+    vectorstore: FAISS,
+    symbol_index: SymbolIndex,
+    trigram_index: TrigramIndex,
+    indexed: Dict[str, Dict],
+    to_index: Dict[str, Tuple[os.stat_result, str]],
+    blobs: Dict[str, str],
+) -> Set[str]:
+    """
+    Add the files of to_index whose blob is cached without loading or
+    embedding them, and return their paths.
+    """
+    restored = set()
+    for file_path, (stat, digest) in to_index.items():
+        blob = blobs.get(file_path)
+        cached = blob_cache.get(blob) if blob else None
+        if cached is None or cached[1].shape[1] != vectorstore.index.d:
+            continue
+        chunks, vectors = cached
+        ids = [f"{file_path}#{i}" for i in range(len(chunks))]
+        if ids:
+            vectorstore.add_embeddings(
+                list(zip((text for text, _ in chunks), vectors.tolist())),
+                metadatas=[{**metadata, "source": file_path} for _, metadata in chunks],
+                ids=ids,
+            )
+        symbol_index.add_file(file_path, source_text(file_path))
+        trigram_index.add_file(file_path)
+        indexed[file_path] = {
+            "mtime": stat.st_mtime,
+            "size": stat.st_size,
+            "hash": digest,
+            "ids": ids,
+        }
+        restored.add(file_path)
+    return restored
+
+
+def source_text(file_path: str) -> str:
+    """Text used for symbol extraction, as index_files gets it from the loader."""
+    if not is_plain_text_file(file_path):
+        return ""
+    try:
+        with open(file_path, "r", encoding="utf-8") as file:
+            return file.read()
+    except (OSError, UnicodeDecodeError):
+        return ""
+
+
+def load_or_build_vectorstore(
+    folder_path: str,
+    ignore_file: Optional[str] = None,
+    index_dir: Optional[str] = None,
+    embeddings: Optional[Embeddings] = None,
+    batch_size: int = DEFAULT_BATCH_SIZE,
+    index_config: Optional[IndexConfig] = None,
+    use_git: bool = True,
+) -> FAISS:
+    """
+    Load the persisted index for the repository and bring it up to date.
+
+    Only files whose size, mtime and content hash changed are re-chunked and
+    re-embedded; chunks of deleted files are evicted. Changed files are
+    streamed through the loaders and embedded batch_size chunks at a time.
+    index_config selects the FAISS index kind (see ann_utils.IndexConfig).
+
+    In a git repository only the files changed since the last indexed commit,
+    the dirty and untracked files, and files indexed from other content are
+    checked, instead of the whole tree. Files whose blob was indexed before,
+    for example on another branch, are restored from the blob cache.
+    """
+    index_dir = index_dir or default_index_dir(folder_path)
+    embeddings = embeddings or get_embeddings()
+    index_config = index_config or IndexConfig()
+    ignore_patterns = read_gitignore_and_exclude(folder_path, ignore_file)
+
+    manifest = load_manifest(index_dir)
+    index_path = os.path.join(index_dir, f"{INDEX_NAME}.faiss")
+    warm = bool(manifest["files"]) and os.path.exists(index_path)
+    if not warm:
+        manifest = {"version": MANIFEST_VERSION, "files": {}}
+
+    indexed = manifest["files"]
+    # Entries as they were, to keep the blobs that are about to be replaced
+    previous = dict(indexed)
+    with span("index.scan", folder=folder_path) as current_span:
+        repository = GitRepository.open(folder_path) if use_git else None
+        git_state = repository.state() if repository else None
+        blobs = clean_blobs(git_state)
+        candidates = None
+        if warm and git_state is not None:
+            candidates = git_candidates(
+                repository, git_state, manifest, ignore_patterns
+            )
+        if candidates is None:
+            current = scan_repository(folder_path, ignore_patterns)
+        else:
+            current = stat_files(candidates, folder_path, ignore_patterns)
+        current_span.set(files=len(current), git=candidates is not None)
+    stale_ids, to_index, removed_paths = plan_changes(
+        indexed, current, candidates, blobs
+    )
+
+    changed = bool(to_index or removed_paths)
+    if warm:
+        # A read-only memory-mapped index is only usable when nothing changes
+        with span("index.load", index_dir=index_dir):
+            vectorstore = load_vectorstore(
+                index_dir,
+                embeddings,
+                index_config,
+                index_name=INDEX_NAME,
+                mmap=index_config.mmap and not changed,
+            )
+            symbol_index = SymbolIndex.load(index_dir)
+            trigram_index = TrigramIndex.load(index_dir)
+    else:
+        vectorstore = empty_vectorstore(embeddings, index_config)
+        symbol_index = SymbolIndex()
+        trigram_index = TrigramIndex()
+    for file_path in removed_paths:
+        symbol_index.remove_file(file_path)
+        trigram_index.remove_file(file_path)
+    # Indexes written before code search existed only lack the trigrams
+    missing_trigrams = [
+        file_path
+        for file_path in indexed
+        if file_path not in to_index and file_path not in trigram_index.files
+    ]
+    for file_path in missing_trigrams:
+        trigram_index.add_file(file_path)
+
+    blob_cache = None
+    if git_state is not None and changed:
+        blob_cache = BlobCache(os.path.join(index_dir, BLOB_CACHE_NAME))
+        # The branch the replaced chunks came from may be checked out again
+        stash_blobs(blob_cache, vectorstore, previous, removed_paths | set(to_index))
+
+    with span("index.evict", chunks=len(stale_ids)):
+        evict_chunks(vectorstore, stale_ids, index_config)
+
+    restored = set()
+    if blob_cache is not None:
+        with span("index.restore"):
+            restored = restore_blobs(
+                blob_cache,
+                vectorstore,
+                symbol_index,
+                trigram_index,
+                indexed,
+                to_index,
+                blobs,
+            )
+        blob_cache.close()
+
+    index_files(
+        vectorstore,
+        embeddings,
+        symbol_index,
+        indexed,
+        {path: value for path, value in to_index.items() if path not in restored},
+        folder_path,
+        ignore_patterns,
+        batch_size,
+        trigram_index=trigram_index,
+    )
+
+    if git_state is not None:
+        record_git_state(manifest, git_state, blobs, ignore_patterns)
+    else:
+        manifest.pop("git", None)
+
+    log(
+        f"Index up to date: {len(to_index)} files (re)indexed "
+        f"({len(restored)} from the blob cache), "
+        f"{len(stale_ids)} stale chunks evicted, {len(indexed)} files total."
+    )
+
+    if maybe_upgrade_index(vectorstore, index_config):
+        changed = True
+
+    with span("index.save", changed=changed):
+        if changed or not warm:
+            save_index(index_dir, vectorstore, symbol_index, manifest, trigram_index)
+        else:
+            if missing_trigrams:
+                trigram_index.save(index_dir)
+            save_manifest(index_dir, manifest)
+
+    return vectorstore
+
+
+def save_index(
+    index_dir: str,
+    vectorstore: FAISS,
+    symbol_index: SymbolIndex,
+    manifest: Dict,
+    trigram_index: Optional[TrigramIndex] = None,
+):
+    vectorstore.save_local(index_dir, index_name=INDEX_NAME)
+    symbol_index.save(index_dir)
+    if trigram_index is not None:
+        trigram_index.save(index_dir)
+    save_manifest(index_dir, manifest)
+
+
+def load_symbol_index(index_dir: str) -> SymbolIndex:
+    """Load the symbol index maintained next to the FAISS index."""
+    return SymbolIndex.load(index_dir)
+
+
+def load_trigram_index(index_dir: str) -> TrigramIndex:
+    """Load the trigram index used for code search, kept next to the FAISS index."""
+    return TrigramIndex.load(index_dir)
@@ -0,0 +1,81 @@
+import os
+import tempfile
+import unittest
+
+from langchain.embeddings import FakeEmbeddings
+
+from index_utils import (
+    EMBEDDING_SIZE,
+    load_manifest,
+    load_or_build_vectorstore,
+    load_symbol_index,
+)
+
+
+class CountingEmbeddings(FakeEmbeddings):
+    embedded: int = 0
+
+    def embed_documents(self, texts):
+        self.embedded += len(texts)
+        return super().embed_documents(texts)
+
+
+class TestIncrementalIndex(unittest.TestCase):
+    def setUp(self):
+        self.repo = tempfile.TemporaryDirectory()
+        self.index = tempfile.TemporaryDirectory()
+        self.write("a.py", "print('a')")
+        self.write("b.py", "print('b')")
+
+    def tearDown(self):
+        self.repo.cleanup()
+        self.index.cleanup()
+
+    def write(self, name, content):
+        with open(os.path.join(self.repo.name, name), "w") as file:
+            file.write(content)
+
+    def build(self, **kwargs):
+        embeddings = CountingEmbeddings(size=EMBEDDING_SIZE)
+        vectorstore = load_or_build_vectorstore(
+            self.repo.name, index_dir=self.index.name, embeddings=embeddings, **kwargs
+        )
+        return vectorstore, embeddings
+
+    def test_warm_start_does_not_reembed(self):
+        _, embeddings = self.build()
+        self.assertEqual(embeddings.embedded, 2)
+
+        vectorstore, embeddings = self.build()
+        self.assertEqual(embeddings.embedded, 0)
+        self.assertEqual(vectorstore.index.ntotal, 2)
+
+    def test_streams_in_batches(self):
+        self.write("c.py", "\n".join(f"line_{i} = {i}" for i in range(300)))
+        vectorstore, embeddings = self.build(batch_size=2)
+        self.assertEqual(embeddings.embedded, vectorstore.index.ntotal)
+        self.assertGreater(vectorstore.index.ntotal, 3)
+        self.assertEqual(len(vectorstore.docstore._dict), vectorstore.index.ntotal)
+
+    def test_changed_and_deleted_files(self):
+        self.build()
+        self.write("a.py", "print('changed')")
+        os.remove(os.path.join(self.repo.name, "b.py"))
+
+        vectorstore, embeddings = self.build()
+        self.assertEqual(embeddings.embedded, 1)
+        self.assertEqual(vectorstore.index.ntotal, 1)
+        contents = [doc.page_content for doc in vectorstore.docstore._dict.values()]
+        self.assertEqual(contents, ["print('changed')"])
+        self.assertEqual(
+            list(load_manifest(self.index.name)["files"]),
+            [os.path.join(self.repo.name, "a.py")],
+        )
+        self.assertEqual(
+            list(load_symbol_index(self.index.name).files),
+            [os.path.join(self.repo.name, "a.py")],
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,247 @@
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+from langchain.chat_models.base import BaseChatModel
+from langchain.schema import (
+    BaseMessage,
+    ChatGeneration,
+    ChatResult,
+    messages_from_dict,
+    messages_to_dict,
+)
+
+from trace_utils import count
+
+DEFAULT_LLM_CACHE_PATH = os.path.join(
+    os.path.expanduser("~"), ".recurgpt", "llm_cache.sqlite"
+)
+DEFAULT_MAX_ENTRIES = 50_000
+DEFAULT_TTL_SECONDS = 7 * 24 * 60 * 60
+# Web search and Wolfram answers go stale much sooner than LLM responses
+LIVE_TOOL_TTL_SECONDS = 60 * 60
+# "cache" reads and writes, "replay" only reads and fails on a miss, "off" bypasses
+CACHE_MODES = ("cache", "replay", "off")
+
+# Prompts embed the current date and time, which would defeat every lookup
+DATE_TIME_PATTERN = re.compile(
+    r"\d{4}-\d{2}-\d{2}[ T]\d{2}:\d{2}:\d{2}|"
+    r"\b[A-Z][a-z]{2} [A-Z][a-z]{2} [ \d]\d \d{2}:\d{2}:\d{2} \d{4}\b"
+)
+WHITESPACE_PATTERN = re.compile(r"\s+")
+
+
+class ReplayMissError(RuntimeError):
+    """Raised in replay mode when a call was not recorded."""
+
+
+def normalize_prompt(text: str) -> str:
+    text = DATE_TIME_PATTERN.sub("<datetime>", text)
+    return WHITESPACE_PATTERN.sub(" ", text).strip()
+
+
+def cache_key(namespace: str, payload: Any) -> str:
+    serialized = json.dumps([namespace, payload], sort_keys=True, default=str)
+    return hashlib.sha256(serialized.encode("utf-8")).hexdigest()
+
+
+class LLMResponseCache:
+    """
+    Persistent response cache in SQLite keyed by a hash of namespace and prompt.
+
+    Entries older than ttl_seconds are ignored but kept, since replays still
+    serve them with allow_expired. Only the least recently used entries are
+    evicted, once max_entries is exceeded.
+    """
+
+    def __init__(
+        self,
+        cache_path: str = DEFAULT_LLM_CACHE_PATH,
+        max_entries: int = DEFAULT_MAX_ENTRIES,
+        ttl_seconds: Optional[float] = DEFAULT_TTL_SECONDS,
+    ):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+        if cache_path != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(cache_path)), exist_ok=True)
+        self._connection = sqlite3.connect(cache_path, check_same_thread=False)
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            "key TEXT PRIMARY KEY, namespace TEXT NOT NULL, response TEXT NOT NULL, "
+            "created REAL NOT NULL, last_used REAL NOT NULL)"
+        )
+        self._connection.execute(
+            "CREATE INDEX IF NOT EXISTS responses_last_used ON responses (last_used)"
+        )
+        self._connection.commit()
+
+    def get(
+        self,
+        key: str,
+        allow_expired: bool = False,
+        ttl_seconds: Optional[float] = None,
+    ) -> Optional[Any]:
+        """Return a cached response, ttl_seconds overrides the cache's TTL."""
+        now = time.time()
+        ttl_seconds = self.ttl_seconds if ttl_seconds is None else ttl_seconds
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT response, created FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+            expired = (
+                row is not None
+                and ttl_seconds is not None
+                and now - row[1] > ttl_seconds
+            )
+            if row is None or (expired and not allow_expired):
+                self.misses += 1
+                return None
+            self._connection.execute(
+                "UPDATE responses SET last_used = ? WHERE key = ?", (now, key)
+            )
+            self._connection.commit()
+        self.hits += 1
+        return json.loads(row[0])
+
+    def put(self, key: str, namespace: str, response: Any):
+        now = time.time()
+        with self._lock:
+            self._connection.execute(
+                "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?)",
+                (key, namespace, json.dumps(response), now, now),
+            )
+            self._evict()
+            self._connection.commit()
+
+    def _evict(self):
+        (entries,) = self._connection.execute(
+            "SELECT COUNT(*) FROM responses"
+        ).fetchone()
+        overflow = entries - self.max_entries
+        if overflow > 0:
+            self._connection.execute(
+                "DELETE FROM responses WHERE rowid IN ("
+                "SELECT rowid FROM responses ORDER BY last_used LIMIT ?)",
+                (overflow,),
+            )
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            (entries,) = self._connection.execute(
+                "SELECT COUNT(*) FROM responses"
+            ).fetchone()
+        return {"hits": self.hits, "misses": self.misses, "entries": entries}
+
+
+class CachedChatModel(BaseChatModel):
+    """Chat model wrapper that serves repeated prompts from an LLMResponseCache."""
+
+    llm: BaseChatModel
+    cache: Any
+    mode: str = "cache"
+
+    @property
+    def _llm_type(self) -> str:
+        return f"cached-{self.llm._llm_type}"
+
+    def get_num_tokens(self, text: str) -> int:
+        return self.llm.get_num_tokens(text)
+
+    def get_num_tokens_from_messages(self, messages: List[BaseMessage]) -> int:
+        return self.llm.get_num_tokens_from_messages(messages)
+
+    def key(self, messages: List[BaseMessage], stop: Optional[List[str]]) -> str:
+        params = dict(getattr(self.llm, "_identifying_params", {}))
+        payload = {
+            "params": params,
+            "stop": stop,
+            "messages": [
+                [message.type, normalize_prompt(message.content)]
+                for message in messages
+            ],
+        }
+        return cache_key(self.llm._llm_type, payload)
+
+    def lookup(self, key: str) -> Optional[ChatResult]:
+        if self.mode == "off":
+            return None
+        cached = self.cache.get(key, allow_expired=self.mode == "replay")
+        count("llm_cache_hits" if cached is not None else "llm_cache_misses")
+        if cached is None:
+            if self.mode == "replay":
+                raise ReplayMissError(
+                    "No recorded LLM response for this prompt; record the session "
+                    "with the cache enabled before replaying it."
+                )
+            return None
+        generations = [
+            ChatGeneration(message=message)
+            for message in messages_from_dict(cached["messages"])
+        ]
+        return ChatResult(generations=generations, llm_output=cached.get("llm_output"))
+
+    def store(self, key: str, result: ChatResult):
+        if self.mode != "cache":
+            return
+        response = {
+            "messages": messages_to_dict(
+                [generation.message for generation in result.generations]
+            ),
+            "llm_output": result.llm_output,
+        }
+        self.cache.put(key, self.llm._llm_type, response)
+
+    def _generate(self, messages, stop=None, run_manager=None) -> ChatResult:
+        key = self.key(messages, stop)
+        result = self.lookup(key)
+        if result is None:
+            result = self.llm._generate(messages, stop=stop)
+            self.store(key, result)
+        return result
+
+    async def _agenerate(self, messages, stop=None, run_manager=None) -> ChatResult:
+        key = self.key(messages, stop)
+        result = self.lookup(key)
+        if result is None:
+            result = await self.llm._agenerate(messages, stop=stop)
+            self.store(key, result)
+        return result
+
+
+def cached_function(
+    func: Callable[[str], str],
+    cache: LLMResponseCache,
+    namespace: str,
+    mode: str,
+    ttl_seconds: Optional[float] = None,
+) -> Callable[[str], str]:
+    """
+    Cache a text-in text-out tool function, such as a web search, like the LLM.
+
+    ttl_seconds gives results a shorter lifetime than the cache's own TTL,
+    replays still serve them however old they are.
+    """
+    if mode == "off":
+        return func
+
+    def run(query: str) -> str:
+        key = cache_key(namespace, normalize_prompt(query))
+        cached = cache.get(key, allow_expired=mode == "replay", ttl_seconds=ttl_seconds)
+        if cached is not None:
+            return cached
+        if mode == "replay":
+            raise ReplayMissError(f"No recorded {namespace} result for '{query}'.")
+        result = func(query)
+        cache.put(key, namespace, result)
+        return result
+
+    return run
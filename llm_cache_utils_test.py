@@ -0,0 +1,158 @@
+import asyncio
+import time
+import unittest
+
+from langchain.chat_models.base import BaseChatModel
+from langchain.schema import AIMessage, ChatGeneration, ChatResult, HumanMessage
+
+from llm_cache_utils import (
+    CachedChatModel,
+    LLMResponseCache,
+    ReplayMissError,
+    cached_function,
+    normalize_prompt,
+)
+
+
+class EchoChatModel(BaseChatModel):
+    """Chat model that echoes the last message and counts its calls."""
+
+    calls: int = 0
+
+    @property
+    def _llm_type(self) -> str:
+        return "echo"
+
+    @property
+    def _identifying_params(self):
+        return {"model_name": "echo", "temperature": 0}
+
+    def _generate(self, messages, stop=None, run_manager=None) -> ChatResult:
+        self.calls += 1
+        reply = AIMessage(content=f"echo: {messages[-1].content}")
+        return ChatResult(generations=[ChatGeneration(message=reply)])
+
+    async def _agenerate(self, messages, stop=None, run_manager=None) -> ChatResult:
+        return self._generate(messages, stop)
+
+
+class TestCachedChatModel(unittest.TestCase):
+    def setUp(self):
+        self.cache = LLMResponseCache(":memory:")
+        self.echo = EchoChatModel()
+        self.llm = CachedChatModel(llm=self.echo, cache=self.cache)
+
+    def test_repeated_prompts_hit_the_cache(self):
+        first = self.llm([HumanMessage(content="The time is Sun Oct 18 09:15:01 2026")])
+        second = self.llm(
+            [HumanMessage(content="The time is Mon Oct 19 10:00:00 2026")]
+        )
+        self.assertEqual(first.content, second.content)
+        self.assertEqual(self.echo.calls, 1)
+        self.llm([HumanMessage(content="something else")])
+        self.assertEqual(self.echo.calls, 2)
+        self.assertEqual(self.cache.stats()["hits"], 1)
+
+    def test_async_calls_use_the_cache(self):
+        messages = [[HumanMessage(content="hello")]]
+        asyncio.run(self.llm.agenerate(messages))
+        asyncio.run(self.llm.agenerate(messages))
+        self.assertEqual(self.echo.calls, 1)
+
+    def test_replay_serves_recorded_responses_only(self):
+        self.llm([HumanMessage(content="recorded")])
+        replay = CachedChatModel(llm=self.echo, cache=self.cache, mode="replay")
+        self.assertEqual(
+            replay([HumanMessage(content="recorded")]).content, "echo: recorded"
+        )
+        with self.assertRaises(ReplayMissError):
+            replay([HumanMessage(content="never recorded")])
+        self.assertEqual(self.echo.calls, 1)
+
+    def test_off_mode_bypasses_the_cache(self):
+        llm = CachedChatModel(llm=self.echo, cache=self.cache, mode="off")
+        llm([HumanMessage(content="hello")])
+        llm([HumanMessage(content="hello")])
+        self.assertEqual(self.echo.calls, 2)
+        self.assertEqual(self.cache.stats()["entries"], 0)
+
+
+class TestLLMResponseCache(unittest.TestCase):
+    def test_ttl_expires_entries(self):
+        cache = LLMResponseCache(":memory:", ttl_seconds=0.05)
+        cache.put("key", "test", "value")
+        self.assertEqual(cache.get("key"), "value")
+        time.sleep(0.1)
+        self.assertIsNone(cache.get("key"))
+        self.assertEqual(cache.get("key", allow_expired=True), "value")
+        # Writes in cache mode keep expired entries for replays
+        cache.put("other", "test", "value")
+        self.assertEqual(cache.stats()["entries"], 2)
+        self.assertEqual(cache.get("key", allow_expired=True), "value")
+
+    def test_size_evicts_least_recently_used(self):
+        cache = LLMResponseCache(":memory:", max_entries=2)
+        cache.put("a", "test", 1)
+        cache.put("b", "test", 2)
+        time.sleep(0.01)
+        cache.get("a")
+        cache.put("c", "test", 3)
+        self.assertEqual(cache.get("a"), 1)
+        self.assertIsNone(cache.get("b"))
+        self.assertEqual(cache.get("c"), 3)
+
+    def test_cached_function(self):
+        cache = LLMResponseCache(":memory:")
+        calls = []
+
+        def search(query):
+            calls.append(query)
+            return query.upper()
+
+        cached = cached_function(search, cache, "Search", "cache")
+        self.assertEqual(cached("python"), "PYTHON")
+        self.assertEqual(cached("python "), "PYTHON")
+        self.assertEqual(calls, ["python"])
+        replay = cached_function(search, cache, "Search", "replay")
+        with self.assertRaises(ReplayMissError):
+            replay("rust")
+
+    def test_cached_function_ttl(self):
+        cache = LLMResponseCache(":memory:")
+        calls = []
+
+        def search(query):
+            calls.append(query)
+            return f"{query} {len(calls)}"
+
+        cached = cached_function(search, cache, "Search", "cache", ttl_seconds=0.01)
+        self.assertEqual(cached("news"), "news 1")
+        time.sleep(0.02)
+        self.assertEqual(cached("news"), "news 2")
+        time.sleep(0.02)
+        replay = cached_function(search, cache, "Search", "replay", ttl_seconds=0.01)
+        self.assertEqual(replay("news"), "news 2")
+        self.assertEqual(len(calls), 2)
+
+    def test_replay_after_cache_mode_writes(self):
+        cache = LLMResponseCache(":memory:", ttl_seconds=0.05)
+        recorded = cached_function(str.upper, cache, "Search", "cache")
+        self.assertEqual(recorded("session"), "SESSION")
+        time.sleep(0.1)
+        # A later cache-mode run writes new entries after the recording aged
+        self.assertEqual(recorded("other"), "OTHER")
+
+        def offline(query):
+            raise AssertionError("replay must not call the tool")
+
+        replay = cached_function(offline, cache, "Search", "replay")
+        self.assertEqual(replay("session"), "SESSION")
+
+    def test_normalize_prompt(self):
+        self.assertEqual(
+            normalize_prompt("at  2026-10-18 12:00:00\n now"), "at <datetime> now"
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,29 +1,188 @@
+import argparse
+import contextlib
+import importlib
+import os
+import sys
+import threading
+from typing import Optional, Tuple
+
 import globals
-from agent_utils import ask_agent, setup_agent
-from file_utils import (
-    create_FAISS_vectorstore,
-    load_documents_from_repository,
-    read_gitignore_and_exclude,
-    select_ignore_file,
-    select_project_repository,
-)
+from dialog_utils import select_ignore_file, select_project_repository
+
+# Importing langchain, faiss and openai takes seconds, so these load in the
+# background while the repository is being selected
+PRELOAD_MODULES = ("openai", "agent_utils", "index_utils", "watch_utils")
+
+
+def preload_modules() -> threading.Thread:
+    def preload():
+        for name in PRELOAD_MODULES:
+            importlib.import_module(name)
+
+    thread = threading.Thread(target=preload, name="preload", daemon=True)
+    thread.start()
+    return thread
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Software development agent for a project repository."
+    )
+    parser.add_argument(
+        "--repo",
+        action="append",
+        help="Project repository, a dialog asks for it when omitted. Repeat it, "
+        "optionally as NAME=PATH, to index several repositories as shards",
+    )
+    parser.add_argument("--ignore-file", help="Extra gitignore-style file")
+    parser.add_argument(
+        "--index-dir",
+        help="Index location, one subdirectory per repository with several "
+        "(default: ~/.recurgpt/indexes/...)",
+    )
+    parser.add_argument(
+        "--batch",
+        metavar="FILE",
+        help="Run the JSONL objectives in FILE ('-' for stdin) and exit",
+    )
+    parser.add_argument(
+        "--output",
+        default="-",
+        help="JSONL file for batch results (default: stdout, logs go to stderr)",
+    )
+    parser.add_argument(
+        "--concurrency", type=int, default=1, help="Objectives run at once"
+    )
+    parser.add_argument(
+        "--serve",
+        action="store_true",
+        help="Serve agent sessions and retrieval over HTTP instead of prompting",
+    )
+    parser.add_argument("--host", default="127.0.0.1", help="Host to serve on")
+    parser.add_argument("--port", type=int, default=8765, help="Port to serve on")
+    parser.add_argument("--socket", help="Serve on this Unix socket instead")
+    parser.add_argument("--llm-cache", help="LLM cache mode: cache, replay or off")
+    parser.add_argument(
+        "--no-watch",
+        action="store_true",
+        help="Do not re-index files changed during the session",
+    )
+    args = parser.parse_args(argv)
+    if args.batch and args.serve:
+        parser.error("--batch and --serve cannot be combined")
+    if (args.batch or args.serve) and not args.repo:
+        parser.error(f"--{'batch' if args.batch else 'serve'} requires --repo")
+    if args.concurrency < 1:
+        parser.error("--concurrency must be at least 1")
+    return args
+
+
+def split_repository_spec(spec: str) -> Tuple[Optional[str], str]:
+    """Split "name=path" into its name and path, plain paths have no name."""
+    name, separator, path = spec.partition("=")
+    if separator and name and os.sep not in name:
+        return name, path
+    return None, spec
 
 
-def main():
+def main(argv=None) -> int:
+    args = parse_args(argv)
+    if args.batch and args.output == "-":
+        # stdout only carries the results, everything else goes to stderr
+        results = sys.stdout
+        with contextlib.redirect_stdout(sys.stderr):
+            return run(args, results)
+    return run(args)
+
+
+def run(args, results=None) -> int:
     print("Welcome to the RecurGPT! Lets begin with selecting a project repository")
+    preload_modules()
 
-    project_repository = select_project_repository()
-    print(f"Project repository selected: {project_repository}")
-    ignore_file = select_ignore_file(initial_dir=project_repository)
+    if args.repo:
+        repositories = [split_repository_spec(spec) for spec in args.repo]
+        repositories = [(name, os.path.abspath(path)) for name, path in repositories]
+        ignore_file = args.ignore_file
+    else:
+        project_repository = select_project_repository()
+        print(f"Project repository selected: {project_repository}")
+        ignore_file = args.ignore_file or select_ignore_file(
+            initial_dir=project_repository
+        )
+        repositories = [(None, project_repository)]
     print(f"Ignore file selected: {ignore_file}")
 
+    # Blocks only until the preload thread has finished these imports
+    from file_utils import read_gitignore_and_exclude
+    from watch_utils import RepositoryWatcher
+
+    # The first repository anchors the ignore patterns of the file tools
+    project_repository = repositories[0][1]
+    globals.project_repository = project_repository
     globals.ignore_patterns = read_gitignore_and_exclude(
         project_repository, ignore_file
     )
 
-    documents = load_documents_from_repository(project_repository, ignore_file)
-    # preview_documents(documents) # Uncomment this line to preview the documentss
-    vectorstore = create_FAISS_vectorstore(documents)
+    if len(repositories) == 1:
+        from index_utils import (
+            default_index_dir,
+            load_or_build_vectorstore,
+            load_symbol_index,
+            load_trigram_index,
+        )
+        from retrieval_utils import HybridRetriever
+
+        # Loads the persisted index and only re-embeds new or changed files
+        index_dir = args.index_dir or default_index_dir(project_repository)
+        vectorstore = load_or_build_vectorstore(
+            project_repository, ignore_file, index_dir
+        )
+        globals.symbol_index = load_symbol_index(index_dir)
+        globals.trigram_index = load_trigram_index(index_dir)
+        retriever = HybridRetriever(vectorstore)
+        indexes = [
+            (
+                project_repository,
+                vectorstore,
+                index_dir,
+                globals.symbol_index,
+                globals.trigram_index,
+            )
+        ]
+    else:
+        from shard_utils import ShardedIndex, ShardedSymbolIndex, ShardedTrigramIndex
+
+        # One index per repository, each loaded and updated on its own
+        retriever = ShardedIndex(index_root=args.index_dir)
+        for name, path in repositories:
+            retriever.add_repository(path, name, ignore_file)
+        globals.symbol_index = ShardedSymbolIndex(retriever)
+        globals.trigram_index = ShardedTrigramIndex(retriever)
+        indexes = [
+            (
+                shard.folder_path,
+                shard.vectorstore,
+                shard.index_dir,
+                shard.symbol_index,
+                shard.trigram_index,
+            )
+            for shard in retriever.shards.values()
+        ]
+
+    # Re-index files edited during the session so searches stay current
+    watchers = []
+    if not args.no_watch:
+        for folder_path, vectorstore, index_dir, symbol_index, trigram_index in indexes:
+            watchers.append(
+                RepositoryWatcher(
+                    folder_path,
+                    vectorstore,
+                    index_dir,
+                    ignore_file,
+                    symbol_index=symbol_index,
+                    trigram_index=trigram_index,
+                ).start()
+            )
 
     # docsearch = chroma_vectorize(documents)
 
@@ -32,10 +191,32 @@ def main():
     #     OpenAI(temperature=0), chain_type="stuff", retriever=docsearch.as_retriever()
     # )
 
+    project_directory = ", ".join(path for _, path in repositories)
+    try:
+        if args.batch:
+            return run_batch(args, retriever, project_directory, results)
+        if args.serve:
+            return run_server(args, retriever, project_directory)
+        run_interactive(args, retriever, project_directory)
+        return 0
+    finally:
+        for watcher in watchers:
+            watcher.stop()
+
+
+def agent_options(args) -> dict:
+    return {"llm_cache_mode": args.llm_cache} if args.llm_cache else {}
+
+
+def run_interactive(args, retriever, project_directory):
+    from agent_utils import ask_agent, setup_agent
+
     # Setup the agent
-    agent = setup_agent(vectorstore, project_repository)
+    agent = setup_agent(
+        None, project_directory, context_retriever=retriever, **agent_options(args)
+    )
 
-    print("Project repository selected: " + project_repository)
+    print("Project repository selected: " + project_directory)
     print("Now, lets begin with the agent!")
 
     while True:
@@ -51,6 +232,71 @@ def main():
         print(f"Agent: {response}")
 
 
+def run_batch(args, retriever, project_directory, results=None) -> int:
+    from agent_utils import ask_agent, setup_agent
+    from batch_utils import read_objectives, run_objectives
+    from llm_cache_utils import LLMResponseCache
+
+    if args.batch == "-":
+        objectives = read_objectives(sys.stdin)
+    else:
+        with open(args.batch, "r") as batch_file:
+            objectives = read_objectives(batch_file)
+
+    # Each objective gets its own agent and memory, the index, retriever and
+    # response cache are loaded once for the whole batch
+    shared = {
+        "context_retriever": retriever,
+        "response_cache": LLMResponseCache(),
+        "verbose": False,
+        **agent_options(args),
+    }
+
+    def answer(objective: str) -> str:
+        agent = setup_agent(None, project_directory, **shared)
+        return ask_agent(agent, objective)
+
+    with contextlib.ExitStack() as stack:
+        if results is None:
+            results = stack.enter_context(open(args.output, "w"))
+        summary = run_objectives(objectives, answer, results, args.concurrency)
+
+    print(
+        f"Ran {summary['objectives']} objectives in {summary['seconds']}s, "
+        f"{summary['failed']} failed."
+    )
+    return 1 if summary["failed"] else 0
+
+
+def run_server(args, retriever, project_directory) -> int:
+    from agent_utils import ask_agent, setup_agent
+    from llm_cache_utils import LLMResponseCache
+    from server_utils import AgentServer, make_server
+
+    # Sessions get their own agent, the index, retriever and response cache
+    # are shared by every client
+    shared = {
+        "context_retriever": retriever,
+        "response_cache": LLMResponseCache(),
+        "verbose": False,
+        **agent_options(args),
+    }
+    agent_server = AgentServer(
+        lambda: setup_agent(None, project_directory, **shared),
+        ask_agent,
+        retriever,
+    )
+    server = make_server(agent_server, args.host, args.port, args.socket)
+    print(f"Serving {project_directory} on {args.socket or f'{args.host}:{args.port}'}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+    return 0
+
+
 if __name__ == "__main__":
     globals.initialize()
-    main()
+    sys.exit(main())
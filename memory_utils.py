@@ -0,0 +1,213 @@
+import re
+import uuid
+from collections import deque
+from typing import Callable, Dict, List, Optional, Set
+
+import numpy as np
+from langchain.docstore.document import Document
+from langchain.schema import BaseMessage, BaseRetriever, HumanMessage, SystemMessage
+from langchain.vectorstores import FAISS
+
+from ann_utils import IndexConfig
+from embedding_utils import text_hash
+from index_utils import evict_chunks
+from trace_utils import span
+
+# HNSW needs no training, so memory search stays sublinear as it grows
+MEMORY_INDEX_CONFIG = IndexConfig(kind="hnsw")
+SUMMARY_PREFIX = "Summary of earlier steps: "
+SUMMARY_PROMPT = (
+    "Condense the progress of an autonomous agent into a short summary. "
+    "Keep decisions, file names, results and open problems, drop everything "
+    "else. Answer with the summary only, in at most {max_words} words.\n\n"
+    "Current summary:\n{summary}\n\nNew steps:\n{steps}"
+)
+WORD_PATTERN = re.compile(r"\w+")
+
+
+def shingles(text: str, size: int = 3) -> Set[str]:
+    """Return the set of word n-grams used to spot near-identical memories."""
+    words = WORD_PATTERN.findall(text.lower())
+    if len(words) <= size:
+        return {" ".join(words)}
+    return {" ".join(words[i : i + size]) for i in range(len(words) - size + 1)}
+
+
+def jaccard(first: Set[str], second: Set[str]) -> float:
+    if not first or not second:
+        return 0.0
+    return len(first & second) / len(first | second)
+
+
+def llm_summarizer(llm, max_words: int = 200) -> Callable[[str, str], str]:
+    """Summarize with a chat model, one call per rollup."""
+
+    def summarize(summary: str, steps: str) -> str:
+        prompt = SUMMARY_PROMPT.format(
+            max_words=max_words, summary=summary or "(none)", steps=steps
+        )
+        return llm([HumanMessage(content=prompt)]).content.strip()
+
+    return summarize
+
+
+def truncating_summarizer(max_chars: int = 2000) -> Callable[[str, str], str]:
+    """Summarize without an LLM by keeping the most recent max_chars characters."""
+
+    def summarize(summary: str, steps: str) -> str:
+        combined = f"{summary}\n{steps}".strip()
+        return combined[-max_chars:]
+
+    return summarize
+
+
+class MemoryRetriever(BaseRetriever):
+    """Vector search over agent memories that records how often each is recalled."""
+
+    def __init__(self, manager: "AgentMemoryManager", k: int = 4):
+        self.manager = manager
+        self.k = k
+
+    def get_relevant_documents(self, query: str) -> List[Document]:
+        vectorstore = self.manager.vectorstore
+        if not vectorstore.index.ntotal:
+            return []
+        with span("memory.search", k=self.k):
+            embedding = vectorstore.embedding_function(query)
+            _, positions = vectorstore.index.search(
+                np.array([embedding], dtype=np.float32), self.k
+            )
+        documents = []
+        for position in positions[0]:
+            if position == -1:
+                continue
+            doc_id = vectorstore.index_to_docstore_id[position]
+            self.manager.recalls[doc_id] = self.manager.recalls.get(doc_id, 0) + 1
+            documents.append(vectorstore.docstore._dict[doc_id])
+        return documents
+
+    async def aget_relevant_documents(self, query: str) -> List[Document]:
+        return self.get_relevant_documents(query)
+
+
+class AgentMemoryManager:
+    """
+    Keep the agent's message history and long-term memory bounded.
+
+    The history keeps the last window_size messages, so together with the
+    summary it fits the ten messages the prompt reads; older ones are rolled
+    into a running summary every summary_every messages, which sits at the
+    front of the history. Memories that are near duplicates of recent ones
+    are dropped before embedding, and once max_memories is exceeded the
+    oldest, least recalled ones are evicted from the vectorstore.
+    """
+
+    def __init__(
+        self,
+        vectorstore: FAISS,
+        summarize: Optional[Callable[[str, str], str]] = None,
+        window_size: int = 8,
+        summary_every: int = 6,
+        max_memories: int = 500,
+        duplicate_threshold: float = 0.9,
+        duplicate_window: int = 50,
+        recall_weight: int = 20,
+        index_config: IndexConfig = MEMORY_INDEX_CONFIG,
+    ):
+        self.vectorstore = vectorstore
+        self.summarize = summarize or truncating_summarizer()
+        self.window_size = window_size
+        self.summary_every = summary_every
+        self.max_memories = max_memories
+        self.duplicate_threshold = duplicate_threshold
+        self.recall_weight = recall_weight
+        self.index_config = index_config
+        self.summary = ""
+        self.pending: List[BaseMessage] = []
+        # Memory id -> step at which it was stored and how often it was recalled
+        self.added: Dict[str, int] = {}
+        self.recalls: Dict[str, int] = {}
+        self.hashes: Dict[str, str] = {}
+        self.recent: deque = deque(maxlen=duplicate_window)
+        self.step = 0
+        self.skipped = 0
+        self.evicted = 0
+
+    def retriever(self, k: int = 4) -> MemoryRetriever:
+        return MemoryRetriever(self, k=k)
+
+    def add_messages(self, history: List[BaseMessage], messages: List[BaseMessage]):
+        """Append messages to history in place, rolling old ones into the summary."""
+        if history and self.is_summary(history[0]):
+            history.pop(0)
+        history.extend(messages)
+        overflow = len(history) - self.window_size
+        if overflow > 0:
+            self.pending.extend(history[:overflow])
+            del history[:overflow]
+        if len(self.pending) >= self.summary_every:
+            steps = "\n".join(
+                f"{message.type}: {message.content}" for message in self.pending
+            )
+            with span("memory.summarize", messages=len(self.pending)):
+                self.summary = self.summarize(self.summary, steps)
+            self.pending = []
+        if self.summary:
+            history.insert(0, SystemMessage(content=SUMMARY_PREFIX + self.summary))
+
+    @staticmethod
+    def is_summary(message: BaseMessage) -> bool:
+        return isinstance(message, SystemMessage) and message.content.startswith(
+            SUMMARY_PREFIX
+        )
+
+    def is_duplicate(self, text: str, text_shingles: Set[str]) -> bool:
+        if text_hash(text) in self.hashes:
+            return True
+        return any(
+            jaccard(text_shingles, previous) >= self.duplicate_threshold
+            for _, previous in self.recent
+        )
+
+    def remember(self, text: str) -> bool:
+        """Embed and store a memory; return False if it was a near duplicate."""
+        self.step += 1
+        text_shingles = shingles(text)
+        if self.is_duplicate(text, text_shingles):
+            self.skipped += 1
+            return False
+        # Several agents may share one memory vectorstore
+        doc_id = f"memory-{uuid.uuid4().hex}"
+        self.vectorstore.add_texts(
+            [text], metadatas=[{"step": self.step}], ids=[doc_id]
+        )
+        self.added[doc_id] = self.step
+        self.hashes[text_hash(text)] = doc_id
+        self.recent.append((doc_id, text_shingles))
+        # Evict in slices so the index is not rebuilt on every step
+        if len(self.added) > self.max_memories + max(1, self.max_memories // 10):
+            self.evict(len(self.added) - self.max_memories)
+        return True
+
+    def evict(self, count: int):
+        """Drop the count memories with the lowest recency plus recall score."""
+
+        def score(doc_id: str) -> int:
+            return self.added[doc_id] + self.recall_weight * self.recalls.get(doc_id, 0)
+
+        evicted = sorted(self.added, key=score)[:count]
+        evict_chunks(self.vectorstore, evicted, self.index_config)
+        evicted_set = set(evicted)
+        for doc_id in evicted:
+            self.added.pop(doc_id)
+            self.recalls.pop(doc_id, None)
+        self.hashes = {
+            digest: doc_id
+            for digest, doc_id in self.hashes.items()
+            if doc_id not in evicted_set
+        }
+        self.recent = deque(
+            (entry for entry in self.recent if entry[0] not in evicted_set),
+            maxlen=self.recent.maxlen,
+        )
+        self.evicted += len(evicted)
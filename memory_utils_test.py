@@ -0,0 +1,94 @@
+import unittest
+
+from langchain.docstore import InMemoryDocstore
+from langchain.schema import AIMessage, HumanMessage, SystemMessage
+from langchain.vectorstores import FAISS
+
+from ann_utils import create_index
+from memory_utils import (
+    MEMORY_INDEX_CONFIG,
+    SUMMARY_PREFIX,
+    AgentMemoryManager,
+    jaccard,
+    shingles,
+)
+from retrieval_utils_test import LetterEmbeddings
+
+
+def memory_vectorstore() -> FAISS:
+    embeddings = LetterEmbeddings()
+    index = create_index(26, MEMORY_INDEX_CONFIG)
+    return FAISS(embeddings.embed_query, index, InMemoryDocstore({}), {})
+
+
+class TestAgentMemoryManager(unittest.TestCase):
+    def setUp(self):
+        self.summaries = []
+
+        def summarize(summary, steps):
+            self.summaries.append(steps)
+            return f"{summary} [{steps.count(chr(10)) + 1} steps]".strip()
+
+        self.manager = AgentMemoryManager(
+            memory_vectorstore(),
+            summarize=summarize,
+            window_size=4,
+            summary_every=2,
+            max_memories=10,
+        )
+
+    def test_history_stays_bounded(self):
+        history = []
+        for step in range(100):
+            self.manager.add_messages(
+                history,
+                [HumanMessage(content="next"), AIMessage(content=f"reply {step}")],
+            )
+            self.manager.add_messages(
+                history, [SystemMessage(content=f"result {step}")]
+            )
+        # Window plus a single summary message
+        self.assertEqual(len(history), 5)
+        self.assertTrue(history[0].content.startswith(SUMMARY_PREFIX))
+        self.assertEqual(
+            sum(message.content.startswith(SUMMARY_PREFIX) for message in history), 1
+        )
+        self.assertEqual(history[-1].content, "result 99")
+        self.assertTrue(self.summaries)
+
+    def test_near_duplicates_are_skipped(self):
+        text = "Assistant Reply: list the files in the project folder Result: ok"
+        self.assertTrue(self.manager.remember(text))
+        self.assertFalse(self.manager.remember(text))
+        self.assertFalse(self.manager.remember(text + " ."))
+        self.assertTrue(self.manager.remember("Command CreateFile returned: done"))
+        self.assertEqual(self.manager.skipped, 2)
+        self.assertEqual(self.manager.vectorstore.index.ntotal, 2)
+
+    def test_eviction_keeps_recalled_memories(self):
+        retriever = self.manager.retriever(k=1)
+        self.manager.remember("zzzz zzzz zzzz")
+        for _ in range(5):
+            self.assertEqual(
+                retriever.get_relevant_documents("zzzz")[0].page_content,
+                "zzzz zzzz zzzz",
+            )
+        for step in range(30):
+            self.manager.remember(f"memory number {step} about a{'b' * step}")
+
+        vectorstore = self.manager.vectorstore
+        self.assertLessEqual(len(vectorstore.docstore._dict), 11)
+        self.assertEqual(vectorstore.index.ntotal, len(vectorstore.docstore._dict))
+        contents = [doc.page_content for doc in vectorstore.docstore._dict.values()]
+        self.assertIn("zzzz zzzz zzzz", contents)
+        self.assertIn("memory number 29 about a" + "b" * 29, contents)
+        self.assertNotIn("memory number 0 about a", contents)
+
+    def test_shingles_similarity(self):
+        first = shingles("open the main file and read it")
+        self.assertEqual(jaccard(first, first), 1.0)
+        self.assertLess(jaccard(first, shingles("write tests for the parser")), 0.5)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,242 @@
+import hashlib
+import os
+import re
+import tempfile
+import threading
+from typing import Dict, List, NamedTuple, Optional
+
+HUNK_HEADER_PATTERN = re.compile(r"^@@ -(\d+)(?:,\d+)? \+\d+(?:,\d+)? @@")
+SEARCH_REPLACE_PATTERN = re.compile(
+    r"<<<<<<< SEARCH\n(.*?)\n?=======\n(.*?)\n?>>>>>>> REPLACE", re.DOTALL
+)
+# An optional first line pinning the patch to the file version it was made for
+BASE_HASH_PATTERN = re.compile(r"^sha256:\s*([0-9a-f]{8,64})\s*\n", re.IGNORECASE)
+
+
+class PatchConflictError(ValueError):
+    """Raised when a patch does not apply cleanly to the current file."""
+
+
+class PatchResult(NamedTuple):
+    content: str
+    hunks: int
+    added: int
+    removed: int
+
+
+def content_hash(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+class FileVersions:
+    """
+    The sha256 of each file as the agent last saw it.
+
+    ViewCodeFiles records the hash of every file it shows and ModifyFile
+    writes only if the file still has it, so an edit made to a file after
+    the agent viewed it is not silently overwritten.
+    """
+
+    def __init__(self):
+        self._hashes: Dict[str, str] = {}
+        self._lock = threading.Lock()
+
+    def record(self, file_path: str, data_hash: str):
+        with self._lock:
+            self._hashes[os.path.abspath(file_path)] = data_hash
+
+    def get(self, file_path: str) -> Optional[str]:
+        with self._lock:
+            return self._hashes.get(os.path.abspath(file_path))
+
+
+def check_base_hash(file_path: str, current_hash: str, base_hash: Optional[str]):
+    if base_hash and not current_hash.startswith(base_hash):
+        raise PatchConflictError(
+            f"'{file_path}' changed since the patch was written (sha256 "
+            f"{current_hash[:12]}); view it again and regenerate the patch."
+        )
+
+
+def is_patch(text: str) -> bool:
+    text = BASE_HASH_PATTERN.sub("", text.lstrip(), count=1)
+    return (
+        text.startswith(("--- ", "@@ "))
+        or SEARCH_REPLACE_PATTERN.search(text) is not None
+    )
+
+
+class Hunk(NamedTuple):
+    start: int
+    old: List[str]
+    new: List[str]
+    added: int
+    removed: int
+
+
+def parse_unified_diff(diff: str) -> List[Hunk]:
+    hunks = []
+    for line in diff.split("\n"):
+        header = HUNK_HEADER_PATTERN.match(line)
+        if header:
+            hunks.append([int(header.group(1)), [], [], 0, 0])
+        elif not hunks or line.startswith("\\"):
+            # File headers before the first hunk, "\ No newline at end of file"
+            continue
+        elif line.startswith("-"):
+            hunks[-1][1].append(line[1:])
+            hunks[-1][4] += 1
+        elif line.startswith("+"):
+            hunks[-1][2].append(line[1:])
+            hunks[-1][3] += 1
+        else:
+            # LLMs often drop the leading space of blank context lines
+            context = line[1:] if line.startswith(" ") else line
+            hunks[-1][1].append(context)
+            hunks[-1][2].append(context)
+    for _, old, new, _, _ in hunks:
+        # A trailing newline in the diff is not a blank context line
+        while old and new and old[-1] == "" and new[-1] == "":
+            old.pop()
+            new.pop()
+    return [Hunk(*hunk) for hunk in hunks]
+
+
+def find_block(lines: List[str], block: List[str], expected: int) -> Optional[int]:
+    """Position of block in lines closest to expected, ignoring trailing spaces."""
+    if not block:
+        return min(max(expected, 0), len(lines))
+    stripped = [line.rstrip() for line in block]
+    positions = []
+    for position in range(len(lines) - len(block) + 1):
+        if lines[position].rstrip() != stripped[0]:
+            continue
+        window = lines[position : position + len(block)]
+        if [line.rstrip() for line in window] == stripped:
+            positions.append(position)
+    if not positions:
+        return None
+    return min(positions, key=lambda position: abs(position - expected))
+
+
+def apply_unified_diff(content: str, diff: str) -> PatchResult:
+    hunks = parse_unified_diff(diff)
+    if not hunks:
+        raise PatchConflictError("The diff contains no hunks.")
+    trailing_newline = content.endswith("\n")
+    lines = content.split("\n")
+    if trailing_newline:
+        lines.pop()
+    # Shift between the line numbers in the diff and the patched lines
+    offset = 0
+    for number, hunk in enumerate(hunks, start=1):
+        expected = max(hunk.start - 1, 0) + offset
+        position = find_block(lines, hunk.old, expected)
+        if position is None:
+            raise PatchConflictError(
+                f"Hunk {number} does not match the file; view the lines around "
+                f"line {hunk.start} again and regenerate the patch."
+            )
+        lines[position : position + len(hunk.old)] = hunk.new
+        offset = position + len(hunk.new) - max(hunk.start - 1, 0) - len(hunk.old)
+    patched = "\n".join(lines) + ("\n" if trailing_newline else "")
+    return PatchResult(
+        patched,
+        len(hunks),
+        sum(hunk.added for hunk in hunks),
+        sum(hunk.removed for hunk in hunks),
+    )
+
+
+def apply_search_replace(content: str, patch: str) -> PatchResult:
+    blocks = SEARCH_REPLACE_PATTERN.findall(patch)
+    if not blocks:
+        raise PatchConflictError("The patch contains no SEARCH/REPLACE blocks.")
+    added = removed = 0
+    for number, (search, replace) in enumerate(blocks, start=1):
+        matches = content.count(search) if search else 0
+        if matches != 1:
+            problem = "does not match" if matches == 0 else "matches several places"
+            raise PatchConflictError(
+                f"SEARCH block {number} {problem} in the file; it must match "
+                "exactly one place, including indentation."
+            )
+        content = content.replace(search, replace, 1)
+        added += replace.count("\n") + 1
+        removed += search.count("\n") + 1
+    return PatchResult(content, len(blocks), added, removed)
+
+
+def apply_patch(content: str, patch: str) -> PatchResult:
+    """Apply SEARCH/REPLACE blocks or a unified diff to content."""
+    if SEARCH_REPLACE_PATTERN.search(patch):
+        return apply_search_replace(content, patch)
+    return apply_unified_diff(content, patch)
+
+
+def atomic_write(file_path: str, data: bytes, expected_hash: Optional[str] = None):
+    """
+    Replace a file through a temporary file and a rename.
+
+    Readers, including the index watcher, only ever see the old or the new
+    file. If expected_hash is given and the file no longer matches it, the
+    write is abandoned with a PatchConflictError.
+    """
+    directory = os.path.dirname(os.path.abspath(file_path))
+    descriptor, temp_path = tempfile.mkstemp(
+        dir=directory, prefix=f".{os.path.basename(file_path)}.", suffix=".tmp"
+    )
+    try:
+        with os.fdopen(descriptor, "wb") as temp_file:
+            temp_file.write(data)
+            temp_file.flush()
+            os.fsync(temp_file.fileno())
+        if os.path.exists(file_path):
+            os.chmod(temp_path, os.stat(file_path).st_mode & 0o7777)
+            if expected_hash is not None:
+                with open(file_path, "rb") as file:
+                    if content_hash(file.read()) != expected_hash:
+                        raise PatchConflictError(
+                            f"'{file_path}' was changed by someone else while "
+                            "it was being edited."
+                        )
+        os.replace(temp_path, file_path)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+
+
+def patch_file(
+    file_path: str, patch: str, base_hash: Optional[str] = None
+) -> PatchResult:
+    """
+    Apply a patch to a file atomically.
+
+    The patch is rejected if the file no longer has base_hash, or the hash
+    given on an optional "sha256: <hash>" first line (a prefix of at least
+    8 characters is enough). The file is also checked for changes made while
+    patching.
+    """
+    patch = patch.strip("\n")
+    match = BASE_HASH_PATTERN.match(patch + "\n")
+    if match:
+        base_hash = match.group(1).lower()
+        patch = patch[match.end() :]
+    with open(file_path, "rb") as file:
+        data = file.read()
+    current_hash = content_hash(data)
+    check_base_hash(file_path, current_hash, base_hash)
+    result = apply_patch(data.decode("utf-8"), patch)
+    atomic_write(file_path, result.content.encode("utf-8"), current_hash)
+    return result
+
+
+def replace_file(file_path: str, data: bytes, base_hash: Optional[str] = None):
+    """Replace a whole file atomically, unless it no longer has base_hash."""
+    current_hash = None
+    if base_hash and os.path.exists(file_path):
+        with open(file_path, "rb") as file:
+            current_hash = content_hash(file.read())
+        check_base_hash(file_path, current_hash, base_hash)
+    atomic_write(file_path, data, current_hash)
@@ -0,0 +1,120 @@
+import os
+import tempfile
+import unittest
+
+from agent_tools import ModifyFileTool, ViewCodeFilesTool
+from patch_utils import (
+    FileVersions,
+    PatchConflictError,
+    apply_patch,
+    content_hash,
+    patch_file,
+)
+
+ORIGINAL = "def add(a, b):\n    return a + b\n\n\ndef sub(a, b):\n    return a - b\n"
+
+
+class TestApplyPatch(unittest.TestCase):
+    def test_search_replace(self):
+        patch = "<<<<<<< SEARCH\n    return a - b\n=======\n    return b - a\n>>>>>>> REPLACE"
+        result = apply_patch(ORIGINAL, patch)
+        self.assertEqual(result.content, ORIGINAL.replace("a - b", "b - a"))
+        self.assertEqual(result.hunks, 1)
+
+    def test_search_must_match_once(self):
+        patch = "<<<<<<< SEARCH\n(a, b)\n=======\n(x, y)\n>>>>>>> REPLACE"
+        with self.assertRaises(PatchConflictError):
+            apply_patch(ORIGINAL, patch)
+
+    def test_unified_diff_with_wrong_line_numbers(self):
+        diff = (
+            "--- a/math.py\n+++ b/math.py\n"
+            "@@ -9,2 +9,3 @@\n def sub(a, b):\n-    return a - b\n"
+            "+    # Order matters\n+    return a - b\n"
+        )
+        result = apply_patch(ORIGINAL, diff)
+        self.assertEqual(
+            result.content,
+            ORIGINAL.replace(
+                "    return a - b", "    # Order matters\n    return a - b"
+            ),
+        )
+        self.assertEqual((result.added, result.removed), (2, 1))
+
+    def test_unified_diff_conflict(self):
+        diff = (
+            "@@ -1,2 +1,2 @@\n def mul(a, b):\n-    return a * b\n+    return b * a\n"
+        )
+        with self.assertRaises(PatchConflictError):
+            apply_patch(ORIGINAL, diff)
+
+
+class TestPatchFile(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, "math.py")
+        with open(self.path, "w") as file:
+            file.write(ORIGINAL)
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def read(self):
+        with open(self.path, "r") as file:
+            return file.read()
+
+    def test_base_hash_conflict(self):
+        patch = "<<<<<<< SEARCH\nadd\n=======\nplus\n>>>>>>> REPLACE"
+        with self.assertRaises(PatchConflictError):
+            patch_file(self.path, "sha256: 0123456789abcdef\n" + patch)
+        self.assertEqual(self.read(), ORIGINAL)
+
+        digest = content_hash(ORIGINAL.encode("utf-8"))
+        patch_file(self.path, f"sha256: {digest[:12]}\n" + patch)
+        self.assertIn("def plus(a, b)", self.read())
+        # The temporary file was renamed into place
+        self.assertEqual(os.listdir(self.directory.name), ["math.py"])
+
+    def test_modify_file_tool(self):
+        tool = ModifyFileTool()
+        output = tool._run(
+            f"{self.path}, <<<<<<< SEARCH\n    return a + b\n=======\n"
+            "    return b + a\n>>>>>>> REPLACE"
+        )
+        self.assertIn("modified successfully (1 hunks, +1 -1 lines)", output)
+        self.assertIn("    return b + a\n", self.read())
+
+        output = tool._run(f"{self.path}, @@ -1,1 +1,1 @@\n-def nothing():\n+x")
+        self.assertTrue(output.startswith("Error: The patch was not applied."))
+
+        tool._run(f"{self.path}, print('replaced')")
+        self.assertEqual(self.read(), "print('replaced')")
+
+    def test_modify_file_after_external_edit(self):
+        file_versions = FileVersions()
+        view = ViewCodeFilesTool(file_versions=file_versions)
+        modify = ModifyFileTool(file_versions=file_versions)
+        patch = "<<<<<<< SEARCH\n    return a + b\n=======\n    return b + a\n>>>>>>> REPLACE"
+        self.assertIn("def add(a, b)", view._run(self.path))
+
+        # Someone else edits the file after the agent viewed it
+        with open(self.path, "a") as file:
+            file.write("\n# edited elsewhere\n")
+        output = modify._run(f"{self.path}, {patch}")
+        self.assertTrue(output.startswith("Error: The patch was not applied."))
+        output = modify._run(f"{self.path}, print('replaced')")
+        self.assertTrue(output.startswith("Error: The patch was not applied."))
+        self.assertTrue(self.read().endswith("# edited elsewhere\n"))
+
+        # Viewing it again picks up the edit, and the agent's own edits
+        # do not count as changes made behind its back
+        view._run(self.path)
+        self.assertIn("modified successfully", modify._run(f"{self.path}, {patch}"))
+        self.assertIn(
+            "modified successfully", modify._run(f"{self.path}, print('replaced')")
+        )
+        self.assertEqual(self.read(), "print('replaced')")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,322 @@
+import math
+import re
+from collections import Counter
+from typing import Dict, Hashable, Iterable, List, NamedTuple, Optional, Set, Tuple
+
+import numpy as np
+from langchain.docstore.document import Document
+from langchain.schema import BaseRetriever
+from langchain.vectorstores import FAISS
+
+from ann_utils import vectorstore_lock, vectorstore_version
+from embedding_utils import estimate_tokens
+from trace_utils import span
+
+TOKEN_PATTERN = re.compile(r"[A-Za-z_][A-Za-z0-9_]*|\d+")
+CAMEL_CASE_PATTERN = re.compile(r"[A-Z]+(?=[A-Z][a-z])|[A-Z]?[a-z]+|[A-Z]+|\d+")
+# Standard constant for reciprocal rank fusion
+RRF_K = 60
+
+# (docstore id, document, score), best first
+Hit = Tuple[str, Document, float]
+
+
+def tokenize(text: str) -> List[str]:
+    """Split text into lowercase terms, keeping identifiers and their parts."""
+    terms = []
+    for identifier in TOKEN_PATTERN.findall(text):
+        terms.append(identifier.lower())
+        parts = [
+            part.lower()
+            for piece in identifier.split("_")
+            for part in CAMEL_CASE_PATTERN.findall(piece)
+        ]
+        if len(parts) > 1:
+            terms.extend(parts)
+    return terms
+
+
+class CorpusStatistics(NamedTuple):
+    """What BM25 needs to know about a corpus to score a query."""
+
+    doc_count: int
+    total_length: int
+    # Number of documents containing each query term
+    doc_freqs: Dict[str, int]
+
+
+def merge_statistics(statistics: Iterable[CorpusStatistics]) -> CorpusStatistics:
+    """Statistics of the union of several corpora."""
+    doc_count = 0
+    total_length = 0
+    doc_freqs: Counter = Counter()
+    for corpus in statistics:
+        doc_count += corpus.doc_count
+        total_length += corpus.total_length
+        doc_freqs.update(corpus.doc_freqs)
+    return CorpusStatistics(doc_count, total_length, dict(doc_freqs))
+
+
+class BM25Index:
+    """In-process inverted index scored with Okapi BM25."""
+
+    def __init__(self, k1: float = 1.5, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self.postings: Dict[str, Dict[str, int]] = {}
+        self.doc_terms: Dict[str, Counter] = {}
+        self.doc_lengths: Dict[str, int] = {}
+        self.total_length = 0
+
+    def __len__(self) -> int:
+        return len(self.doc_terms)
+
+    def add(self, doc_id: str, text: str):
+        if doc_id in self.doc_terms:
+            self.remove(doc_id)
+        terms = Counter(tokenize(text))
+        self.doc_terms[doc_id] = terms
+        self.doc_lengths[doc_id] = sum(terms.values())
+        self.total_length += self.doc_lengths[doc_id]
+        for term, count in terms.items():
+            self.postings.setdefault(term, {})[doc_id] = count
+
+    def remove(self, doc_id: str):
+        terms = self.doc_terms.pop(doc_id, None)
+        if terms is None:
+            return
+        self.total_length -= self.doc_lengths.pop(doc_id)
+        for term in terms:
+            posting = self.postings[term]
+            posting.pop(doc_id, None)
+            if not posting:
+                del self.postings[term]
+
+    def statistics(self, terms: Set[str]) -> CorpusStatistics:
+        return CorpusStatistics(
+            len(self.doc_terms),
+            self.total_length,
+            {term: len(self.postings.get(term, ())) for term in terms},
+        )
+
+    def search(
+        self,
+        query: str,
+        k: int = 10,
+        statistics: Optional[CorpusStatistics] = None,
+    ) -> List[Tuple[str, float]]:
+        """
+        Best k documents for query. Pass the statistics of a larger corpus
+        to get scores comparable with other indexes of that corpus.
+        """
+        if not self.doc_terms:
+            return []
+        terms = set(tokenize(query))
+        statistics = statistics or self.statistics(terms)
+        doc_count = statistics.doc_count
+        average_length = statistics.total_length / doc_count
+        scores: Dict[str, float] = {}
+        for term in terms:
+            posting = self.postings.get(term)
+            if not posting:
+                continue
+            doc_freq = statistics.doc_freqs.get(term, len(posting))
+            idf = math.log(1 + (doc_count - doc_freq + 0.5) / (doc_freq + 0.5))
+            for doc_id, count in posting.items():
+                length = self.doc_lengths[doc_id]
+                norm = self.k1 * (1 - self.b + self.b * length / average_length)
+                scores[doc_id] = scores.get(doc_id, 0.0) + idf * count * (
+                    self.k1 + 1
+                ) / (count + norm)
+        return sorted(scores.items(), key=lambda item: item[1], reverse=True)[:k]
+
+
+def reciprocal_rank_fusion(
+    rankings: Iterable[List[Tuple[Hashable, Document]]],
+) -> List[Tuple[Document, float]]:
+    """Merge rankings of (key, document) pairs into one, with fused scores."""
+    fused: Dict[Hashable, float] = {}
+    documents: Dict[Hashable, Document] = {}
+    for ranking in rankings:
+        for rank, (key, document) in enumerate(ranking):
+            fused[key] = fused.get(key, 0.0) + 1 / (RRF_K + rank + 1)
+            documents[key] = document
+    return [
+        (documents[key], score)
+        for key, score in sorted(fused.items(), key=lambda item: item[1], reverse=True)
+    ]
+
+
+def select_within_budget(
+    documents: Iterable[Document], k: int, token_budget: int
+) -> List[Document]:
+    """Take documents in order until k of them or token_budget is reached."""
+    selected = []
+    tokens = 0
+    for document in documents:
+        document_tokens = estimate_tokens(document.page_content)
+        if selected and tokens + document_tokens > token_budget:
+            break
+        selected.append(document)
+        tokens += document_tokens
+        if len(selected) >= k:
+            break
+    return selected
+
+
+def document_location(document: Document) -> str:
+    location = document.metadata.get("source", "unknown")
+    if "start_line" in document.metadata:
+        location += (
+            f":{document.metadata['start_line']}-{document.metadata['end_line']}"
+        )
+    return location
+
+
+class HybridRetriever(BaseRetriever):
+    """
+    Retrieve chunks by fusing BM25 and FAISS rankings.
+
+    Both rankings are merged with reciprocal rank fusion, so exact identifier
+    matches surface even when their embeddings are not the nearest ones.
+    Results are capped at k documents and token_budget estimated tokens.
+
+    The fusion uses ranks only and drops the raw scores. BM25 scores are
+    unbounded and depend on the corpus statistics, while FAISS returns
+    distances whose scale depends on the index type. Normalizing the two
+    per query would let one outlier squash every other hit. Fused scores
+    are only comparable within one fusion: ShardedIndex ranks the raw hits
+    of all its shards together (see rankings) and fuses them once.
+    """
+
+    def __init__(
+        self,
+        vectorstore: FAISS,
+        k: int = 4,
+        token_budget: int = 2000,
+        candidates: int = 20,
+    ):
+        self.vectorstore = vectorstore
+        self.k = k
+        self.token_budget = token_budget
+        self.candidates = candidates
+        self.bm25 = BM25Index()
+        self.documents: Dict[str, Document] = {}
+        self.version = None
+        self.sync()
+
+    def sync(self):
+        """Bring the BM25 index in line with the vectorstore's docstore."""
+        documents = self.vectorstore.docstore._dict
+        for doc_id in set(self.documents) - set(documents):
+            self.bm25.remove(doc_id)
+            del self.documents[doc_id]
+        # Chunks replaced in place keep their ids but are new documents
+        for doc_id, document in documents.items():
+            if self.documents.get(doc_id) is not document:
+                self.bm25.add(doc_id, self.document_text(document))
+                self.documents[doc_id] = document
+        self.version = vectorstore_version(self.vectorstore)
+
+    @staticmethod
+    def document_text(document: Document) -> str:
+        # Symbol and path metadata make definitions findable by name
+        source = document.metadata.get("source", "")
+        symbols = document.metadata.get("symbols", "")
+        return f"{source} {symbols} {document.page_content}"
+
+    def get_relevant_documents(self, query: str) -> List[Document]:
+        scored = self.scored_documents(query)
+        return select_within_budget(
+            (document for document, _ in scored), self.k, self.token_budget
+        )
+
+    def scored_documents(
+        self, query: str, embedding: Optional[List[float]] = None
+    ) -> List[Tuple[Document, float]]:
+        """Candidates for query with their fused score, best first."""
+        sparse_hits, dense_hits = self.rankings(query, embedding)
+        return reciprocal_rank_fusion(
+            [(doc_id, document) for doc_id, document, _ in hits]
+            for hits in (sparse_hits, dense_hits)
+        )
+
+    def corpus_statistics(self, query: str) -> CorpusStatistics:
+        """BM25 statistics of the query terms in this index."""
+        with vectorstore_lock(self.vectorstore):
+            self._sync_if_stale()
+            return self.bm25.statistics(set(tokenize(query)))
+
+    def rankings(
+        self,
+        query: str,
+        embedding: Optional[List[float]] = None,
+        statistics: Optional[CorpusStatistics] = None,
+    ) -> Tuple[List[Hit], List[Hit]]:
+        """
+        BM25 and dense candidates for query, each best first.
+
+        BM25 hits are scored with statistics when given, dense hits by their
+        negated L2 distance, so hits of indexes sharing the statistics and
+        the embeddings can be ranked together.
+        """
+        # Embedding is a network call, so it runs before taking the lock and
+        # concurrent queries only wait for each other's in-memory searches
+        if embedding is None and self.vectorstore.index.ntotal:
+            with span("embed_query"):
+                embedding = self.vectorstore.embedding_function(query)
+        # The repository watcher may update the vectorstore concurrently
+        with vectorstore_lock(self.vectorstore):
+            return self._rankings(query, embedding, statistics)
+
+    def _sync_if_stale(self):
+        if self.version != vectorstore_version(self.vectorstore) or len(
+            self.bm25
+        ) != len(self.vectorstore.docstore._dict):
+            self.sync()
+
+    def _rankings(
+        self,
+        query: str,
+        embedding: Optional[List[float]] = None,
+        statistics: Optional[CorpusStatistics] = None,
+    ) -> Tuple[List[Hit], List[Hit]]:
+        self._sync_if_stale()
+        docstore = self.vectorstore.docstore._dict
+
+        with span("bm25.search"):
+            sparse_hits = [
+                (doc_id, docstore[doc_id], score)
+                for doc_id, score in self.bm25.search(
+                    query, self.candidates, statistics
+                )
+            ]
+
+        dense_hits = []
+        if self.vectorstore.index.ntotal:
+            # Search the index directly so hits map straight to docstore ids
+            if embedding is None:
+                with span("embed_query"):
+                    embedding = self.vectorstore.embedding_function(query)
+            with span("faiss.search", k=self.candidates):
+                distances, positions = self.vectorstore.index.search(
+                    np.array([embedding], dtype=np.float32), self.candidates
+                )
+            for distance, position in zip(distances[0], positions[0]):
+                if position != -1:
+                    doc_id = self.vectorstore.index_to_docstore_id[position]
+                    dense_hits.append((doc_id, docstore[doc_id], -float(distance)))
+        return sparse_hits, dense_hits
+
+    async def aget_relevant_documents(self, query: str) -> List[Document]:
+        return self.get_relevant_documents(query)
+
+    def run(self, query: str) -> str:
+        """Format the retrieved chunks for the Context tool."""
+        documents = self.get_relevant_documents(query)
+        if not documents:
+            return "No relevant context found in the project."
+        sections = []
+        for document in documents:
+            sections.append(f"[{document_location(document)}]\n{document.page_content}")
+        return "\n\n".join(sections)
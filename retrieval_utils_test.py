@@ -0,0 +1,112 @@
+import threading
+import unittest
+from typing import List
+
+from langchain.docstore.document import Document
+from langchain.embeddings.base import Embeddings
+from langchain.vectorstores import FAISS
+
+from ann_utils import vectorstore_lock
+from retrieval_utils import BM25Index, HybridRetriever, tokenize
+
+
+class LetterEmbeddings(Embeddings):
+    """Deterministic bag-of-letters embeddings for offline tests."""
+
+    def _embed(self, text: str) -> List[float]:
+        text = text.lower()
+        return [float(text.count(letter)) for letter in "abcdefghijklmnopqrstuvwxyz"]
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return [self._embed(text) for text in texts]
+
+    def embed_query(self, text: str) -> List[float]:
+        return self._embed(text)
+
+
+class TestBM25Index(unittest.TestCase):
+    def test_tokenize_splits_identifiers(self):
+        self.assertEqual(
+            tokenize("CustomAutoGPT.run(full_message_history)"),
+            [
+                "customautogpt",
+                "custom",
+                "auto",
+                "gpt",
+                "run",
+                "full_message_history",
+                "full",
+                "message",
+                "history",
+            ],
+        )
+
+    def test_search_and_remove(self):
+        index = BM25Index()
+        index.add("a", "def load_manifest(index_dir): pass")
+        index.add("b", "def save_manifest(index_dir, manifest): pass")
+        index.add("c", "print('hello world')")
+
+        self.assertEqual(index.search("load_manifest", k=1)[0][0], "a")
+        self.assertEqual(index.search("manifest")[0][0], "b")
+        index.remove("a")
+        self.assertEqual([doc_id for doc_id, _ in index.search("load")], [])
+
+
+class TestHybridRetriever(unittest.TestCase):
+    def setUp(self):
+        texts = [
+            "def ask_agent(agent, message): return agent.run([message])",
+            "aaaa bbbb cccc",
+            "class CustomAutoGPTPrompt(AutoGPTPrompt): prefix suffix",
+        ]
+        self.vectorstore = FAISS.from_texts(
+            texts,
+            LetterEmbeddings(),
+            metadatas=[
+                {"source": f"file{i}.py", "start_line": 1, "end_line": 1}
+                for i in range(3)
+            ],
+        )
+
+    def test_identifier_query_hits_first(self):
+        retriever = HybridRetriever(self.vectorstore, k=1)
+        documents = retriever.get_relevant_documents("CustomAutoGPTPrompt")
+        self.assertEqual(documents[0].metadata["source"], "file2.py")
+        self.assertTrue(retriever.run("ask_agent").startswith("[file0.py:1-1]\n"))
+
+    def test_token_budget_and_sync(self):
+        retriever = HybridRetriever(self.vectorstore, k=3, token_budget=1)
+        self.assertEqual(len(retriever.get_relevant_documents("agent")), 1)
+
+        self.vectorstore.add_texts(["def brand_new_symbol(): pass"])
+        retriever.k, retriever.token_budget = 3, 1000
+        documents = retriever.get_relevant_documents("brand_new_symbol")
+        self.assertEqual(documents[0].page_content, "def brand_new_symbol(): pass")
+
+    def test_query_embedded_outside_lock(self):
+        retriever = HybridRetriever(self.vectorstore, k=1)
+        embed = self.vectorstore.embedding_function
+        lock = vectorstore_lock(self.vectorstore)
+        held = []
+
+        def try_lock():
+            acquired = lock.acquire(blocking=False)
+            held.append(acquired)
+            if acquired:
+                lock.release()
+
+        def embedding_function(text):
+            # Another thread can take the lock while the query is embedded
+            thread = threading.Thread(target=try_lock)
+            thread.start()
+            thread.join()
+            return embed(text)
+
+        self.vectorstore.embedding_function = embedding_function
+        retriever.get_relevant_documents("ask_agent")
+        self.assertEqual(held, [True])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,289 @@
+import json
+import os
+import re
+import socketserver
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Callable, Dict, List, Optional
+
+from trace_utils import count, log, span
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8765
+DEFAULT_SESSION_TTL = 3600.0
+DEFAULT_MAX_SESSIONS = 32
+MAX_BODY_BYTES = 1 << 20
+
+SESSION_PATH = re.compile(r"^/sessions/([0-9a-f]+)(/ask)?$")
+
+
+class ServerError(Exception):
+    """Error reported to the client with an HTTP status."""
+
+    def __init__(self, status: int, message: str):
+        super().__init__(message)
+        self.status = status
+
+
+class Session:
+    __slots__ = ("id", "agent", "lock", "created", "last_used", "objectives")
+
+    def __init__(self, session_id: str, agent):
+        self.id = session_id
+        self.agent = agent
+        # One agent loop at a time, an agent's history is not thread safe
+        self.lock = threading.Lock()
+        self.created = time.time()
+        self.last_used = self.created
+        self.objectives = 0
+
+
+class AgentServer:
+    """
+    Agent sessions and retrieval over one loaded repository index.
+
+    Each session owns an agent built by create_agent, so its message history
+    and memory stay separate from other sessions. The index, retriever and
+    anything else create_agent closes over are shared. Sessions idle for
+    longer than session_ttl are dropped when new ones are created.
+    """
+
+    def __init__(
+        self,
+        create_agent: Callable[[], Any],
+        ask: Callable[[Any, str], str],
+        retriever=None,
+        session_ttl: float = DEFAULT_SESSION_TTL,
+        max_sessions: int = DEFAULT_MAX_SESSIONS,
+    ):
+        self.create_agent = create_agent
+        self.ask_agent = ask
+        self.retriever = retriever
+        self.session_ttl = session_ttl
+        self.max_sessions = max_sessions
+        self.sessions: Dict[str, Session] = {}
+        self.started = time.time()
+        self._lock = threading.Lock()
+
+    def create_session(self) -> str:
+        with self._lock:
+            self._expire_sessions()
+            if len(self.sessions) >= self.max_sessions:
+                raise ServerError(503, "Too many open sessions, close one first.")
+            session_id = uuid.uuid4().hex
+            # Reserve the slot, the agent is built outside the lock
+            self.sessions[session_id] = None
+        try:
+            with span("server.create_session"):
+                agent = self.create_agent()
+        except Exception:
+            with self._lock:
+                del self.sessions[session_id]
+            raise
+        with self._lock:
+            self.sessions[session_id] = Session(session_id, agent)
+        log(f"Session {session_id} opened")
+        return session_id
+
+    def close_session(self, session_id: str):
+        with self._lock:
+            if self.sessions.pop(session_id, None) is None:
+                raise ServerError(404, f"Unknown session '{session_id}'.")
+        log(f"Session {session_id} closed")
+
+    def session(self, session_id: str) -> Session:
+        with self._lock:
+            session = self.sessions.get(session_id)
+        if session is None:
+            raise ServerError(404, f"Unknown session '{session_id}'.")
+        return session
+
+    def ask(self, session_id: str, objective: str) -> str:
+        session = self.session(session_id)
+        if not session.lock.acquire(blocking=False):
+            raise ServerError(409, f"Session '{session_id}' is already running.")
+        try:
+            session.last_used = time.time()
+            with span("server.ask", session=session_id):
+                response = self.ask_agent(session.agent, objective)
+            session.objectives += 1
+            return response
+        finally:
+            session.last_used = time.time()
+            session.lock.release()
+
+    def retrieve(self, query: str, k: Optional[int] = None) -> List[Dict]:
+        """Project chunks for query, without going through an agent."""
+        if self.retriever is None:
+            raise ServerError(404, "Retrieval is not available on this server.")
+        with span("server.retrieve"):
+            documents = self.retriever.get_relevant_documents(query)
+        if k is not None:
+            documents = documents[:k]
+        return [
+            {"content": document.page_content, **document.metadata}
+            for document in documents
+        ]
+
+    def status(self) -> Dict:
+        with self._lock:
+            sessions = [session for session in self.sessions.values() if session]
+        return {
+            "uptime_seconds": round(time.time() - self.started, 3),
+            "sessions": len(sessions),
+            "running": sum(1 for session in sessions if session.lock.locked()),
+        }
+
+    def _expire_sessions(self):
+        cutoff = time.time() - self.session_ttl
+        for session_id, session in list(self.sessions.items()):
+            if session and not session.lock.locked() and session.last_used < cutoff:
+                del self.sessions[session_id]
+                log(f"Session {session_id} expired")
+
+
+class RequestHandler(BaseHTTPRequestHandler):
+    """
+    JSON API of an AgentServer.
+
+    GET /health, POST /sessions, POST /sessions/<id>/ask {"objective"},
+    DELETE /sessions/<id> and POST /retrieve {"query", "k"}.
+    """
+
+    server_version = "RecurGPT"
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        self.handle_route(self.route_get)
+
+    def do_POST(self):
+        self.handle_route(self.route_post)
+
+    def do_DELETE(self):
+        self.handle_route(self.route_delete)
+
+    def route_get(self):
+        if self.path == "/health":
+            return 200, self.server.agent_server.status()
+        raise ServerError(404, f"Unknown path '{self.path}'.")
+
+    def route_post(self):
+        agent_server = self.server.agent_server
+        body = self.read_json()
+        if self.path == "/sessions":
+            return 201, {"session": agent_server.create_session()}
+        if self.path == "/retrieve":
+            k = body.get("k")
+            if k is not None and not (isinstance(k, int) and k > 0):
+                raise ServerError(400, "'k' must be a positive integer.")
+            query = self.required_string(body, "query")
+            return 200, {"documents": agent_server.retrieve(query, k)}
+        match = SESSION_PATH.match(self.path)
+        if match and match.group(2):
+            objective = self.required_string(body, "objective")
+            started = time.perf_counter()
+            response = agent_server.ask(match.group(1), objective)
+            return 200, {
+                "response": response,
+                "seconds": round(time.perf_counter() - started, 3),
+            }
+        raise ServerError(404, f"Unknown path '{self.path}'.")
+
+    def route_delete(self):
+        match = SESSION_PATH.match(self.path)
+        if match and not match.group(2):
+            self.server.agent_server.close_session(match.group(1))
+            return 200, {"closed": match.group(1)}
+        raise ServerError(404, f"Unknown path '{self.path}'.")
+
+    def handle_route(self, route: Callable):
+        count("server_requests")
+        try:
+            status, payload = route()
+        except ServerError as e:
+            status, payload = e.status, {"error": str(e)}
+        except Exception as e:
+            log(f"Error handling {self.command} {self.path}: {e}")
+            status, payload = 500, {"error": f"{type(e).__name__}: {e}"}
+        data = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        if self.close_connection:
+            self.send_header("Connection", "close")
+        self.end_headers()
+        self.wfile.write(data)
+
+    def read_json(self) -> Dict:
+        try:
+            length = int(self.headers.get("Content-Length") or 0)
+        except ValueError:
+            length = -1
+        if not 0 <= length <= MAX_BODY_BYTES:
+            # The body is left unread, so the rest of the stream cannot be
+            # parsed as the next request on a kept-alive connection
+            self.close_connection = True
+            if length < 0:
+                raise ServerError(400, "Invalid Content-Length.")
+            raise ServerError(413, "Request body is too large.")
+        if not length:
+            return {}
+        try:
+            body = json.loads(self.rfile.read(length))
+        except ValueError:
+            raise ServerError(400, "Request body is not valid JSON.")
+        if not isinstance(body, dict):
+            raise ServerError(400, "Request body must be a JSON object.")
+        return body
+
+    @staticmethod
+    def required_string(body: Dict, name: str) -> str:
+        value = body.get(name)
+        if not isinstance(value, str) or not value.strip():
+            raise ServerError(400, f"'{name}' must be a non-empty string.")
+        return value.strip()
+
+    def address_string(self) -> str:
+        # Unix socket peers have no address
+        return self.client_address[0] if self.client_address else "unix"
+
+    def log_message(self, format: str, *args):
+        log(f"{self.address_string()} {format % args}")
+
+
+class UnixHTTPServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+    def server_bind(self):
+        # A stale socket from a previous run would make bind fail
+        if os.path.exists(self.server_address):
+            os.unlink(self.server_address)
+        super().server_bind()
+
+    def server_close(self):
+        super().server_close()
+        if os.path.exists(self.server_address):
+            os.unlink(self.server_address)
+
+
+def make_server(
+    agent_server: AgentServer,
+    host: str = DEFAULT_HOST,
+    port: int = DEFAULT_PORT,
+    socket_path: Optional[str] = None,
+):
+    """
+    HTTP server for agent_server on a Unix socket, or on host and port.
+
+    Every request runs in its own thread, so retrieval queries are served
+    while other sessions are in the middle of an agent loop.
+    """
+    if socket_path:
+        server = UnixHTTPServer(socket_path, RequestHandler)
+    else:
+        server = ThreadingHTTPServer((host, port), RequestHandler)
+        server.daemon_threads = True
+    server.agent_server = agent_server
+    return server
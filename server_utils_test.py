@@ -0,0 +1,202 @@
+import http.client
+import json
+import os
+import socket
+import tempfile
+import threading
+import time
+import unittest
+
+from langchain.docstore.document import Document
+
+from server_utils import MAX_BODY_BYTES, AgentServer, ServerError, make_server
+
+
+class FakeAgent:
+    def __init__(self):
+        self.history = []
+
+
+def fake_ask(agent, objective):
+    if objective == "slow":
+        time.sleep(0.3)
+    agent.history.append(objective)
+    return f"{len(agent.history)}: {objective}"
+
+
+class FakeRetriever:
+    def get_relevant_documents(self, query):
+        return [
+            Document(page_content=f"{query} {i}", metadata={"source": f"{i}.py"})
+            for i in range(3)
+        ]
+
+
+class UnixConnection(http.client.HTTPConnection):
+    def __init__(self, socket_path):
+        super().__init__("localhost")
+        self.socket_path = socket_path
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.connect(self.socket_path)
+
+
+class TestAgentServer(unittest.TestCase):
+    def test_sessions_keep_their_own_agent(self):
+        server = AgentServer(FakeAgent, fake_ask)
+        first = server.create_session()
+        second = server.create_session()
+        self.assertEqual(server.ask(first, "a"), "1: a")
+        self.assertEqual(server.ask(first, "b"), "2: b")
+        self.assertEqual(server.ask(second, "c"), "1: c")
+
+        server.close_session(first)
+        with self.assertRaises(ServerError) as raised:
+            server.ask(first, "d")
+        self.assertEqual(raised.exception.status, 404)
+
+    def test_session_limit_and_expiry(self):
+        server = AgentServer(FakeAgent, fake_ask, session_ttl=60, max_sessions=1)
+        session_id = server.create_session()
+        with self.assertRaises(ServerError) as raised:
+            server.create_session()
+        self.assertEqual(raised.exception.status, 503)
+
+        server.sessions[session_id].last_used -= 120
+        server.create_session()
+        self.assertNotIn(session_id, server.sessions)
+
+    def test_busy_session(self):
+        server = AgentServer(FakeAgent, fake_ask)
+        session_id = server.create_session()
+        thread = threading.Thread(target=server.ask, args=(session_id, "slow"))
+        thread.start()
+        time.sleep(0.1)
+        with self.assertRaises(ServerError) as raised:
+            server.ask(session_id, "b")
+        self.assertEqual(raised.exception.status, 409)
+        self.assertEqual(server.status()["running"], 1)
+        thread.join()
+
+
+class TestHTTPServer(unittest.TestCase):
+    def setUp(self):
+        self.agent_server = AgentServer(FakeAgent, fake_ask, FakeRetriever())
+        self.server = make_server(self.agent_server, port=0)
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.start()
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        self.thread.join()
+
+    def request(self, method, path, body=None, connection=None):
+        connection = connection or http.client.HTTPConnection(
+            *self.server.server_address
+        )
+        data = json.dumps(body) if body is not None else None
+        connection.request(method, path, data)
+        response = connection.getresponse()
+        payload = json.loads(response.read())
+        connection.close()
+        return response.status, payload
+
+    def test_session_lifecycle(self):
+        status, payload = self.request("POST", "/sessions")
+        self.assertEqual(status, 201)
+        session_id = payload["session"]
+
+        status, payload = self.request(
+            "POST", f"/sessions/{session_id}/ask", {"objective": "hello"}
+        )
+        self.assertEqual(status, 200)
+        self.assertEqual(payload["response"], "1: hello")
+
+        status, payload = self.request("GET", "/health")
+        self.assertEqual(payload["sessions"], 1)
+
+        status, _ = self.request("DELETE", f"/sessions/{session_id}")
+        self.assertEqual(status, 200)
+        status, payload = self.request(
+            "POST", f"/sessions/{session_id}/ask", {"objective": "hello"}
+        )
+        self.assertEqual(status, 404)
+        self.assertIn("Unknown session", payload["error"])
+
+    def test_retrieve(self):
+        status, payload = self.request("POST", "/retrieve", {"query": "x", "k": 2})
+        self.assertEqual(status, 200)
+        self.assertEqual(
+            payload["documents"],
+            [
+                {"content": "x 0", "source": "0.py"},
+                {"content": "x 1", "source": "1.py"},
+            ],
+        )
+
+    def test_bad_requests(self):
+        self.assertEqual(self.request("POST", "/retrieve", {})[0], 400)
+        self.assertEqual(self.request("POST", "/retrieve", ["x"])[0], 400)
+        self.assertEqual(self.request("GET", "/missing")[0], 404)
+
+    def test_oversized_body_closes_connection(self):
+        # Without reading the body the server would parse it as a new request
+        smuggled = b"GET /health HTTP/1.1\r\nHost: x\r\n\r\n"
+        with socket.create_connection(self.server.server_address, timeout=5) as raw:
+            raw.sendall(
+                b"POST /retrieve HTTP/1.1\r\nHost: x\r\n"
+                + f"Content-Length: {MAX_BODY_BYTES + 1}\r\n\r\n".encode("ascii")
+                + smuggled
+            )
+            received = b""
+            while True:
+                data = raw.recv(65536)
+                if not data:
+                    break
+                received += data
+        self.assertTrue(received.startswith(b"HTTP/1.1 413 "))
+        self.assertIn(b"Connection: close", received)
+        self.assertEqual(received.count(b"HTTP/1.1 "), 1)
+
+    def test_retrieval_runs_during_agent_loop(self):
+        _, payload = self.request("POST", "/sessions")
+        path = f"/sessions/{payload['session']}/ask"
+        thread = threading.Thread(
+            target=self.request, args=("POST", path, {"objective": "slow"})
+        )
+        thread.start()
+        time.sleep(0.1)
+        started = time.perf_counter()
+        status, _ = self.request("POST", "/retrieve", {"query": "x"})
+        self.assertEqual(status, 200)
+        self.assertLess(time.perf_counter() - started, 0.2)
+        thread.join()
+
+
+class TestUnixSocketServer(unittest.TestCase):
+    def test_health_over_unix_socket(self):
+        with tempfile.TemporaryDirectory() as directory:
+            socket_path = os.path.join(directory, "agent.sock")
+            server = make_server(
+                AgentServer(FakeAgent, fake_ask), socket_path=socket_path
+            )
+            thread = threading.Thread(target=server.serve_forever)
+            thread.start()
+            try:
+                connection = UnixConnection(socket_path)
+                connection.request("GET", "/health")
+                response = connection.getresponse()
+                self.assertEqual(response.status, 200)
+                self.assertEqual(json.loads(response.read())["sessions"], 0)
+                connection.close()
+            finally:
+                server.shutdown()
+                server.server_close()
+                thread.join()
+            self.assertFalse(os.path.exists(socket_path))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,277 @@
+import os
+import re
+import shutil
+import threading
+from collections import ChainMap
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Tuple
+
+from langchain.docstore.document import Document
+from langchain.embeddings.base import Embeddings
+
+from ann_utils import IndexConfig
+from index_utils import (
+    default_index_dir,
+    load_or_build_vectorstore,
+    load_symbol_index,
+    load_trigram_index,
+)
+from retrieval_utils import (
+    Hit,
+    HybridRetriever,
+    document_location,
+    merge_statistics,
+    reciprocal_rank_fusion,
+    select_within_budget,
+)
+from trace_utils import log, span
+
+REPO_TAG_PATTERN = re.compile(r"(?:^|\s)repo:(\S+)")
+
+
+class Shard:
+    """The index of one repository."""
+
+    def __init__(
+        self, name: str, folder_path: str, index_dir: str, vectorstore, candidates: int
+    ):
+        self.name = name
+        self.folder_path = folder_path
+        self.index_dir = index_dir
+        self.vectorstore = vectorstore
+        self.retriever = HybridRetriever(vectorstore, candidates=candidates)
+        self.symbol_index = load_symbol_index(index_dir)
+        self.trigram_index = load_trigram_index(index_dir)
+
+    def contains(self, path: str) -> bool:
+        return path == self.folder_path or path.startswith(
+            self.folder_path.rstrip(os.sep) + os.sep
+        )
+
+
+class ShardedIndex:
+    """
+    Retrieval over several repositories, one index per repository.
+
+    Each shard is loaded and kept up to date with load_or_build_vectorstore
+    in its own index directory, so adding or dropping a repository never
+    touches the others. Queries are routed to the shards named with
+    "repo:<name>" tags, or to the shards containing a path in the query, and
+    otherwise fan out to every shard. The BM25 and dense candidates of all
+    routed shards are ranked together, BM25 with the statistics of the
+    combined corpus and dense hits by distance to the one query embedding,
+    then fused once. All shards must use the same embeddings.
+    """
+
+    def __init__(
+        self,
+        embeddings: Optional[Embeddings] = None,
+        index_config: Optional[IndexConfig] = None,
+        index_root: Optional[str] = None,
+        k: int = 4,
+        token_budget: int = 2000,
+        candidates: int = 20,
+        max_workers: int = 8,
+    ):
+        self.embeddings = embeddings
+        self.index_config = index_config
+        self.index_root = index_root
+        self.k = k
+        self.token_budget = token_budget
+        self.candidates = candidates
+        self.max_workers = max_workers
+        self.shards: Dict[str, Shard] = {}
+        self._lock = threading.Lock()
+
+    def add_repository(
+        self,
+        folder_path: str,
+        name: Optional[str] = None,
+        ignore_file: Optional[str] = None,
+        index_dir: Optional[str] = None,
+    ) -> Shard:
+        """Load or build the shard of a repository and start routing to it."""
+        folder_path = os.path.abspath(folder_path)
+        name = name or os.path.basename(folder_path.rstrip(os.sep)) or "root"
+        if name in self.shards:
+            raise ValueError(f"A repository named '{name}' is already indexed.")
+        if index_dir is None:
+            index_dir = (
+                os.path.join(self.index_root, name)
+                if self.index_root
+                else default_index_dir(folder_path)
+            )
+        with span("shard.load", repo=name):
+            vectorstore = load_or_build_vectorstore(
+                folder_path,
+                ignore_file,
+                index_dir,
+                embeddings=self.embeddings,
+                index_config=self.index_config,
+            )
+            shard = Shard(name, folder_path, index_dir, vectorstore, self.candidates)
+        with self._lock:
+            self.shards = {**self.shards, name: shard}
+        log(f"Repository '{name}' added from {folder_path}")
+        return shard
+
+    def remove_repository(self, name: str, delete_index: bool = False):
+        """Stop routing to a repository, optionally deleting its index."""
+        with self._lock:
+            shards = dict(self.shards)
+            shard = shards.pop(name, None)
+            if shard is None:
+                raise ValueError(f"Unknown repository '{name}'.")
+            # Searches in flight keep the mapping they started with
+            self.shards = shards
+        if delete_index:
+            shutil.rmtree(shard.index_dir, ignore_errors=True)
+        log(f"Repository '{name}' removed")
+
+    def shard_for_path(self, path: str) -> Optional[Shard]:
+        path = os.path.abspath(path)
+        matches = [shard for shard in self.shards.values() if shard.contains(path)]
+        return max(matches, key=lambda shard: len(shard.folder_path), default=None)
+
+    def route(self, query: str) -> Tuple[List[Shard], str]:
+        """Shards to search for query, and the query without its repo tags."""
+        shards = self.shards
+        names = []
+        for tag in REPO_TAG_PATTERN.findall(query):
+            names.extend(name for name in tag.split(",") if name)
+        if names:
+            unknown = [name for name in names if name not in shards]
+            if unknown:
+                raise ValueError(
+                    f"Unknown repository '{unknown[0]}', use one of {sorted(shards)}."
+                )
+            query = REPO_TAG_PATTERN.sub(" ", query).strip()
+            return [shards[name] for name in dict.fromkeys(names)], query
+
+        routed = {}
+        for token in query.split():
+            token = token.strip("'\"`,;()")
+            if os.path.isabs(token):
+                shard = self.shard_for_path(token)
+            else:
+                shard = shards.get(token.split("/", 1)[0]) if "/" in token else None
+            if shard is not None:
+                routed[shard.name] = shard
+        return list(routed.values()) or list(shards.values()), query
+
+    def scored_documents(self, query: str) -> List[Tuple[Document, float]]:
+        """Candidates from the routed shards, tagged with their repo, best first."""
+        shards, query = self.route(query)
+        if not shards:
+            return []
+        embedding = None
+        indexed = [shard for shard in shards if shard.vectorstore.index.ntotal]
+        if indexed:
+            # Every shard uses the same embeddings, so the query is embedded once
+            with span("embed_query"):
+                embedding = indexed[0].vectorstore.embedding_function(query)
+        # BM25 scores every shard against the statistics of all of them
+        statistics = merge_statistics(
+            shard.retriever.corpus_statistics(query) for shard in shards
+        )
+
+        def search(shard: Shard) -> Tuple[List[Hit], List[Hit]]:
+            return shard.retriever.rankings(query, embedding, statistics)
+
+        with span("shard.search", shards=len(shards)):
+            if len(shards) == 1:
+                results = [search(shards[0])]
+            else:
+                workers = min(self.max_workers, len(shards))
+                with ThreadPoolExecutor(max_workers=workers) as executor:
+                    results = list(executor.map(search, shards))
+
+        # Per-shard ranks are not comparable, so the candidates of every shard
+        # are ranked together by their scores and fused once
+        sparse_hits, dense_hits = [], []
+        for shard, (shard_sparse, shard_dense) in zip(shards, results):
+            for hits, merged in (
+                (shard_sparse, sparse_hits),
+                (shard_dense, dense_hits),
+            ):
+                merged.extend(
+                    ((shard.name, doc_id), tag_document(document, shard.name), score)
+                    for doc_id, document, score in hits
+                )
+        return reciprocal_rank_fusion(
+            [
+                (key, document)
+                for key, document, _ in sorted(
+                    hits, key=lambda hit: hit[2], reverse=True
+                )
+            ]
+            for hits in (sparse_hits, dense_hits)
+        )
+
+    def get_relevant_documents(self, query: str) -> List[Document]:
+        scored = self.scored_documents(query)
+        return select_within_budget(
+            (document for document, _ in scored), self.k, self.token_budget
+        )
+
+    def run(self, query: str) -> str:
+        """Format the retrieved chunks for the Context tool."""
+        try:
+            documents = self.get_relevant_documents(query)
+        except ValueError as e:
+            return f"Error: {str(e)}"
+        if not documents:
+            return "No relevant context found in the projects."
+        return "\n\n".join(
+            f"[{document.metadata['repo']}: {document_location(document)}]\n"
+            f"{document.page_content}"
+            for document in documents
+        )
+
+
+def tag_document(document: Document, repo: str) -> Document:
+    return Document(
+        page_content=document.page_content, metadata={**document.metadata, "repo": repo}
+    )
+
+
+class ShardedSymbolIndex:
+    """SymbolIndex lookups across every shard of a ShardedIndex."""
+
+    def __init__(self, sharded_index: ShardedIndex):
+        self.sharded_index = sharded_index
+
+    @property
+    def files(self) -> ChainMap:
+        shards = self.sharded_index.shards.values()
+        return ChainMap(*(shard.symbol_index.files for shard in shards))
+
+    def lookup(self, query: str, prefix: bool = False, limit: int = 50) -> List[str]:
+        results = []
+        for shard in self.sharded_index.shards.values():
+            results.extend(shard.symbol_index.lookup(query, prefix, limit))
+        return results[:limit]
+
+
+class ShardedTrigramIndex:
+    """TrigramIndex code search across every shard of a ShardedIndex."""
+
+    def __init__(self, sharded_index: ShardedIndex):
+        self.sharded_index = sharded_index
+
+    def search(
+        self,
+        pattern: str,
+        regex: bool = False,
+        ignore_case: bool = False,
+        max_results: int = 50,
+    ) -> List[str]:
+        results = []
+        for shard in self.sharded_index.shards.values():
+            remaining = max_results - len(results)
+            if remaining <= 0:
+                break
+            results.extend(
+                shard.trigram_index.search(pattern, regex, ignore_case, remaining)
+            )
+        return results
@@ -0,0 +1,157 @@
+import os
+import tempfile
+import unittest
+
+from langchain.embeddings import FakeEmbeddings
+from langchain.embeddings.base import Embeddings
+
+from index_utils import EMBEDDING_SIZE, load_manifest
+from main import split_repository_spec
+from shard_utils import ShardedIndex, ShardedSymbolIndex, ShardedTrigramIndex
+
+
+class CountingEmbeddings(FakeEmbeddings):
+    embedded: int = 0
+
+    def embed_documents(self, texts):
+        self.embedded += len(texts)
+        return super().embed_documents(texts)
+
+
+class KeywordEmbeddings(Embeddings):
+    """Embeddings placing texts by the keywords they contain."""
+
+    keywords = ("request", "handl", "page")
+
+    def embed_query(self, text):
+        vector = [float(text.count(keyword)) for keyword in self.keywords]
+        norm = sum(value * value for value in vector) ** 0.5 or 1.0
+        return [value / norm for value in vector] + [0.0] * (
+            EMBEDDING_SIZE - len(vector)
+        )
+
+    def embed_documents(self, texts):
+        return [self.embed_query(text) for text in texts]
+
+
+class TestShardedIndex(unittest.TestCase):
+    def setUp(self):
+        self.root = tempfile.TemporaryDirectory()
+        self.embeddings = CountingEmbeddings(size=EMBEDDING_SIZE)
+        self.write("api", "server.py", "def handle_request(request): pass")
+        self.write("web", "client.py", "def render_page(page): pass")
+        self.index = self.sharded_index()
+        self.index.add_repository(self.path("api"))
+        self.index.add_repository(self.path("web"))
+
+    def tearDown(self):
+        self.root.cleanup()
+
+    def path(self, *parts):
+        return os.path.join(self.root.name, "repos", *parts)
+
+    def write(self, repo, name, content):
+        os.makedirs(self.path(repo), exist_ok=True)
+        with open(self.path(repo, name), "w") as file:
+            file.write(content)
+
+    def sharded_index(self):
+        return ShardedIndex(
+            embeddings=self.embeddings,
+            index_root=os.path.join(self.root.name, "indexes"),
+        )
+
+    def sources(self, query):
+        return [
+            (document.metadata["repo"], os.path.basename(document.metadata["source"]))
+            for document in self.index.get_relevant_documents(query)
+        ]
+
+    def test_fan_out_merges_shards(self):
+        self.assertEqual(self.sources("handle_request")[0], ("api", "server.py"))
+        self.assertEqual(self.sources("render_page")[0], ("web", "client.py"))
+        self.assertEqual(len(self.sources("def")), 2)
+        self.assertTrue(self.index.run("render_page").startswith("[web: "))
+
+    def test_routing(self):
+        shards, query = self.index.route("repo:web handle_request")
+        self.assertEqual([shard.name for shard in shards], ["web"])
+        self.assertEqual(query, "handle_request")
+        self.assertEqual(
+            self.sources("repo:web handle_request"), [("web", "client.py")]
+        )
+
+        shards, _ = self.index.route(f"what does {self.path('api', 'server.py')} do")
+        self.assertEqual([shard.name for shard in shards], ["api"])
+        shards, _ = self.index.route("explain web/client.py")
+        self.assertEqual([shard.name for shard in shards], ["web"])
+        shards, _ = self.index.route("how are requests handled")
+        self.assertEqual(len(shards), 2)
+
+        with self.assertRaisesRegex(ValueError, "Unknown repository 'docs'"):
+            self.index.route("repo:docs readme")
+        self.assertTrue(self.index.run("repo:docs readme").startswith("Error:"))
+
+    def test_adding_and_removing_keeps_other_shards(self):
+        self.write("docs", "guide.py", "def write_guide(): pass")
+        embedded = self.embeddings.embedded
+        self.index.add_repository(self.path("docs"))
+        self.assertEqual(self.embeddings.embedded, embedded + 1)
+
+        api_index = self.index.shards["api"].index_dir
+        self.index.remove_repository("web", delete_index=True)
+        self.assertEqual(sorted(self.index.shards), ["api", "docs"])
+        self.assertTrue(load_manifest(api_index)["files"])
+
+        # Reloading the remaining shards embeds nothing
+        embedded = self.embeddings.embedded
+        reloaded = self.sharded_index()
+        reloaded.add_repository(self.path("api"))
+        reloaded.add_repository(self.path("docs"))
+        self.assertEqual(self.embeddings.embedded, embedded)
+
+        with self.assertRaisesRegex(ValueError, "already indexed"):
+            reloaded.add_repository(self.path("api"))
+
+    def test_symbol_and_code_search_span_shards(self):
+        symbols = ShardedSymbolIndex(self.index)
+        self.assertEqual(len(symbols.lookup("handle_request")), 1)
+        self.assertIn(self.path("web", "client.py"), symbols.files)
+
+        code = ShardedTrigramIndex(self.index)
+        self.assertEqual(len(code.search("def ")), 2)
+        self.assertEqual(len(code.search("def ", max_results=1)), 1)
+
+    def test_ranks_candidates_across_shards(self):
+        for i in range(4):
+            self.write("api", f"h{i}.py", f"def handle_request_{i}(request): pass")
+        index = ShardedIndex(
+            embeddings=KeywordEmbeddings(),
+            index_root=os.path.join(self.root.name, "keyword-indexes"),
+        )
+        index.add_repository(self.path("api"))
+        index.add_repository(self.path("web"))
+
+        # No BM25 hits, the dense ranking alone decides
+        sources = [
+            (document.metadata["repo"], os.path.basename(document.metadata["source"]))
+            for document in index.get_relevant_documents("requests handling")
+        ]
+        self.assertEqual(len(sources), 4)
+        self.assertTrue(all(repo == "api" for repo, _ in sources), sources)
+        self.assertNotIn("client.py", [name for _, name in sources])
+
+        # The unrelated shard only comes after every relevant hit
+        scored = index.scored_documents("requests handling")
+        self.assertEqual(scored[-1][0].metadata["repo"], "web")
+
+
+class TestRepositorySpec(unittest.TestCase):
+    def test_split_repository_spec(self):
+        self.assertEqual(split_repository_spec("api=../api"), ("api", "../api"))
+        self.assertEqual(split_repository_spec("../api"), (None, "../api"))
+        self.assertEqual(split_repository_spec("a/b=c"), (None, "a/b=c"))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,126 @@
+"""
+Cold-start benchmark for the interactive entry point.
+
+Usage: python startup_benchmark.py --repeats 5
+Each measurement runs in a fresh interpreter. first_prompt is the time until
+main.py can show its first dialog, agent_ready the time until setup_agent
+returns (with stub embeddings and no API calls). Results are printed as JSON
+and the exit status is 1 when a median exceeds its budget.
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+from typing import Dict
+
+REPOSITORY_ROOT = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_BUDGETS = {"first_prompt_seconds": 0.5, "agent_ready_seconds": 6.0}
+
+FIRST_PROMPT_SCRIPT = """
+import sys
+import globals
+import main
+globals.initialize()
+print(sorted(name for name in ("langchain", "faiss", "openai") if name in sys.modules))
+"""
+
+AGENT_READY_SCRIPT = """
+import os
+import tempfile
+import globals
+from agent_utils import setup_agent
+from agent_benchmark import HashEmbeddings
+from index_utils import empty_vectorstore
+globals.initialize()
+with tempfile.TemporaryDirectory() as directory:
+    setup_agent(
+        empty_vectorstore(HashEmbeddings()),
+        directory,
+        llm_cache_mode="off",
+        llm_cache_path=os.path.join(directory, "llm_cache.sqlite"),
+    )
+"""
+
+
+def time_script(script: str) -> Dict:
+    """Run script in a new interpreter and return its wall time and output."""
+    env = dict(os.environ)
+    # Clients are created but never called, so any key will do
+    env.setdefault("OPENAI_API_KEY", "startup-benchmark")
+    start = time.perf_counter()
+    completed = subprocess.run(
+        [sys.executable, "-c", script],
+        cwd=REPOSITORY_ROOT,
+        env=env,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    return {
+        "seconds": time.perf_counter() - start,
+        "output": completed.stdout.strip().splitlines(),
+    }
+
+
+def run_benchmark(args) -> Dict:
+    budgets = {
+        "first_prompt_seconds": args.first_prompt_budget,
+        "agent_ready_seconds": args.agent_ready_budget,
+    }
+    interpreter = [time_script("pass")["seconds"] for _ in range(args.repeats)]
+    first_prompt = [time_script(FIRST_PROMPT_SCRIPT) for _ in range(args.repeats)]
+    results = {
+        "repeats": args.repeats,
+        "interpreter_seconds": round(statistics.median(interpreter), 3),
+        "first_prompt_seconds": round(
+            statistics.median(run["seconds"] for run in first_prompt), 3
+        ),
+        # Heavy modules imported before the first prompt, should stay empty
+        "first_prompt_heavy_modules": first_prompt[-1]["output"][-1],
+    }
+    if not args.skip_agent:
+        agent_ready = [time_script(AGENT_READY_SCRIPT) for _ in range(args.repeats)]
+        results["agent_ready_seconds"] = round(
+            statistics.median(run["seconds"] for run in agent_ready), 3
+        )
+    results["budgets"] = {
+        name: budget for name, budget in budgets.items() if name in results
+    }
+    results["over_budget"] = [
+        name for name, budget in results["budgets"].items() if results[name] > budget
+    ]
+    return results
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().split("\n")[0])
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument(
+        "--first-prompt-budget",
+        type=float,
+        default=DEFAULT_BUDGETS["first_prompt_seconds"],
+    )
+    parser.add_argument(
+        "--agent-ready-budget",
+        type=float,
+        default=DEFAULT_BUDGETS["agent_ready_seconds"],
+    )
+    parser.add_argument(
+        "--skip-agent", action="store_true", help="Only measure the first prompt"
+    )
+    return parser.parse_args(argv)
+
+
+def main():
+    results = run_benchmark(parse_args())
+    json.dump(results, sys.stdout, indent=2)
+    print()
+    sys.exit(1 if results["over_budget"] else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,15 @@
+import unittest
+
+from startup_benchmark import parse_args, run_benchmark
+
+
+class TestStartupBenchmark(unittest.TestCase):
+    def test_first_prompt_is_light(self):
+        results = run_benchmark(parse_args(["--repeats", "1", "--skip-agent"]))
+        self.assertEqual(results["first_prompt_heavy_modules"], "[]")
+        self.assertNotIn("agent_ready_seconds", results)
+        self.assertEqual(results["over_budget"], [])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,163 @@
+import ast
+import bisect
+import json
+import os
+import re
+import threading
+from typing import Dict, List, Tuple
+
+from chunk_utils import SYMBOL_PATTERN
+
+SYMBOLS_NAME = "symbols.json"
+
+IMPORT_PATTERN = re.compile(
+    r"^\s*(?:import\s+(?:.*\s+from\s+)?['\"]?([\w./@-]+)|"
+    r"from\s+([\w.]+)\s+import|"
+    r"#include\s*[<\"]([^>\"]+)|"
+    r"use\s+([\w:]+)|"
+    r".*\brequire\(\s*['\"]([^'\"]+))"
+)
+
+# (name, qualified name, kind, line)
+Definition = Tuple[str, str, str, int]
+
+
+def python_symbols(content: str) -> Tuple[List[Definition], List[Tuple[str, int]]]:
+    tree = ast.parse(content)
+    definitions = []
+    imports = []
+
+    def visit(nodes, prefix: str, parent_kind: str):
+        for node in nodes:
+            if isinstance(node, ast.ClassDef):
+                definitions.append(
+                    (node.name, prefix + node.name, "class", node.lineno)
+                )
+                visit(node.body, f"{prefix}{node.name}.", "class")
+            elif isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef)):
+                kind = "method" if parent_kind == "class" else "function"
+                definitions.append((node.name, prefix + node.name, kind, node.lineno))
+                visit(node.body, f"{prefix}{node.name}.", "function")
+            elif isinstance(node, ast.Import):
+                imports.extend((alias.name, node.lineno) for alias in node.names)
+            elif isinstance(node, ast.ImportFrom) and node.module:
+                imports.append((node.module, node.lineno))
+
+    visit(tree.body, "", "module")
+    return definitions, imports
+
+
+def regex_symbols(content: str) -> Tuple[List[Definition], List[Tuple[str, int]]]:
+    definitions = []
+    imports = []
+    for number, line in enumerate(content.split("\n"), start=1):
+        match = SYMBOL_PATTERN.search(line)
+        if match:
+            name = match.group(1)
+            definitions.append((name.split(".")[-1], name, "definition", number))
+        match = IMPORT_PATTERN.match(line)
+        if match:
+            module = next(group for group in match.groups() if group)
+            imports.append((module, number))
+    return definitions, imports
+
+
+def file_symbols(
+    file_path: str, content: str
+) -> Tuple[List[Definition], List[Tuple[str, int]]]:
+    if content and file_path.endswith(".py"):
+        try:
+            return python_symbols(content)
+        except SyntaxError:
+            return regex_symbols(content)
+    elif content:
+        return regex_symbols(content)
+    return [], []
+
+
+class SymbolIndex:
+    """
+    In-memory index of definitions, imports and file paths.
+
+    Exact lookups are dictionary hits and prefix lookups bisect a sorted key
+    list, so resolving a symbol needs no embeddings or LLM calls. Entries are
+    stored per file so changed files can be replaced incrementally.
+    """
+
+    def __init__(self):
+        self.files: Dict[str, Dict] = {}
+        # Batch workers, server requests and the watcher share one index
+        self._lock = threading.Lock()
+        self._dirty = True
+
+    def add_file(self, file_path: str, content: str = ""):
+        definitions, imports = file_symbols(file_path, content)
+        with self._lock:
+            self.files[file_path] = {"definitions": definitions, "imports": imports}
+            self._dirty = True
+
+    def remove_file(self, file_path: str):
+        with self._lock:
+            if self.files.pop(file_path, None) is not None:
+                self._dirty = True
+
+    def _rebuild(self):
+        definitions = {}
+        imports = {}
+        paths = {}
+        for file_path, entry in self.files.items():
+            for name, qualified, kind, line in entry["definitions"]:
+                for key in {name, qualified}:
+                    definitions.setdefault(key, []).append(
+                        (qualified, kind, file_path, line)
+                    )
+            for module, line in entry["imports"]:
+                imports.setdefault(module, []).append((file_path, line))
+            paths.setdefault(os.path.basename(file_path), []).append(file_path)
+        keys = sorted(set(definitions) | set(paths))
+        # Lookups read the tables without the lock, so they are replaced whole
+        self._tables = (definitions, imports, paths, keys)
+        self._dirty = False
+
+    def lookup(self, query: str, prefix: bool = False, limit: int = 50) -> List[str]:
+        """Return formatted matches for a symbol, module or file name."""
+        with self._lock:
+            if self._dirty:
+                self._rebuild()
+            definitions, imports, paths, all_keys = self._tables
+        query = query.strip()
+        if prefix:
+            start = bisect.bisect_left(all_keys, query)
+            end = bisect.bisect_left(all_keys, query + "\uffff")
+            keys = all_keys[start:end]
+        else:
+            keys = [query]
+
+        results = []
+        for key in keys:
+            for qualified, kind, file_path, line in definitions.get(key, []):
+                results.append(f"{qualified} ({kind}) {file_path}:{line}")
+            for file_path in paths.get(key, []):
+                results.append(f"{key} (file) {file_path}")
+        for file_path, line in imports.get(query, []):
+            results.append(f"import {query} {file_path}:{line}")
+        # The same definition is reachable through its short and qualified name
+        return list(dict.fromkeys(results))[:limit]
+
+    def save(self, index_dir: str):
+        os.makedirs(index_dir, exist_ok=True)
+        symbols_path = os.path.join(index_dir, SYMBOLS_NAME)
+        with self._lock:
+            files = dict(self.files)
+        with open(symbols_path + ".tmp", "w") as symbols_file:
+            json.dump(files, symbols_file)
+        os.replace(symbols_path + ".tmp", symbols_path)
+
+    @classmethod
+    def load(cls, index_dir: str) -> "SymbolIndex":
+        symbol_index = cls()
+        symbols_path = os.path.join(index_dir, SYMBOLS_NAME)
+        if os.path.exists(symbols_path):
+            with open(symbols_path, "r") as symbols_file:
+                symbol_index.files = json.load(symbols_file)
+        return symbol_index
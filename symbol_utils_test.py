@@ -0,0 +1,78 @@
+import threading
+import time
+import unittest
+from unittest import mock
+
+from symbol_utils import SymbolIndex
+
+
+class TestSymbolIndex(unittest.TestCase):
+    def test_lookup_and_remove(self):
+        symbol_index = SymbolIndex()
+        symbol_index.add_file("/repo/a.py", "import os\n\n\ndef alpha():\n    pass\n")
+        self.assertEqual(
+            symbol_index.lookup("alpha"), ["alpha (function) /repo/a.py:4"]
+        )
+        self.assertEqual(symbol_index.lookup("a.py"), ["a.py (file) /repo/a.py"])
+        self.assertEqual(symbol_index.lookup("os"), ["import os /repo/a.py:1"])
+        symbol_index.remove_file("/repo/a.py")
+        self.assertEqual(symbol_index.lookup("alpha"), [])
+
+    def test_concurrent_lookups_rebuild_once(self):
+        symbol_index = SymbolIndex()
+        for i in range(200):
+            symbol_index.add_file(f"/repo/m{i}.py", f"def f{i}():\n    pass\n")
+        barrier = threading.Barrier(8)
+        results = []
+
+        def lookup():
+            barrier.wait()
+            results.append(symbol_index.lookup("f", prefix=True, limit=1000))
+
+        rebuild_index = SymbolIndex._rebuild
+
+        def slow_rebuild(self):
+            # Widen the window in which other lookups could see a dirty index
+            time.sleep(0.05)
+            rebuild_index(self)
+
+        with mock.patch.object(
+            SymbolIndex, "_rebuild", autospec=True, side_effect=slow_rebuild
+        ) as rebuild:
+            threads = [threading.Thread(target=lookup) for _ in range(8)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        self.assertEqual(rebuild.call_count, 1)
+        self.assertTrue(all(len(result) == 200 for result in results))
+
+    def test_lookups_during_updates(self):
+        symbol_index = SymbolIndex()
+        stop = threading.Event()
+        errors = []
+
+        def update():
+            i = 0
+            while not stop.is_set():
+                symbol_index.add_file(f"/repo/m{i % 50}.py", f"def f{i}():\n    pass\n")
+                symbol_index.remove_file(f"/repo/m{(i + 25) % 50}.py")
+                i += 1
+
+        thread = threading.Thread(target=update)
+        thread.start()
+        try:
+            for _ in range(500):
+                for result in symbol_index.lookup("f", prefix=True, limit=1000):
+                    if "(function)" not in result:
+                        errors.append(result)
+        except Exception as e:
+            errors.append(e)
+        finally:
+            stop.set()
+            thread.join()
+        self.assertEqual(errors, [])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,178 @@
+import atexit
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Optional
+
+# Set to a file path to trace a session; ".jsonl" writes one event per line,
+# anything else writes the Chrome trace format (chrome://tracing, Perfetto)
+TRACE_PATH = os.environ.get("RECURGPT_TRACE")
+
+
+class Span:
+    """Attributes and counters collected while a span is open."""
+
+    __slots__ = ("name", "args")
+
+    def __init__(self, name: str, args: Dict[str, Any]):
+        self.name = name
+        self.args = args
+
+    def set(self, **args):
+        self.args.update(args)
+
+    def add(self, name: str, value: float = 1):
+        self.args[name] = self.args.get(name, 0) + value
+
+
+class Tracer:
+    """
+    Record timed spans, counters and log messages.
+
+    Totals per span and counter are always kept in memory. Events are only
+    written when a path is configured, streamed to the file as they happen so
+    long sessions do not accumulate them. Only the process that configured
+    the tracer writes, so forked loader processes stay silent.
+    """
+
+    def __init__(self, path: Optional[str] = None, echo: bool = True):
+        self.echo = echo
+        self.span_totals: Dict[str, Dict[str, float]] = {}
+        self.counters: Dict[str, float] = {}
+        self._lock = threading.Lock()
+        self._file = None
+        self._chrome = False
+        self._pid = os.getpid()
+        self._origin = time.perf_counter()
+        if path:
+            self.open(path)
+
+    def open(self, path: str):
+        self.close()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._chrome = not path.endswith(".jsonl")
+        self._pid = os.getpid()
+        self._file = open(path, "w")
+        if self._chrome:
+            # The closing bracket is optional in the Chrome JSON array format
+            self._file.write("[\n")
+
+    def close(self):
+        if self._file is not None and os.getpid() == self._pid:
+            if self._chrome:
+                self._file.write("{}]\n")
+            self._file.close()
+        self._file = None
+
+    @property
+    def enabled(self) -> bool:
+        return self._file is not None and os.getpid() == self._pid
+
+    def _timestamp(self, seconds: float) -> float:
+        # Chrome traces use microseconds
+        return round((seconds - self._origin) * 1e6, 1)
+
+    def _write(self, event: Dict[str, Any]):
+        event.setdefault("pid", self._pid)
+        event.setdefault("tid", threading.get_ident())
+        line = json.dumps(event, default=str)
+        with self._lock:
+            if self._file is None:
+                return
+            self._file.write(line + (",\n" if self._chrome else "\n"))
+            self._file.flush()
+
+    @contextmanager
+    def span(self, name: str, **args):
+        span = Span(name, args)
+        start = time.perf_counter()
+        try:
+            yield span
+        finally:
+            self.record(name, start, time.perf_counter() - start, span.args)
+
+    def record(self, name: str, start: float, seconds: float, args=None):
+        """Record a finished span, e.g. one timed in a worker process."""
+        with self._lock:
+            totals = self.span_totals.setdefault(name, {"count": 0, "seconds": 0.0})
+            totals["count"] += 1
+            totals["seconds"] += seconds
+        if self.enabled:
+            self._write(
+                {
+                    "name": name,
+                    "ph": "X",
+                    "ts": self._timestamp(start),
+                    "dur": round(seconds * 1e6, 1),
+                    "args": args or {},
+                }
+            )
+
+    def count(self, name: str, value: float = 1):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+            total = self.counters[name]
+        if self.enabled:
+            self._write(
+                {
+                    "name": name,
+                    "ph": "C",
+                    "ts": self._timestamp(time.perf_counter()),
+                    "args": {name: total},
+                }
+            )
+
+    def log(self, message: str, **args):
+        if self.echo:
+            print(message)
+        if self.enabled:
+            self._write(
+                {
+                    "name": "log",
+                    "ph": "i",
+                    "s": "p",
+                    "ts": self._timestamp(time.perf_counter()),
+                    "args": {"message": message, **args},
+                }
+            )
+
+    def summary(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "spans": {
+                    name: {
+                        "count": totals["count"],
+                        "seconds": round(totals["seconds"], 6),
+                    }
+                    for name, totals in self.span_totals.items()
+                },
+                "counters": dict(self.counters),
+            }
+
+
+tracer = Tracer(TRACE_PATH)
+atexit.register(tracer.close)
+
+
+def configure_tracing(path: Optional[str] = None, echo: Optional[bool] = None):
+    """Start writing trace events to path, or stop when path is None."""
+    if path:
+        tracer.open(path)
+    else:
+        tracer.close()
+    if echo is not None:
+        tracer.echo = echo
+
+
+def span(name: str, **args):
+    return tracer.span(name, **args)
+
+
+def count(name: str, value: float = 1):
+    tracer.count(name, value)
+
+
+def log(message: str, **args):
+    tracer.log(message, **args)
@@ -0,0 +1,63 @@
+import json
+import os
+import tempfile
+import unittest
+
+from trace_utils import Tracer
+
+
+class TestTracer(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_totals_without_output(self):
+        tracer = Tracer(echo=False)
+        for _ in range(3):
+            with tracer.span("work") as span:
+                span.add("items", 2)
+        tracer.count("bytes_read", 10)
+        tracer.count("bytes_read", 5)
+        summary = tracer.summary()
+        self.assertEqual(summary["spans"]["work"]["count"], 3)
+        self.assertEqual(summary["counters"]["bytes_read"], 15)
+        self.assertFalse(tracer.enabled)
+
+    def test_jsonl_export(self):
+        path = os.path.join(self.directory.name, "trace.jsonl")
+        tracer = Tracer(path, echo=False)
+        with tracer.span("outer", files=2):
+            with tracer.span("inner"):
+                pass
+        tracer.count("chunks", 4)
+        tracer.log("done")
+        tracer.close()
+
+        with open(path, "r") as trace_file:
+            events = [json.loads(line) for line in trace_file]
+        self.assertEqual(
+            [event["name"] for event in events], ["inner", "outer", "chunks", "log"]
+        )
+        self.assertEqual(events[1]["args"], {"files": 2})
+        self.assertGreaterEqual(events[1]["dur"], events[0]["dur"])
+        self.assertEqual(events[2]["args"], {"chunks": 4})
+        self.assertEqual(events[3]["args"]["message"], "done")
+
+    def test_chrome_export_is_valid_json(self):
+        path = os.path.join(self.directory.name, "trace.json")
+        tracer = Tracer(path, echo=False)
+        with tracer.span("work"):
+            pass
+        tracer.record("load_file", 0.0, 0.25, {"file": "a.py"})
+        tracer.close()
+
+        with open(path, "r") as trace_file:
+            events = [event for event in json.load(trace_file) if event]
+        self.assertEqual([event["ph"] for event in events], ["X", "X"])
+        self.assertEqual(events[1]["dur"], 250000.0)
+
+
+if __name__ == "__main__":
+    unittest.main()
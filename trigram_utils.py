@@ -0,0 +1,240 @@
+import json
+import os
+import re
+import threading
+from typing import Dict, List, Optional, Set
+
+import numpy as np
+
+from view_utils import BINARY_SNIFF_BYTES, is_binary_file
+
+TRIGRAMS_NAME = "trigrams.npz"
+# Files changed since the postings were packed are checked one by one; past
+# this many the postings are rebuilt
+MAX_PENDING_FILES = 256
+MAX_LINE_LENGTH = 200
+# Larger files are mostly generated or data and would bloat the postings
+MAX_FILE_BYTES = 1 << 20
+REGEX_METACHARACTERS = set(".^$*+?{}[]()|\\")
+
+EMPTY_CODES = np.zeros(0, dtype=np.uint32)
+
+
+def trigrams(data: bytes) -> np.ndarray:
+    """Sorted unique trigrams of the ASCII-lowercased bytes, packed into ints."""
+    values = np.frombuffer(data.lower(), dtype=np.uint8).astype(np.uint32)
+    if len(values) < 3:
+        return EMPTY_CODES
+    return np.unique((values[:-2] << 16) | (values[1:-1] << 8) | values[2:])
+
+
+def required_literals(pattern: str) -> List[str]:
+    """
+    Literal runs every match of a regex must contain.
+
+    Deliberately conservative: patterns with alternation give none, and text
+    inside groups or before an optional quantifier is skipped.
+    """
+    if "|" in pattern:
+        return []
+    literals = []
+    current = ""
+    depth = 0
+    position = 0
+    while position < len(pattern):
+        char = pattern[position]
+        position += 1
+        if char == "\\" and position < len(pattern):
+            escaped = pattern[position]
+            position += 1
+            if escaped.isalnum():
+                # Character classes, anchors and escapes such as \n
+                literals.append(current)
+                current = ""
+            elif depth == 0:
+                current += escaped
+            continue
+        if char == "[":
+            literals.append(current)
+            current = ""
+            closing = pattern.find("]", position + 1)
+            position = len(pattern) if closing == -1 else closing + 1
+        elif char in "*?{":
+            # The previous character may be absent
+            literals.append(current[:-1])
+            current = ""
+            if char == "{":
+                closing = pattern.find("}", position)
+                position = len(pattern) if closing == -1 else closing + 1
+        elif char in REGEX_METACHARACTERS:
+            if char == "(":
+                depth += 1
+            elif char == ")":
+                depth = max(depth - 1, 0)
+            literals.append(current)
+            current = ""
+        elif depth == 0:
+            current += char
+    literals.append(current)
+    return [literal for literal in literals if len(literal) >= 3]
+
+
+class TrigramIndex:
+    """
+    Trigram index over file contents for literal and regex search.
+
+    Postings are packed into two arrays sorted by trigram, so narrowing a
+    query to candidate files takes a few binary searches and intersections.
+    Files are added and removed incrementally; recently changed files are
+    checked directly until enough accumulate to repack. Candidates are then
+    verified against the files on disk.
+    """
+
+    def __init__(self):
+        self.files: Dict[str, np.ndarray] = {}
+        self._lock = threading.Lock()
+        self._paths: List[str] = []
+        self._codes = EMPTY_CODES
+        self._file_ids = np.zeros(0, dtype=np.int32)
+        self._pending: Set[str] = set()
+
+    def add_file(self, file_path: str, content: Optional[bytes] = None):
+        """Index a file, leaving out binary files and those over MAX_FILE_BYTES."""
+        if content is None:
+            try:
+                if os.path.getsize(file_path) > MAX_FILE_BYTES or is_binary_file(
+                    file_path
+                ):
+                    self.remove_file(file_path)
+                    return
+                with open(file_path, "rb") as file:
+                    content = file.read()
+            except OSError:
+                content = b""
+        if len(content) > MAX_FILE_BYTES or b"\0" in content[:BINARY_SNIFF_BYTES]:
+            self.remove_file(file_path)
+            return
+        codes = trigrams(content)
+        with self._lock:
+            self.files[file_path] = codes
+            self._pending.add(file_path)
+
+    def remove_file(self, file_path: str):
+        with self._lock:
+            if self.files.pop(file_path, None) is not None:
+                self._pending.add(file_path)
+
+    def _pack(self):
+        self._paths = list(self.files)
+        codes = [self.files[file_path] for file_path in self._paths]
+        file_ids = [
+            np.full(len(file_codes), file_id, dtype=np.int32)
+            for file_id, file_codes in enumerate(codes)
+        ]
+        all_codes = np.concatenate(codes) if codes else EMPTY_CODES
+        # A stable sort keeps the file ids of each trigram sorted and unique
+        order = np.argsort(all_codes, kind="stable")
+        self._codes = all_codes[order]
+        self._file_ids = (
+            np.concatenate(file_ids)[order] if file_ids else self._file_ids[:0]
+        )
+        self._pending = set()
+
+    def candidates(self, literals: List[str], ignore_case: bool = False) -> List[str]:
+        """Files that contain every trigram of the given literals."""
+        if ignore_case:
+            # Only ASCII is lowercased in the index
+            literals = [literal for literal in literals if literal.isascii()]
+        required = [trigrams(literal.encode("utf-8")) for literal in literals]
+        required = np.unique(np.concatenate(required)) if required else EMPTY_CODES
+
+        with self._lock:
+            if len(self._pending) > MAX_PENDING_FILES:
+                self._pack()
+            if not len(required):
+                return sorted(self.files)
+            file_ids = None
+            for code in required:
+                start = np.searchsorted(self._codes, code, side="left")
+                end = np.searchsorted(self._codes, code, side="right")
+                ids = self._file_ids[start:end]
+                file_ids = (
+                    ids
+                    if file_ids is None
+                    else np.intersect1d(file_ids, ids, assume_unique=True)
+                )
+                if not len(file_ids):
+                    break
+            paths = {self._paths[file_id] for file_id in file_ids} - self._pending
+            for file_path in self._pending:
+                codes = self.files.get(file_path)
+                if codes is not None and np.isin(required, codes).all():
+                    paths.add(file_path)
+        return sorted(paths)
+
+    def search(
+        self,
+        pattern: str,
+        regex: bool = False,
+        ignore_case: bool = False,
+        max_results: int = 50,
+    ) -> List[str]:
+        """Return matching lines as "path:line: text", at most max_results."""
+        flags = re.IGNORECASE if ignore_case else 0
+        compiled = re.compile(pattern if regex else re.escape(pattern), flags)
+        literals = required_literals(pattern) if regex else [pattern]
+        ignore_case = ignore_case or (regex and pattern.startswith("(?i"))
+
+        results = []
+        for file_path in self.candidates(literals, ignore_case):
+            try:
+                with open(file_path, "r", errors="replace") as file:
+                    text = file.read()
+            except OSError:
+                continue
+            line_number = 1
+            line_position = 0
+            last_line = 0
+            for match in compiled.finditer(text):
+                if match.start() == match.end():
+                    continue
+                line_number += text.count("\n", line_position, match.start())
+                line_position = match.start()
+                if line_number == last_line:
+                    continue
+                last_line = line_number
+                start = text.rfind("\n", 0, match.start()) + 1
+                end = text.find("\n", match.start())
+                line = text[start : end if end != -1 else len(text)].strip()
+                results.append(f"{file_path}:{line_number}: {line[:MAX_LINE_LENGTH]}")
+                if len(results) >= max_results:
+                    return results
+        return results
+
+    def save(self, index_dir: str):
+        os.makedirs(index_dir, exist_ok=True)
+        with self._lock:
+            paths = list(self.files)
+            codes = [self.files[file_path] for file_path in paths]
+        trigrams_path = os.path.join(index_dir, TRIGRAMS_NAME)
+        with open(trigrams_path + ".tmp", "wb") as trigrams_file:
+            np.savez(
+                trigrams_file,
+                paths=np.array(json.dumps(paths)),
+                counts=np.array([len(file_codes) for file_codes in codes]),
+                codes=np.concatenate(codes) if codes else EMPTY_CODES,
+            )
+        os.replace(trigrams_path + ".tmp", trigrams_path)
+
+    @classmethod
+    def load(cls, index_dir: str) -> "TrigramIndex":
+        trigram_index = cls()
+        trigrams_path = os.path.join(index_dir, TRIGRAMS_NAME)
+        if os.path.exists(trigrams_path):
+            with np.load(trigrams_path) as data:
+                paths = json.loads(str(data["paths"]))
+                offsets = np.cumsum(data["counts"])[:-1]
+                codes = np.split(data["codes"], offsets) if paths else []
+            trigram_index.files = dict(zip(paths, codes))
+        trigram_index._pack()
+        return trigram_index
@@ -0,0 +1,92 @@
+import os
+import tempfile
+import unittest
+
+import globals
+from agent_tools import SearchCodeTool
+from trigram_utils import MAX_FILE_BYTES, TrigramIndex, required_literals
+
+
+class TestTrigramIndex(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.index = TrigramIndex()
+        self.write("agent.py", "class CustomAgent:\n    def run(self):\n        pass\n")
+        self.write("tools.py", "class SearchTool:\n    name = 'search'\n")
+        self.write("notes.txt", "Nothing to see here.\n")
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def path(self, name):
+        return os.path.join(self.directory.name, name)
+
+    def write(self, name, content):
+        with open(self.path(name), "w") as file:
+            file.write(content)
+        self.index.add_file(self.path(name))
+
+    def test_required_literals(self):
+        self.assertEqual(required_literals(r"class\s+Custom\w*"), ["class", "Custom"])
+        self.assertEqual(required_literals("colou?r_name"), ["colo", "r_name"])
+        self.assertEqual(required_literals("foo|bar"), [])
+
+    def test_literal_and_regex_search(self):
+        self.assertEqual(
+            self.index.search("def run"), [f"{self.path('agent.py')}:2: def run(self):"]
+        )
+        self.assertEqual(
+            self.index.candidates(["class"]),
+            [self.path("agent.py"), self.path("tools.py")],
+        )
+        results = self.index.search(r"class \w+(Agent|Tool):", regex=True)
+        self.assertEqual(len(results), 2)
+        self.assertEqual(self.index.search("customagent"), [])
+        self.assertEqual(len(self.index.search("customagent", ignore_case=True)), 1)
+
+    def test_incremental_updates_and_persistence(self):
+        self.index._pack()
+        self.write("agent.py", "def renamed():\n    pass\n")
+        os.remove(self.path("tools.py"))
+        self.index.remove_file(self.path("tools.py"))
+        self.assertEqual(self.index.search("class"), [])
+        self.assertEqual(len(self.index.search("renamed")), 1)
+
+        self.index.save(self.directory.name)
+        loaded = TrigramIndex.load(self.directory.name)
+        self.assertEqual(
+            sorted(loaded.files), [self.path("agent.py"), self.path("notes.txt")]
+        )
+        self.assertEqual(loaded.search("renamed"), self.index.search("renamed"))
+
+    def test_skips_binary_and_large_files(self):
+        with open(self.path("image.png"), "wb") as file:
+            file.write(b"\x89PNG\0\0class CustomAgent")
+        self.index.add_file(self.path("image.png"))
+        self.write("bundle.js", "x" * MAX_FILE_BYTES + "class CustomAgent")
+        self.index.add_file(self.path("data.bin"), b"class\0CustomAgent")
+        for name in ("image.png", "bundle.js", "data.bin"):
+            self.assertNotIn(self.path(name), self.index.files)
+        self.assertEqual(
+            self.index.candidates(["CustomAgent"]), [self.path("agent.py")]
+        )
+
+        # A file that grows past the cap is dropped from the index
+        self.write("agent.py", "class CustomAgent:\n" + "#" * MAX_FILE_BYTES)
+        self.assertNotIn(self.path("agent.py"), self.index.files)
+
+    def test_search_code_tool(self):
+        globals.initialize()
+        tool = SearchCodeTool()
+        self.assertIn("has not been built", tool._run("x"))
+        globals.trigram_index = self.index
+        self.assertEqual(
+            tool._run("SearchTool"), f"{self.path('tools.py')}:1: class SearchTool:"
+        )
+        self.assertIn("Invalid regular expression", tool._run("regex:(unclosed"))
+        tool.max_results = 1
+        self.assertIn("Only the first 1 matches", tool._run("regex:(?i)class"))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,215 @@
+import mmap
+import os
+import re
+import threading
+from collections import OrderedDict
+from typing import List, NamedTuple, Optional, Tuple
+
+import numpy as np
+
+import globals
+from symbol_utils import file_symbols
+
+# Files up to this size are shown whole, ranges are capped to it
+MAX_VIEW_BYTES = 16_000
+# Larger files get an outline plus this many lines from the top
+PREVIEW_LINES = 120
+MAX_OUTLINE_ENTRIES = 150
+# Files above this size are not parsed just to outline them
+MAX_OUTLINE_PARSE_BYTES = 2_000_000
+BINARY_SNIFF_BYTES = 8192
+LINE_INDEX_CACHE_SIZE = 64
+
+# "path:120-180" selects lines, "path:bytes=0-4095" selects bytes (inclusive)
+RANGE_PATTERN = re.compile(
+    r"^(?P<path>.+):(?P<bytes>bytes=)?(?P<start>\d+)-(?P<end>\d*)$"
+)
+
+
+class ViewRequest(NamedTuple):
+    file_path: str
+    start: Optional[int] = None
+    end: Optional[int] = None
+    byte_range: bool = False
+
+
+def parse_view_request(text: str) -> ViewRequest:
+    text = text.strip()
+    match = RANGE_PATTERN.match(text)
+    if match is None or os.path.exists(text):
+        return ViewRequest(text)
+    end = int(match["end"]) if match["end"] else None
+    return ViewRequest(
+        match["path"], int(match["start"]), end, byte_range=bool(match["bytes"])
+    )
+
+
+def _newline_offsets(mapped: mmap.mmap) -> np.ndarray:
+    # The view must be released before the mmap can be closed
+    data = np.frombuffer(mapped, dtype=np.uint8)
+    return np.flatnonzero(data == ord("\n"))
+
+
+class LineIndex:
+    """Byte offset of every line start, so any line range is one slice away."""
+
+    def __init__(self, file_path: str, stat: os.stat_result):
+        self.key = (stat.st_mtime_ns, stat.st_size)
+        self.size = stat.st_size
+        if self.size == 0:
+            self.starts = np.zeros(0, dtype=np.int64)
+            return
+        with open(file_path, "rb") as file, mmap.mmap(
+            file.fileno(), 0, access=mmap.ACCESS_READ
+        ) as mapped:
+            newlines = _newline_offsets(mapped)
+        starts = np.concatenate(([0], newlines + 1)).astype(np.int64)
+        # A trailing newline does not start another line
+        self.starts = starts[:-1] if starts[-1] == self.size else starts
+
+    @property
+    def line_count(self) -> int:
+        return len(self.starts)
+
+    def line_offset(self, line: int) -> int:
+        """Byte offset of a 1-based line, or the file size past the last line."""
+        return int(self.starts[line - 1]) if line <= self.line_count else self.size
+
+    def line_at(self, offset: int) -> int:
+        """1-based line containing the byte offset."""
+        return int(np.searchsorted(self.starts, offset, side="right"))
+
+
+_line_indexes: "OrderedDict[str, LineIndex]" = OrderedDict()
+_line_indexes_lock = threading.Lock()
+
+
+def line_index(file_path: str) -> LineIndex:
+    """Return the line index of a file, reusing it until the file changes."""
+    stat = os.stat(file_path)
+    key = (stat.st_mtime_ns, stat.st_size)
+    with _line_indexes_lock:
+        cached = _line_indexes.get(file_path)
+        if cached is not None and cached.key == key:
+            _line_indexes.move_to_end(file_path)
+            return cached
+    index = LineIndex(file_path, stat)
+    with _line_indexes_lock:
+        _line_indexes[file_path] = index
+        _line_indexes.move_to_end(file_path)
+        while len(_line_indexes) > LINE_INDEX_CACHE_SIZE:
+            _line_indexes.popitem(last=False)
+    return index
+
+
+def read_bytes(file_path: str, start: int, end: int) -> bytes:
+    if end <= start:
+        return b""
+    with open(file_path, "rb") as file, mmap.mmap(
+        file.fileno(), 0, access=mmap.ACCESS_READ
+    ) as mapped:
+        return mapped[start:end]
+
+
+def is_binary_file(file_path: str) -> bool:
+    with open(file_path, "rb") as file:
+        return b"\0" in file.read(BINARY_SNIFF_BYTES)
+
+
+def outline(file_path: str, size: int) -> List[str]:
+    """Definitions as "line: kind name", taken from the symbol index if possible."""
+    symbol_index = getattr(globals, "symbol_index", None)
+    entry = symbol_index.files.get(file_path) if symbol_index else None
+    if entry is not None:
+        definitions = entry["definitions"]
+    elif size <= MAX_OUTLINE_PARSE_BYTES:
+        with open(file_path, "r", errors="replace") as file:
+            definitions, _ = file_symbols(file_path, file.read())
+    else:
+        return []
+    return [
+        f"{line}: {kind} {qualified}"
+        for _, qualified, kind, line in definitions[:MAX_OUTLINE_ENTRIES]
+    ]
+
+
+def view_lines(
+    file_path: str,
+    index: LineIndex,
+    start: int,
+    end: Optional[int],
+    max_bytes: int = MAX_VIEW_BYTES,
+) -> Tuple[str, int, int]:
+    """Decode lines start..end, stopping at the last whole line within max_bytes."""
+    start = max(1, start)
+    end = min(end or index.line_count, index.line_count)
+    start_offset = index.line_offset(start)
+    end_offset = index.line_offset(end + 1)
+    errors = "strict"
+    if end_offset - start_offset > max_bytes:
+        end_offset = start_offset + max_bytes
+        last_whole = index.line_at(end_offset) - 1
+        if last_whole >= start:
+            end = last_whole
+            end_offset = index.line_offset(end + 1)
+        else:
+            # A single huge line is cut, possibly inside a character
+            end = start
+            errors = "replace"
+    content = read_bytes(file_path, start_offset, end_offset).decode("utf-8", errors)
+    return content.rstrip("\n"), start, end
+
+
+def view_file(
+    file_path: str,
+    start: Optional[int] = None,
+    end: Optional[int] = None,
+    byte_range: bool = False,
+    max_bytes: int = MAX_VIEW_BYTES,
+) -> str:
+    """
+    Return a file, or a slice of it, sized for an LLM prompt.
+
+    Lines and bytes are sliced straight out of a memory map using a cached
+    line offset index. Without a range, files over max_bytes are replaced by
+    an outline of their definitions and the first lines, with a hint on how
+    to request other ranges.
+    """
+    index = line_index(file_path)
+    if byte_range:
+        start_offset = min(start, index.size)
+        end_offset = index.size if end is None else min(end + 1, index.size)
+        end_offset = min(end_offset, start_offset + max_bytes)
+        content = read_bytes(file_path, start_offset, end_offset)
+        return (
+            f"Bytes {start_offset}-{max(start_offset, end_offset - 1)} of "
+            f"{index.size} in '{file_path}':\n"
+            + content.decode("utf-8", errors="replace")
+        )
+
+    if start is not None:
+        if start > index.line_count:
+            return f"Error: '{file_path}' has only {index.line_count} lines."
+        content, start, shown_end = view_lines(file_path, index, start, end, max_bytes)
+        header = f"Lines {start}-{shown_end} of {index.line_count} in '{file_path}'"
+        if shown_end < min(end or index.line_count, index.line_count):
+            header += f" (truncated to {max_bytes} bytes)"
+        return f"{header}:\n{content}"
+
+    if index.size <= max_bytes:
+        content = read_bytes(file_path, 0, index.size).decode("utf-8")
+        return f"Content of '{file_path}':\n{content}"
+
+    content, _, shown_end = view_lines(
+        file_path, index, 1, PREVIEW_LINES, max_bytes // 2
+    )
+    sections = [
+        f"'{file_path}' is large ({index.size} bytes, {index.line_count} lines); "
+        f"showing an outline and lines 1-{shown_end}. View other parts with "
+        f"'{file_path}:START-END' for lines or '{file_path}:bytes=START-END'."
+    ]
+    entries = outline(file_path, index.size)
+    if entries:
+        sections.append("Outline:\n" + "\n".join(entries))
+    sections.append(f"Lines 1-{shown_end}:\n{content}")
+    return "\n\n".join(sections)
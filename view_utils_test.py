@@ -0,0 +1,69 @@
+import os
+import tempfile
+import unittest
+
+import globals
+from view_utils import line_index, parse_view_request, view_file
+
+
+class TestViewFile(unittest.TestCase):
+    def setUp(self):
+        globals.initialize()
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, "module.py")
+        lines = []
+        for number in range(1, 401):
+            lines += [f"def function_{number}():", f"    return {number}", ""]
+        self.write("\n".join(lines) + "\n")
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def write(self, content):
+        with open(self.path, "w") as file:
+            file.write(content)
+
+    def test_parse_view_request(self):
+        self.assertEqual(parse_view_request(self.path).file_path, self.path)
+        request = parse_view_request(f"{self.path}:10-20")
+        self.assertEqual(
+            (request.file_path, request.start, request.end), (self.path, 10, 20)
+        )
+        request = parse_view_request(f"{self.path}:bytes=0-")
+        self.assertEqual(
+            (request.start, request.end, request.byte_range), (0, None, True)
+        )
+
+    def test_line_range(self):
+        output = view_file(self.path, 4, 5)
+        self.assertEqual(
+            output,
+            f"Lines 4-5 of 1200 in '{self.path}':\ndef function_2():\n    return 2",
+        )
+        self.assertIn("has only 1200 lines", view_file(self.path, 1201, None))
+
+    def test_byte_range(self):
+        output = view_file(self.path, 0, 15, byte_range=True)
+        self.assertTrue(output.endswith(":\ndef function_1()"))
+
+    def test_large_file_is_outlined_and_capped(self):
+        output = view_file(self.path, max_bytes=2000)
+        self.assertIn("is large", output)
+        self.assertIn("3: function function_2", output)
+        self.assertLess(len(output.split("Lines 1-")[1]), 1100)
+
+        output = view_file(self.path, 1, None, max_bytes=200)
+        self.assertIn("(truncated to 200 bytes)", output)
+        self.assertLessEqual(len(output.split(":\n", 1)[1]), 200)
+
+    def test_line_index_is_cached_until_the_file_changes(self):
+        index = line_index(self.path)
+        self.assertIs(line_index(self.path), index)
+        self.write("one\ntwo")
+        index = line_index(self.path)
+        self.assertEqual(index.line_count, 2)
+        self.assertEqual(view_file(self.path), f"Content of '{self.path}':\none\ntwo")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,334 @@
+import ctypes
+import ctypes.util
+import os
+import select
+import struct
+import sys
+import threading
+import time
+from typing import Dict, Optional, Set
+
+from langchain.embeddings.base import Embeddings
+from langchain.vectorstores import FAISS
+
+from ann_utils import IndexConfig, mark_updated, vectorstore_lock
+from embedding_utils import get_embeddings
+from file_utils import DEFAULT_BATCH_SIZE, is_ignored, read_gitignore_and_exclude
+from index_utils import (
+    evict_chunks,
+    index_files,
+    load_manifest,
+    load_symbol_index,
+    load_trigram_index,
+    plan_changes,
+    save_index,
+    scan_repository,
+)
+from symbol_utils import SymbolIndex
+from trigram_utils import TrigramIndex
+from trace_utils import count, log, span
+
+# Flags and event masks from <sys/inotify.h>
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+IN_CLOSE_WRITE = 0x8
+IN_MOVED_FROM = 0x40
+IN_MOVED_TO = 0x80
+IN_CREATE = 0x100
+IN_DELETE = 0x200
+IN_DELETE_SELF = 0x400
+IN_Q_OVERFLOW = 0x4000
+IN_IGNORED = 0x8000
+IN_ISDIR = 0x40000000
+WATCH_MASK = (
+    IN_CLOSE_WRITE
+    | IN_MOVED_FROM
+    | IN_MOVED_TO
+    | IN_CREATE
+    | IN_DELETE
+    | IN_DELETE_SELF
+)
+EVENT_HEADER = struct.Struct("iIII")
+
+
+class InotifySource:
+    """
+    Report changed paths under a folder using Linux inotify through libc.
+
+    Every directory that is not ignored gets a watch, including directories
+    created later. read returns None when the kernel queue overflowed and
+    the whole folder has to be rescanned.
+    """
+
+    def __init__(self, folder_path: str, ignore_patterns):
+        if not sys.platform.startswith("linux"):
+            raise OSError("inotify is only available on Linux")
+        self.folder_path = folder_path
+        self.ignore_patterns = ignore_patterns
+        self.libc = ctypes.CDLL(
+            ctypes.util.find_library("c") or "libc.so.6", use_errno=True
+        )
+        self.fd = self.libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        self.watches: Dict[int, str] = {}
+        self.add_tree(folder_path)
+
+    def add_tree(self, path: str) -> Set[str]:
+        """Watch path and its subdirectories, returning the files found."""
+        files = set()
+        for root, directories, file_names in os.walk(path):
+            directories[:] = [
+                directory
+                for directory in directories
+                if not is_ignored(
+                    os.path.join(root, directory),
+                    self.folder_path,
+                    self.ignore_patterns,
+                    is_dir=True,
+                )
+            ]
+            wd = self.libc.inotify_add_watch(
+                self.fd, os.fsencode(root), ctypes.c_uint32(WATCH_MASK)
+            )
+            if wd < 0:
+                raise OSError(ctypes.get_errno(), f"Cannot watch {root}")
+            self.watches[wd] = root
+            files.update(os.path.join(root, file_name) for file_name in file_names)
+        return files
+
+    def read(self, timeout: float) -> Optional[Set[str]]:
+        ready, _, _ = select.select([self.fd], [], [], timeout)
+        if not ready:
+            return set()
+        try:
+            data = os.read(self.fd, 1 << 16)
+        except BlockingIOError:
+            return set()
+
+        changed = set()
+        offset = 0
+        while offset + EVENT_HEADER.size <= len(data):
+            wd, mask, _, name_length = EVENT_HEADER.unpack_from(data, offset)
+            offset += EVENT_HEADER.size
+            name = data[offset : offset + name_length].rstrip(b"\0")
+            offset += name_length
+            if mask & IN_Q_OVERFLOW:
+                return None
+            directory = self.watches.get(wd)
+            if mask & IN_IGNORED:
+                self.watches.pop(wd, None)
+                continue
+            if directory is None:
+                continue
+            path = os.path.join(directory, os.fsdecode(name)) if name else directory
+            if mask & IN_ISDIR and mask & (IN_CREATE | IN_MOVED_TO):
+                if not is_ignored(
+                    path, self.folder_path, self.ignore_patterns, is_dir=True
+                ):
+                    changed.update(self.add_tree(path))
+            changed.add(path)
+        return changed
+
+    def close(self):
+        if self.fd >= 0:
+            os.close(self.fd)
+            self.fd = -1
+
+
+class PollingSource:
+    """Report changed paths by comparing periodic scans of the folder."""
+
+    def __init__(self, folder_path: str, ignore_patterns, interval: float = 2.0):
+        self.folder_path = folder_path
+        self.ignore_patterns = ignore_patterns
+        self.interval = interval
+        self.snapshot = self.scan()
+        self.next_scan = time.monotonic() + interval
+
+    def scan(self) -> Dict[str, tuple]:
+        return {
+            file_path: (stat.st_mtime, stat.st_size)
+            for file_path, stat in scan_repository(
+                self.folder_path, self.ignore_patterns
+            ).items()
+        }
+
+    def read(self, timeout: float) -> Optional[Set[str]]:
+        wait = self.next_scan - time.monotonic()
+        if wait > timeout:
+            time.sleep(timeout)
+            return set()
+        time.sleep(max(0.0, wait))
+        self.next_scan = time.monotonic() + self.interval
+        snapshot = self.scan()
+        changed = {
+            file_path
+            for file_path in set(snapshot) | set(self.snapshot)
+            if snapshot.get(file_path) != self.snapshot.get(file_path)
+        }
+        self.snapshot = snapshot
+        return changed
+
+    def close(self):
+        pass
+
+
+class RepositoryWatcher:
+    """
+    Keep a repository's vectorstore, symbol and trigram indexes live.
+
+    Change events are debounced, then only the affected files are re-chunked
+    and re-embedded and their old chunks evicted, in place, while searches
+    keep running against the same vectorstore. The index is saved to
+    index_dir at most every save_interval seconds and when stopped.
+    """
+
+    def __init__(
+        self,
+        folder_path: str,
+        vectorstore: FAISS,
+        index_dir: str,
+        ignore_file: Optional[str] = None,
+        symbol_index: Optional[SymbolIndex] = None,
+        trigram_index: Optional[TrigramIndex] = None,
+        embeddings: Optional[Embeddings] = None,
+        index_config: Optional[IndexConfig] = None,
+        debounce_seconds: float = 0.5,
+        poll_interval: float = 2.0,
+        save_interval: float = 60.0,
+        use_inotify: bool = True,
+        batch_size: int = DEFAULT_BATCH_SIZE,
+    ):
+        self.folder_path = folder_path
+        self.vectorstore = vectorstore
+        self.index_dir = index_dir
+        self.ignore_patterns = read_gitignore_and_exclude(folder_path, ignore_file)
+        self.symbol_index = symbol_index or load_symbol_index(index_dir)
+        self.trigram_index = trigram_index or load_trigram_index(index_dir)
+        self.embeddings = embeddings or get_embeddings()
+        self.index_config = index_config or IndexConfig()
+        self.debounce_seconds = debounce_seconds
+        self.save_interval = save_interval
+        self.batch_size = batch_size
+        self.manifest = load_manifest(index_dir)
+        self.lock = vectorstore_lock(vectorstore)
+        self.updates = 0
+        self.dirty = False
+
+        self.source = None
+        if use_inotify:
+            try:
+                self.source = InotifySource(folder_path, self.ignore_patterns)
+            except OSError as e:
+                log(f"inotify unavailable ({e}), polling for changes instead.")
+        if self.source is None:
+            self.source = PollingSource(
+                folder_path, self.ignore_patterns, poll_interval
+            )
+        self._stop = threading.Event()
+        self._thread = threading.Thread(
+            target=self._run, name="repository-watcher", daemon=True
+        )
+
+    def start(self) -> "RepositoryWatcher":
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread.is_alive():
+            self._thread.join()
+        self.source.close()
+        if self.dirty:
+            self.save()
+
+    def _run(self):
+        pending: Set[str] = set()
+        rescan = False
+        last_event = 0.0
+        last_save = time.monotonic()
+        while not self._stop.is_set():
+            changes = self.source.read(min(0.2, self.debounce_seconds))
+            now = time.monotonic()
+            if changes is None:
+                rescan = True
+                last_event = now
+            elif changes:
+                pending.update(changes)
+                last_event = now
+            if (pending or rescan) and now - last_event >= self.debounce_seconds:
+                try:
+                    self.apply(None if rescan else pending)
+                except Exception as e:
+                    log(f"Error while updating the index: {e}")
+                pending = set()
+                rescan = False
+            if self.dirty and now - last_save >= self.save_interval:
+                self.save()
+                last_save = now
+
+    def apply(self, paths: Optional[Set[str]] = None) -> int:
+        """Re-index the given changed paths, or the whole folder if None."""
+        indexed = self.manifest["files"]
+        if paths is None:
+            current = scan_repository(self.folder_path, self.ignore_patterns)
+            candidates = None
+        else:
+            current = {}
+            candidates = set(paths)
+            for path in paths:
+                if os.path.isfile(path):
+                    if not is_ignored(path, self.folder_path, self.ignore_patterns):
+                        current[path] = os.stat(path)
+                elif not os.path.exists(path):
+                    # A removed or moved directory only reports itself
+                    prefix = path.rstrip(os.sep) + os.sep
+                    candidates.update(p for p in indexed if p.startswith(prefix))
+
+        stale_ids, to_index, removed_paths = plan_changes(indexed, current, candidates)
+        if not stale_ids and not to_index and not removed_paths:
+            return 0
+
+        with span("watch.update", files=len(to_index), evicted=len(stale_ids)):
+            with self.lock:
+                evict_chunks(self.vectorstore, stale_ids, self.index_config)
+                for file_path in removed_paths:
+                    self.symbol_index.remove_file(file_path)
+                    self.trigram_index.remove_file(file_path)
+                mark_updated(self.vectorstore)
+            index_files(
+                self.vectorstore,
+                self.embeddings,
+                self.symbol_index,
+                indexed,
+                to_index,
+                self.folder_path,
+                self.ignore_patterns,
+                self.batch_size,
+                lock=self.lock,
+                trigram_index=self.trigram_index,
+                # Runs on the watcher thread, where forking is unsafe
+                use_processes=False,
+            )
+            with self.lock:
+                mark_updated(self.vectorstore)
+        self.updates += 1
+        self.dirty = True
+        count("watch_files_reindexed", len(to_index))
+        log(
+            f"Index updated: {len(to_index)} files re-indexed, "
+            f"{len(removed_paths)} removed, {len(stale_ids)} stale chunks evicted."
+        )
+        return len(to_index) + len(removed_paths)
+
+    def save(self):
+        with self.lock, span("watch.save"):
+            save_index(
+                self.index_dir,
+                self.vectorstore,
+                self.symbol_index,
+                self.manifest,
+                self.trigram_index,
+            )
+        self.dirty = False
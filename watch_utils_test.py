@@ -0,0 +1,120 @@
+import os
+import tempfile
+import time
+import unittest
+from unittest import mock
+
+from index_utils import EMBEDDING_SIZE, load_manifest, load_or_build_vectorstore
+from index_utils_test import CountingEmbeddings
+from retrieval_utils import HybridRetriever
+from watch_utils import RepositoryWatcher
+
+
+class TestRepositoryWatcher(unittest.TestCase):
+    use_inotify = True
+
+    def setUp(self):
+        self.repo = tempfile.TemporaryDirectory()
+        self.index = tempfile.TemporaryDirectory()
+        self.write("a.py", "def alpha():\n    return 1")
+        self.write("b.py", "def beta():\n    return 2")
+        self.embeddings = CountingEmbeddings(size=EMBEDDING_SIZE)
+        self.vectorstore = load_or_build_vectorstore(
+            self.repo.name, index_dir=self.index.name, embeddings=self.embeddings
+        )
+        self.embeddings.embedded = 0
+        self.watcher = RepositoryWatcher(
+            self.repo.name,
+            self.vectorstore,
+            self.index.name,
+            embeddings=self.embeddings,
+            debounce_seconds=0.1,
+            poll_interval=0.1,
+            use_inotify=self.use_inotify,
+        ).start()
+
+    def tearDown(self):
+        self.watcher.stop()
+        self.repo.cleanup()
+        self.index.cleanup()
+
+    def write(self, name, content):
+        path = os.path.join(self.repo.name, name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "w") as file:
+            file.write(content)
+
+    def wait_for_update(self, updates=1, timeout=10.0):
+        deadline = time.monotonic() + timeout
+        while self.watcher.updates < updates and time.monotonic() < deadline:
+            time.sleep(0.05)
+        self.assertGreaterEqual(self.watcher.updates, updates)
+
+    def contents(self):
+        return sorted(
+            doc.page_content for doc in self.vectorstore.docstore._dict.values()
+        )
+
+    def test_reindexes_only_changed_files(self):
+        retriever = HybridRetriever(self.vectorstore, k=4)
+        self.assertEqual(len(retriever.get_relevant_documents("alpha")), 2)
+
+        self.write("a.py", "def gamma():\n    return 3")
+        self.wait_for_update()
+        self.assertEqual(self.embeddings.embedded, 1)
+        self.assertEqual(
+            self.contents(),
+            ["def beta():\n    return 2", "def gamma():\n    return 3"],
+        )
+        # The retriever picks up the change without being rebuilt
+        documents = retriever.get_relevant_documents("gamma")
+        self.assertEqual(documents[0].page_content, "def gamma():\n    return 3")
+        self.assertTrue(self.watcher.symbol_index.lookup("gamma"))
+
+    def test_new_directory_and_deleted_file(self):
+        self.write("package/c.py", "def gamma():\n    return 3")
+        os.remove(os.path.join(self.repo.name, "b.py"))
+        self.wait_for_update()
+        while len(self.vectorstore.docstore._dict) != 2:
+            self.wait_for_update(self.watcher.updates + 1)
+        self.assertEqual(
+            self.contents(),
+            ["def alpha():\n    return 1", "def gamma():\n    return 3"],
+        )
+        self.assertEqual(self.vectorstore.index.ntotal, 2)
+
+        self.watcher.stop()
+        self.assertEqual(
+            sorted(load_manifest(self.index.name)["files"]),
+            [
+                os.path.join(self.repo.name, "a.py"),
+                os.path.join(self.repo.name, "package", "c.py"),
+            ],
+        )
+
+    def test_removes_file_without_chunks(self):
+        self.watcher.stop()
+        path = os.path.join(self.repo.name, "notes.xyz")
+        self.write("notes.xyz", "")
+        # Watcher updates load on threads, the process pool is never used
+        with mock.patch("file_utils.ProcessPoolExecutor") as process_pool:
+            self.assertEqual(self.watcher.apply({path}), 1)
+        process_pool.return_value.__enter__.return_value.submit.assert_not_called()
+        self.assertEqual(self.watcher.manifest["files"][path]["ids"], [])
+        self.assertIn(path, self.watcher.trigram_index.files)
+
+        self.watcher.dirty = False
+        os.remove(path)
+        self.assertEqual(self.watcher.apply({path}), 1)
+        self.assertNotIn(path, self.watcher.manifest["files"])
+        self.assertNotIn(path, self.watcher.symbol_index.files)
+        self.assertNotIn(path, self.watcher.trigram_index.files)
+        self.assertTrue(self.watcher.dirty)
+
+
+class TestPollingRepositoryWatcher(TestRepositoryWatcher):
+    use_inotify = False
+
+
+if __name__ == "__main__":
+    unittest.main()